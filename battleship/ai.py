@@ -0,0 +1,129 @@
+"""Computer opponent.
+
+Fires at the most likely tile of a placement-probability heatmap: every
+legal placement of every ship still afloat that agrees with the misses,
+hits and sunk ships seen so far adds to the tiles it covers, placements
+over unsunk hits count heavily.  The placements of a grid and ship sizes
+are precomputed once as 0/1 matrices, so a heatmap is a handful of matrix
+products; `warm` builds them before a game.  Placements are the grid's
+straight lines, so bent ships aren't supported.  Needs NumPy.
+"""
+import collections
+import functools
+import numpy
+from battleship import board, geometry, sim
+
+# extra weight per unsunk hit a placement covers
+HIT_WEIGHT = 20
+
+
+def warm(rules, ship_spec):
+    """Builds the matrices of the heatmaps under `rules` ahead of the
+    first shot, ValueError if the rules aren't supported."""
+    if rules.bent:
+        raise ValueError('the computer player needs straight ships')
+    placement_matrices(rules.grid, ship_spec)
+    blocking_matrix(rules)
+
+
+def placement_matrices(grid, ship_spec):
+    """One (placements x tiles) matrix per ship size of the spec."""
+    return _placement_matrices(
+        grid, tuple(sorted({size for size, _ in ship_spec})))
+
+
+@functools.lru_cache(maxsize=None)
+def _placement_matrices(grid, sizes):
+    matrices = {}
+    for size in sizes:
+        ships = grid.lines(size)
+        matrix = numpy.zeros((len(ships), grid.size), dtype=numpy.float32)
+        for row, ship in enumerate(ships):
+            matrix[row, list(ship)] = 1
+        matrices[size] = matrix
+    return matrices
+
+
+@functools.lru_cache(maxsize=None)
+def blocking_matrix(rules):
+    """(tiles x tiles) matrix of the tiles no other ship can take next to
+    a deck: its neighbours, and its corners if ships may not touch."""
+    grid = rules.grid
+    matrix = numpy.zeros((grid.size, grid.size), dtype=numpy.float32)
+    for i in range(grid.size):
+        matrix[i, list(grid.neighbours[i])] = 1
+        if not rules.touching:
+            matrix[i, list(grid.corners[i])] = 1
+    return matrix
+
+
+def heatmap(rules, ship_spec, misses, hits, sunk, remaining):
+    """Placement counts by tile.  `misses`, `hits` (unsunk) and `sunk` are
+    boolean tile vectors, `remaining` the number of ships afloat by size.
+    Tiles that can't hold a deck or were fired at are -1."""
+    # neither sunk ships nor the tiles they block can be
+    blocked = misses | sunk | (blocking_matrix(rules) @ sunk > 0)
+    blocked_f, hits_f = blocked.astype(numpy.float32), hits.astype(
+        numpy.float32)
+    heat = numpy.zeros(rules.grid.size, dtype=numpy.float32)
+    for size, matrix in placement_matrices(rules.grid, ship_spec).items():
+        qty = remaining.get(size, 0)
+        if qty <= 0:
+            continue
+        legal = (matrix @ blocked_f) == 0
+        weights = legal * (1 + HIT_WEIGHT * (matrix @ hits_f)) * qty
+        heat += weights @ matrix
+    heat[blocked | hits] = -1
+    return heat
+
+
+def best_tile(heat, rng):
+    """The hottest tile, ties broken at random."""
+    return int(rng.choice(numpy.flatnonzero(heat == heat.max())))
+
+
+def knowledge(target_board, ship_spec):
+    """What the opponent of `target_board` knows about it: the misses, the
+    unsunk hits and the sunk tiles, and the ships afloat by size."""
+    states = numpy.frombuffer(target_board.states, dtype=numpy.uint8)
+    misses = states == board.MISS
+    hits = states == board.HIT
+    sunk = numpy.zeros_like(hits)
+    remaining = collections.Counter(sim.fleet_sizes(ship_spec))
+    for i in numpy.flatnonzero(hits):
+        if not sunk[i] and target_board.is_sunk(i):
+            ship = list(target_board.ship(i))
+            sunk[ship] = True
+            remaining[len(ship)] -= 1
+    return misses, hits & ~sunk, sunk, remaining
+
+
+def target(target_board, ship_spec, rng):
+    """The tile to fire at next on `target_board`."""
+    return best_tile(heatmap(target_board.rules, ship_spec,
+                             *knowledge(target_board, ship_spec)), rng)
+
+
+class Shooter(sim.Shooter):
+    """Heatmap shooter for the headless simulation."""
+    def __init__(self, n, ship_spec, rng):
+        super().__init__(n, ship_spec, rng)
+        self.rules = geometry.ship_rules(geometry.grid(n))
+        self._misses = numpy.zeros(n**2, dtype=bool)
+        self._hits = numpy.zeros(n**2, dtype=bool)
+        self._sunk = numpy.zeros(n**2, dtype=bool)
+
+    def observe(self, i, outcome, ship=None):
+        super().observe(i, outcome, ship)
+        if outcome == 'miss':
+            self._misses[i] = True
+        else:
+            self._hits[i] = True
+        if outcome == 'sunk':
+            self._hits[list(ship)] = False
+            self._sunk[list(ship)] = True
+
+    def shoot(self):
+        return best_tile(heatmap(self.rules, self.ship_spec, self._misses,
+                                 self._hits, self._sunk, self.remaining),
+                         self.rng)
@@ -0,0 +1,293 @@
+"""Benchmarks of the hot paths.
+
+Times a fixed set of operations over several board sizes and reports the
+operations per second and, traced with tracemalloc over one operation,
+the memory blocks and bytes it allocates and its peak memory.  Results
+are json, so runs before and after a change can be compared:
+
+    battleship-bench --output before.json
+    battleship-bench --output after.json --compare before.json
+"""
+import argparse
+import contextlib
+import gc
+import json
+import logging
+import platform
+import random
+import socket
+import time
+import tracemalloc
+from battleship import board, conf, fleet, game, midi, osc
+
+# ship specs by board size
+SPECS = {5: conf.SHIP_SPEC,
+         8: [(4, 1), (3, 2), (2, 3), (1, 4)],
+         10: [(5, 1), (4, 1), (3, 2), (2, 1)]}
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """Registers a benchmark, a function of the board size and ship spec
+    that sets up and returns the operation to time."""
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+def switches(n, ships):
+    decks = set(i for tiles in ships for i in tiles)
+    return [int(i in decks) for i in range(n**2)]
+
+
+class Sink:
+    """Loopback UDP socket standing in for the players' ui."""
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.setblocking(False)
+        self.address = self.sock.getsockname()
+
+    def drain(self):
+        received = 0
+        with contextlib.suppress(BlockingIOError):
+            while True:
+                self.sock.recv(65536)
+                received += 1
+        return received
+
+    def close(self):
+        self.sock.close()
+
+
+# sinks of the benchmark being run, drained between timing rounds
+_sinks = []
+
+
+def _sink():
+    sink = Sink()
+    _sinks.append(sink)
+    return sink
+
+
+@benchmark('board_init')
+def bench_board_init(n, ship_spec):
+    return lambda: board.Board(n=n, ship_spec=ship_spec)
+
+
+@benchmark('board_add_remove')
+def bench_board_add_remove(n, ship_spec):
+    """Adds a whole fleet tile by tile, then removes it again."""
+    tiles = [i for ship in fleet.random_fleet(n, ship_spec, random.Random(0))
+             for i in ship]
+    plyr_board = board.Board(n=n, ship_spec=ship_spec)
+
+    def add_remove():
+        for i in tiles:
+            plyr_board.add(i)
+        for i in reversed(tiles):
+            plyr_board.remove(i)
+    return add_remove
+
+
+@benchmark('place_tiles')
+def bench_place_tiles(n, ship_spec):
+    """Alternates between the full switch vectors of two fleets."""
+    rng = random.Random(0)
+    vectors = [switches(n, fleet.random_fleet(n, ship_spec, rng))
+               for _ in range(2)]
+    plyr_board = board.Board(n=n, ship_spec=ship_spec)
+
+    def place_tiles():
+        for vector in vectors:
+            plyr_board.place_tiles(vector)
+    return place_tiles
+
+
+@benchmark('tracker_add_remove')
+def bench_tracker_add_remove(n, ship_spec):
+    tracker = board.ShipTracker(ship_spec)
+
+    def add_remove():
+        tracker.add(1, [])
+        tracker.add(2, [1])
+        tracker.remove(2, [1])
+        tracker.remove(1, [])
+    return add_remove
+
+
+@benchmark('osc_encode_board')
+def bench_osc_encode_board(n, ship_spec):
+    plyr_board = board.Board(n=n, ship_spec=ship_spec)
+    plyr_board.place_random_fleet(random.Random(0))
+    client = osc.Client('127.0.0.1', 9)
+    return lambda: client.template('us', n**2).pack(
+        *plyr_board.ui_vector('us'))
+
+
+@benchmark('osc_send_board')
+def bench_osc_send_board(n, ship_spec):
+    plyr_board = board.Board(n=n, ship_spec=ship_spec)
+    plyr_board.place_random_fleet(random.Random(0))
+    client = osc.Client(*_sink().address)
+    return lambda: client.send_board(plyr_board, 'us')
+
+
+def _manager(n, ship_spec):
+    players_conf = [{'client_address': _sink().address,
+                     'server_address': ('127.0.0.1', port)}
+                    for port in (1, 2)]
+    manager = game.GameManager(players_conf, engine='asyncio',
+                               board_size=n, ship_spec=ship_spec)
+    manager.game = manager.new_game()
+    return manager
+
+
+@benchmark('handle_message_setup')
+def bench_handle_message_setup(n, ship_spec):
+    """A player redrawing their board during setup."""
+    rng = random.Random(0)
+    vectors = [switches(n, fleet.random_fleet(n, ship_spec, rng))
+               for _ in range(2)]
+    manager = _manager(n, ship_spec)
+
+    def handle_messages():
+        for vector in vectors:
+            manager._handle_message((('127.0.0.1', 1), 'us', vector))
+    return handle_messages
+
+
+@benchmark('handle_message_game')
+def bench_handle_message_game(n, ship_spec):
+    """A whole game: both players place a fleet, confirm and fire in tile
+    order until one fleet is sunk."""
+    rng = random.Random(0)
+    fleets = [fleet.random_fleet(n, ship_spec, rng) for _ in range(2)]
+    manager = _manager(n, ship_spec)
+
+    def play():
+        manager.game = manager.new_game()
+        for port, ships in zip((1, 2), fleets):
+            manager._handle_message((('127.0.0.1', port), 'us',
+                                     switches(n, ships)))
+        for port in (1, 2):
+            manager._handle_message((('127.0.0.1', port), 'ready', (1,)))
+        fired = {1: 0, 2: 0}
+        while not manager.game.isstate('over'):
+            port = manager.game.turn_player.server_address[1]
+            vector = [0] * n**2
+            vector[fired[port]] = 1
+            fired[port] += 1
+            manager._handle_message((('127.0.0.1', port), 'them', vector))
+    return play
+
+
+def _trace(op):
+    """Blocks and bytes allocated running `op` once, what it returns
+    included, and its peak traced memory."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        result = op()
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    del result
+    ignore = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    stats = after.filter_traces(ignore).compare_to(
+        before.filter_traces(ignore), 'filename')
+    return (sum(stat.count_diff for stat in stats),
+            sum(stat.size_diff for stat in stats), peak - base)
+
+
+def measure(op, min_time=0.2):
+    """Operations per second over at least `min_time` seconds, and the
+    memory blocks and bytes one operation allocates and its peak traced
+    memory, less what tracing a no-op shows."""
+    op()
+    runs, elapsed = 1, 0
+    while True:
+        start = time.perf_counter()
+        for _ in range(runs):
+            op()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        runs *= 2
+        for sink in _sinks:
+            sink.drain()
+    # the first trace allocates tracemalloc's own state
+    _trace(_noop)
+    count, size, peak = (max(traced - overhead, 0) for traced, overhead
+                         in zip(_trace(op), _trace(_noop)))
+    return dict(ops_per_sec=runs / elapsed, alloc_count=count,
+                alloc_bytes=size, alloc_peak_bytes=peak)
+
+
+def _noop():
+    pass
+
+
+def run(names=None, sizes=SPECS, min_time=0.2):
+    """Results by benchmark name and board size."""
+    midi.set_backend('null')
+    results = {}
+    for name in names or BENCHMARKS:
+        for n in sizes:
+            op = BENCHMARKS[name](n, SPECS[n])
+            results.setdefault(name, {})[str(n)] = measure(op, min_time)
+            for sink in _sinks:
+                sink.drain()
+                sink.close()
+            _sinks.clear()
+    return dict(meta=dict(python=platform.python_version(),
+                          platform=platform.platform(),
+                          time=time.strftime('%Y-%m-%dT%H:%M:%S')),
+                results=results)
+
+
+def compare(results, baseline):
+    """Lines of the ops/sec of `results` relative to `baseline`."""
+    lines = []
+    for name, by_size in results['results'].items():
+        for n, result in by_size.items():
+            old = baseline['results'].get(name, {}).get(n)
+            ratio = ('{:6.2f}x'.format(result['ops_per_sec'] /
+                                       old['ops_per_sec'])
+                     if old else '    new')
+            lines.append('{:<24} {:>3} {:>12.0f} ops/s {}'.format(
+                name, n, result['ops_per_sec'], ratio))
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('benchmarks', nargs='*',
+                        help='benchmarks to run, all by default: {}'.format(
+                            ', '.join(BENCHMARKS)))
+    parser.add_argument('--sizes', type=int, nargs='+', choices=SPECS,
+                        default=list(SPECS))
+    parser.add_argument('--min-time', type=float, default=0.2,
+                        help='seconds to time each benchmark for')
+    parser.add_argument('--output', help='write the results to this file')
+    parser.add_argument('--compare', help='results file to compare with')
+    args = parser.parse_args(argv)
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error('unknown benchmarks: {}'.format(', '.join(unknown)))
+    logging.getLogger('battleship').setLevel(logging.WARNING)
+    results = run(args.benchmarks, args.sizes, args.min_time)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            print('\n'.join(compare(results, json.load(f))))
+    elif not args.output:
+        print(json.dumps(results, indent=2))
@@ -0,0 +1,249 @@
+"""Boards packed into bitmasks.
+
+`BitBoard` keeps its decks, hits and misses as one int each, bit i for
+tile i, so up to 8x8 a board is three machine words and larger boards
+are python big ints.  Ships are found by flooding a tile's bit through
+the decks, straightness and sinking are mask compares and game over is a
+single and.  It plays through the same interface as `board.Board` and
+its state is a hashable `snapshot`, which makes it the cheaper board for
+simulations and searches.
+"""
+import functools
+import itertools
+import logging
+from battleship import board, fleet, geometry, conf
+from battleship.board import SEA, DECK, MISS, HIT, TRANSITIONS
+
+logger = logging.getLogger(__name__)
+
+
+@functools.lru_cache(maxsize=None)
+def _column(n, size):
+    return sum(1 << (k*n) for k in range(size))
+
+
+class BitBoard(board.Board):
+    """A `board.Board` backed by bitmasks instead of a ship index."""
+    def __init__(self, n=conf.BOARD_SIZE, ship_spec=conf.SHIP_SPEC,
+                 pitch_pool=None, rules=None):
+        self.rules = geometry.ship_rules(geometry.grid(n))
+        if rules is not None and rules is not self.rules:
+            raise ValueError('bit boards only play straight ships on a '
+                             'square grid')
+        self.grid = self.rules.grid
+        self.n, self.size = n, n**2
+        self.ship_tracker = board.ShipTracker(ship_spec)
+        self.pitch_pool = pitch_pool
+        if pitch_pool is not None:
+            pitch_pool.join(self)
+        self._fleets = fleet.fleets(n, ship_spec)
+        self._not_left = self._fleets._not_left
+        self._not_right = self._fleets._not_right
+        self.decks, self.hits, self.misses = 0, 0, 0
+        self._pitches = bytearray(n**2)
+        self.tiles = board.Tiles(self)
+        self.current = 'empty'
+        self._init_encodings()
+
+    @property
+    def states(self):
+        states = bytearray(self.n**2)
+        for mask, state in ((self.decks, DECK), (self.misses, MISS),
+                            (self.hits, HIT)):
+            for i in fleet._bits(mask):
+                states[i] = state
+        return bytes(states)
+
+    def _update_state(self):
+        if not self.decks:
+            self.current = 'empty'
+        elif self.ship_tracker.is_complete():
+            self.current = 'complete'
+        else:
+            self.current = 'partial'
+
+    # tile state
+
+    def _state(self, i):
+        bit = 1 << i
+        if self.hits & bit:
+            return HIT
+        if self.decks & bit:
+            return DECK
+        return MISS if self.misses & bit else SEA
+
+    def _trigger(self, i, event):
+        src = self._state(i)
+        dst = TRANSITIONS[event][src]
+        if dst is None:
+            raise board.fysom.FysomError(
+                'event {} inappropriate in current state {}'.format(
+                    event, board.STATES[src]))
+        if dst != src:
+            bit = 1 << i
+            # flip the bits that differ between the two states
+            if (src in (DECK, HIT)) != (dst in (DECK, HIT)):
+                self.decks ^= bit
+            if HIT in (src, dst):
+                self.hits ^= bit
+            if MISS in (src, dst):
+                self.misses ^= bit
+            self._encode(i, dst)
+            self._on_enter[dst](self, i)
+            if self.recorder is not None:
+                self.recorder(event, i, dst)
+
+    def _onhit(self, i):
+        self._midi_crush(i)
+        if self.is_sunk(i):
+            self.onsunk(self.ship(i))
+
+    _on_enter = (board.Board._onsea, board.Board._ondeck,
+                 board.Board._onmiss, _onhit)
+
+    # ships
+
+    def _component(self, i, decks):
+        """The bits of the ship tile `i` belongs to among `decks`."""
+        n, not_left, not_right = self.n, self._not_left, self._not_right
+        ship = (1 << i) & decks
+        while True:
+            grown = (ship | ship << n | ship >> n | (ship << 1) & not_left |
+                     (ship >> 1) & not_right) & decks
+            if grown == ship:
+                return ship
+            ship = grown
+
+    def _is_straight(self, ship):
+        """Whether the ship's bits form a single row or column."""
+        lo = (ship & -ship).bit_length() - 1
+        size = ship.bit_count()
+        line = ship >> lo
+        return (line == (1 << size) - 1 and lo % self.n + size <= self.n or
+                line == _column(self.n, size))
+
+    def _add(self, i):
+        bit = 1 << i
+        if self.decks & bit:
+            logger.debug('tile already a deck [%i], skipping...', i)
+            return False
+        ship = self._component(i, self.decks | bit)
+        if not self._is_straight(ship):
+            logger.debug('invalid ship at [%i]', i)
+            return False
+        # the ships merged by the new deck lie on either side of it
+        adj_sizes = [piece.bit_count() for piece in (ship & (bit - 1),
+                                                     ship & ~(2*bit - 1))
+                     if piece]
+        try:
+            self.ship_tracker.add(ship.bit_count(), adj_sizes)
+        except board.MisconfiguredShips:
+            return False
+        self._trigger(i, 'on')
+        self._regroup((i,))
+        return True
+
+    def _remove(self, i):
+        bit = 1 << i
+        if not self.decks & bit:
+            return False
+        ship = self._component(i, self.decks)
+        piece_sizes = [piece.bit_count() for piece in (ship & (bit - 1),
+                                                       ship & ~(2*bit - 1))
+                       if piece]
+        try:
+            self.ship_tracker.remove(ship.bit_count(), piece_sizes)
+        except board.MisconfiguredShips:
+            return False
+        self._trigger(i, 'off')
+        self._regroup(piece.bit_length() - 1
+                      for piece in (ship & (bit - 1), ship & ~(2*bit - 1))
+                      if piece)
+        return True
+
+    def changed_tiles(self, switches):
+        """Indices where the switch vector differs from the current decks."""
+        switches = sum(1 << i for i, switch in enumerate(
+            itertools.islice(switches, self.size)) if int(switch) == 1)
+        return list(fleet._bits(switches ^ self.decks))
+
+    def place_tiles(self, switches):
+        changed = self.changed_tiles(switches)
+        if not changed:
+            return
+        removals = [i for i in changed if self.decks >> i & 1]
+        additions = [i for i in changed if not self.decks >> i & 1]
+        for i in removals:
+            self._remove(i)
+        for i in additions:
+            self._add(i)
+        self._update_state()
+
+    def clear(self):
+        for i in fleet._bits(self.decks | self.misses):
+            self._trigger(i, 'off')
+        self.ship_tracker = board.ShipTracker(self.ship_tracker.spec)
+        self.current = 'empty'
+
+    def recover(self, states, pitches):
+        self.clear()
+        for i, state in enumerate(states):
+            if state in (DECK, HIT):
+                self.decks |= 1 << i
+            if state == HIT:
+                self.hits |= 1 << i
+            elif state == MISS:
+                self.misses |= 1 << i
+        self._invalidate()
+        self._recover(pitches)
+
+    def _load(self, ships):
+        self.clear()
+        for tiles in ships:
+            for i in tiles:
+                self.decks |= 1 << i
+                self._encode(i, DECK)
+                self._ondeck(i)
+                if self.recorder is not None:
+                    self.recorder('on', i, DECK)
+            self.ship_tracker.place(len(tiles))
+        self._update_state()
+
+    def ship(self, i):
+        ship = self._component(i, self.decks)
+        lo, hi = (ship & -ship).bit_length() - 1, ship.bit_length() - 1
+        step = 1 if ship >> lo & 2 or lo == hi else self.n
+        return range(lo, hi + 1, step)
+
+    def is_sunk(self, i):
+        ship = self._component(i, self.decks)
+        return bool(ship) and not ship & ~self.hits
+
+    def all_ships_destroyed(self):
+        return not self.decks & ~self.hits
+
+    def decks_afloat(self):
+        """Number of decks not hit yet."""
+        return (self.decks & ~self.hits).bit_count()
+
+    def shots_fired(self):
+        return (self.hits | self.misses).bit_count()
+
+    # snapshots
+
+    def snapshot(self):
+        """The board's tiles as a hashable (decks, hits, misses) tuple."""
+        return self.decks, self.hits, self.misses
+
+    def restore(self, snapshot):
+        """Return to a `snapshot`, recounting the ships placed.  Meant for
+        searches, so tiles are set without any MIDI."""
+        self.decks, self.hits, self.misses = snapshot
+        self._invalidate()
+        self.ship_tracker = board.ShipTracker(self.ship_tracker.spec)
+        decks = self.decks
+        while decks:
+            ship = self._component((decks & -decks).bit_length() - 1, decks)
+            self.ship_tracker.place(ship.bit_count())
+            decks &= ~ship
+        self._update_state()
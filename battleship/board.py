@@ -1,229 +1,934 @@
+import itertools
 import logging
-import bintrees
+import random
+from array import array
 import fysom
-import networkx
-from battleship import midi, conf
+from battleship import fleet, geometry, midi, conf
 
 logger = logging.getLogger(__name__)
 
+# tile states are packed into one byte per tile, see Board._states
+SEA, DECK, MISS, HIT = range(4)
+STATES = ('sea', 'deck', 'miss', 'hit')
+# text view symbol per state, see Tile.symbols
+SYMBOLS = b'~#ox'
 
-class Tile(fysom.Fysom):
-    """Belongs to a board"""
+# destination state per event, indexed by the source state (None: illegal)
+TRANSITIONS = {'on':   (DECK, DECK, DECK, DECK),
+               'off':  (SEA, SEA, SEA, SEA),
+               'fire': (MISS, HIT, None, None)}
+
+# translation tables from tile states to LEMUR_UI_BOARDS values, by topic
+_UI_TABLES = {}
+
+
+def ui_table(topic):
+    """Translation table from tile states to the `topic` ui board values."""
+    table = _UI_TABLES.get(topic)
+    if table is None:
+        ui = conf.LEMUR_UI_BOARDS[topic]
+        table = _UI_TABLES[topic] = bytes(
+            [ui[state] for state in STATES]).ljust(256, b'\0')
+    return table
+
+
+def text_offset(n, i):
+    """Position of tile `i`'s symbol in the text view of an n x n board."""
+    return (i // n + 1) * (2*n + 4) + 2 + 2 * (i % n)
+
+
+class Tile:
+    """Belongs to a board.  A thin view onto one cell of the board's packed
+    state, so boards don't have to allocate a state machine per tile."""
+    __slots__ = ('board', 'i')
     symbols = dict(sea='~', deck='#', miss='o', hit='x')
 
-    def __init__(self, midi_pitch_set=None):
-        self.midi_pitch_set = midi_pitch_set
-        self.midi_pitch = None
-        super().__init__(
-            dict(initial='sea',
-                 events=(dict(name='on',   src='*',    dst='deck'),
-                         dict(name='off',  src='*',    dst='sea'),
-                         dict(name='fire', src='sea',  dst='miss'),
-                         dict(name='fire', src='deck', dst='hit'))))
-
-    def onsea(self, e):
-        self.midi_stop()
-
-    def ondeck(self, e):
-        if not self.midi_pitch and self.midi_pitch_set:
-            self.midi_pitch = self.midi_pitch_set.pop()
-            logger.debug('midi pitch set: {}, len {}'.format(
-                self.midi_pitch_set, len(self.midi_pitch_set)))
-        if self.midi_pitch:
-            midi.start(self.midi_pitch)
-
-    def onhit(self, e):
-        self.midi_crush()
+    def __init__(self, pitch_pool=None, board=None, i=0):
+        if board is None:
+            board = Board(n=1, ship_spec=(), pitch_pool=pitch_pool)
+        self.board, self.i = board, i
+
+    @property
+    def current(self):
+        return STATES[self.board._state(self.i)]
+
+    @property
+    def midi_pitch(self):
+        return self.board._pitches[self.i] or None
+
+    def isstate(self, state):
+        return self.current == state
+
+    def can(self, event):
+        return TRANSITIONS[event][self.board._state(self.i)] is not None
+
+    def cannot(self, event):
+        return not self.can(event)
+
+    def on(self):
+        self.board._trigger(self.i, 'on')
+
+    def off(self):
+        self.board._trigger(self.i, 'off')
+
+    def fire(self):
+        self.board._trigger(self.i, 'fire')
 
     def midi_stop(self):
-        if self.midi_pitch:
-            midi.stop(self.midi_pitch)
-            self.midi_pitch_set.add(self.midi_pitch)
-            logger.debug('midi pitch set: {}, len {}'.format(
-                self.midi_pitch_set, len(self.midi_pitch_set)))
-            self.midi_pitch = None
+        self.board._midi_stop(self.i)
 
     def midi_crush(self):
-        if self.midi_pitch:
-            midi.crush(self.midi_pitch)
+        self.board._midi_crush(self.i)
 
     def midi_reset(self):
-        if self.isstate('hit'):
-            self.midi_crush()
-        self.midi_stop()
+        self.board._midi_reset(self.i)
 
     def __str__(self):
         return self.symbols[self.current]
 
 
+class Tiles:
+    """Sequence of tile views over a board, created on access."""
+    __slots__ = ('board',)
+
+    def __init__(self, board):
+        self.board = board
+
+    def __len__(self):
+        return self.board.size
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [Tile(board=self.board, i=j)
+                    for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('tile index out of range')
+        return Tile(board=self.board, i=i)
+
+    def __iter__(self):
+        board = self.board
+        return (Tile(board=board, i=i) for i in range(board.size))
+
+
 class MisconfiguredShips(Exception):
     pass
 
 
 class ShipTracker:
+    """Tallies the ships still to be placed per size, for sizes in the spec.
+
+    Counts are kept in a flat list indexed by size, together with their
+    running total, the number of sizes not yet settled and the largest
+    size still outstanding, so that every check is constant time."""
     def __init__(self, spec):
         self.spec = spec
-        self._size_qty, self._sizes, = bintrees.FastAVLTree(), set()
+        max_size = max((size for size, _ in spec), default=0)
+        self._counts = [0] * (max_size + 1)
+        self._tracked = bytearray(max_size + 1)
+        for size, qty in spec:
+            assert not self._tracked[size], 'Duplicate ship size in spec'
+            self._tracked[size] = 1
+        self._total, self._unsettled, self._largest = 0, 0, 0
         for size, qty in spec:
-            assert size not in self._sizes, 'Duplicate ship size in spec'
-            self._size_qty[size] = qty
-            self._sizes.add(size)
+            self._update_qty(size, qty)
+
+    def _is_tracked(self, size):
+        return size < len(self._tracked) and self._tracked[size]
 
     def _update_qty(self, size, delta):
-        if size in self._sizes:
-            self._size_qty[size] += delta
+        if not self._is_tracked(size):
+            return
+        counts = self._counts
+        before = counts[size]
+        after = counts[size] = before + delta
+        self._total += delta
+        self._unsettled += (after != 0) - (before != 0)
+        if after > 0 and size > self._largest:
+            self._largest = size
+        elif after <= 0 and size == self._largest:
+            # bounded by the largest ship size of the spec
+            while self._largest and counts[self._largest] <= 0:
+                self._largest -= 1
 
     def _has_bigger_ships(self, size):
-        bigger_qtys = self._size_qty.value_slice(size + 1, None)
-        return any(c > 0 for c in bigger_qtys)
+        return self._largest > size
 
-    def add(self, size, group_sizes):
-        logger.debug('composing {}-deck ship of {}'.format(size, group_sizes))
-        n_ships_after = sum(self._size_qty.values()) - 1 + len(group_sizes)
-        if n_ships_after < 0:
+    def _check_add(self, size, n_groups):
+        if self._total - 1 + n_groups < 0:
             raise MisconfiguredShips('all ships have already been started')
-        qty = self._size_qty[size] if size in self._sizes else 0
+        qty = self._counts[size] if self._is_tracked(size) else 0
         if not (qty > 0 or self._has_bigger_ships(size)):
             raise MisconfiguredShips('ships exhausted, no larger ships exist')
+
+    def add(self, size, group_sizes):
+        logger.debug('composing %i-deck ship of %s', size, group_sizes)
+        self._check_add(size, len(group_sizes))
         self._update_qty(size, -1)
         for group_size in group_sizes:
             self._update_qty(group_size, 1)
-        logger.debug('current ship tally: {}'.format(self._size_qty))
+        self._log_tally()
 
     def remove(self, size, ungroup_sizes):
-        logger.debug(
-            'decomposing {}-deck ship into of {}'.format(size, ungroup_sizes))
-        n_ships_after = sum(self._size_qty.values()) + 1 - len(ungroup_sizes)
-        if n_ships_after < 0:
+        logger.debug('decomposing %i-deck ship into %s', size, ungroup_sizes)
+        if self._total + 1 - len(ungroup_sizes) < 0:
             raise MisconfiguredShips('would try to add too many ships')
         self._update_qty(size, 1)
-        for ungroup_size in ungroup_sizes:
-            self.add(ungroup_size, [])
-        logger.debug('current ship tally: {}'.format(self._size_qty))
+        # every piece is composed anew, undo everything if one can't be
+        done = []
+        try:
+            for ungroup_size in ungroup_sizes:
+                self._check_add(ungroup_size, 0)
+                self._update_qty(ungroup_size, -1)
+                done.append(ungroup_size)
+        except MisconfiguredShips:
+            for ungroup_size in done:
+                self._update_qty(ungroup_size, 1)
+            self._update_qty(size, -1)
+            raise
+        self._log_tally()
+
+    def _log_tally(self):
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('current ship tally: %s', self.tally())
+
+    def place(self, size):
+        """Count a whole ship of `size` as placed, for bulk loading."""
+        self._update_qty(size, -1)
+
+    def tally(self):
+        """Ships still to be placed by size."""
+        return {size: self._counts[size] for size, _ in sorted(self.spec)}
 
     def is_complete(self):
         """Check if the configuration is complete and valid."""
-        return all(value == 0 for value in self._size_qty.values())
+        return self._unsettled == 0
+
+
+class ShipIndex:
+    """Incremental union-find over the decks of a square grid.
+
+    Ships are straight lines, so every root also keeps its ship's size,
+    orientation and bounding span (`lo`, `hi` tile indices).  Adding a deck
+    is validated and merged in near constant time, removing one only
+    relinks the tiles of the ship it belonged to.  Hits are counted per
+    ship and in total, so sunk ships and game over are constant time."""
+    NONE, HORIZONTAL, VERTICAL = range(3)
+
+    def __init__(self, grid):
+        # the row length, the step of vertical ships
+        self.n = grid.cols
+        self._axes = grid.axes
+        size = grid.size
+        self._count = 0
+        self.decks = bytearray(size)
+        self._parent = array('l', range(size))
+        self._size = array('l', [1]) * size
+        self._lo = array('l', range(size))
+        self._hi = array('l', range(size))
+        self._orientation = bytearray(size)
+        self.hits = bytearray(size)
+        self.hit_count = 0
+        self._hit = array('l', [0]) * size
+
+    def __contains__(self, i):
+        return bool(self.decks[i])
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        return (i for i, deck in enumerate(self.decks) if deck)
+
+    def find(self, i):
+        """Root of the ship tile `i` belongs to (path halving)."""
+        parent = self._parent
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def size(self, i):
+        return self._size[self.find(i)]
+
+    def remaining(self, i):
+        """Number of decks not yet hit on the ship tile `i` belongs to."""
+        root = self.find(i)
+        return self._size[root] - self._hit[root]
+
+    def is_sunk(self, i):
+        return self.remaining(i) == 0
+
+    def all_sunk(self):
+        return self.hit_count == self._count
+
+    def hit(self, i):
+        """Count a hit on deck `i`, returns whether it sank its ship."""
+        if self.hits[i]:
+            return False
+        self.hits[i] = 1
+        self.hit_count += 1
+        root = self.find(i)
+        self._hit[root] += 1
+        return self._hit[root] == self._size[root]
+
+    def unhit(self, i):
+        if self.hits[i]:
+            self.hits[i] = 0
+            self.hit_count -= 1
+            self._hit[self.find(i)] -= 1
+
+    def ship(self, i):
+        """Tile indices of the ship tile `i` belongs to, in order."""
+        root = self.find(i)
+        step = self.n if self._orientation[root] == self.VERTICAL else 1
+        return range(self._lo[root], self._hi[root] + 1, step)
+
+    def _adjacent_roots(self, i):
+        """Roots of the ships left/right and above/below tile `i`."""
+        decks = self.decks
+        horizontal, vertical = self._axes[i]
+        return ([self.find(j) for j in horizontal if j >= 0 and decks[j]],
+                [self.find(j) for j in vertical if j >= 0 and decks[j]])
+
+    def ship_with(self, i):
+        """The size of the ship that adding deck `i` would produce and the
+        sizes of the adjacent ships it joins, or None if the ship would not
+        be a straight line."""
+        horizontal, vertical = self._adjacent_roots(i)
+        if horizontal and vertical:
+            return None
+        roots, orientation = ((horizontal, self.HORIZONTAL) if horizontal
+                              else (vertical, self.VERTICAL))
+        if any(self._orientation[root] not in (self.NONE, orientation)
+               for root in roots):
+            return None
+        adj_sizes = [self._size[root] for root in roots]
+        return 1 + sum(adj_sizes), adj_sizes
+
+    def add(self, i):
+        """Merge deck `i` with its adjacent ships, see `ship_with`."""
+        horizontal, vertical = self._adjacent_roots(i)
+        roots = horizontal or vertical
+        self.decks[i] = 1
+        self._count += 1
+        self._parent[i], self._size[i] = i, 1
+        self._lo[i] = self._hi[i] = i
+        self._orientation[i] = self.NONE
+        self._hit[i] = 0
+        if roots:
+            orientation = self.HORIZONTAL if horizontal else self.VERTICAL
+            for root in roots:
+                i = self._union(i, root)
+            self._orientation[i] = orientation
+
+    def add_ship(self, tiles):
+        """Add a whole ship at once, `tiles` a range of sea tiles not
+        adjacent to any deck."""
+        root, size = tiles[0], len(tiles)
+        for i in tiles:
+            self.decks[i] = 1
+            self._parent[i] = root
+        self._count += size
+        self._size[root], self._hit[root] = size, 0
+        self._lo[root], self._hi[root] = tiles[0], tiles[-1]
+        self._orientation[root] = (
+            self.NONE if size == 1 else
+            self.VERTICAL if tiles.step == self.n else self.HORIZONTAL)
+
+    def _union(self, a, b):
+        if self._size[a] < self._size[b]:
+            a, b = b, a
+        self._parent[b] = a
+        self._size[a] += self._size[b]
+        self._lo[a] = min(self._lo[a], self._lo[b])
+        self._hi[a] = max(self._hi[a], self._hi[b])
+        self._hit[a] += self._hit[b]
+        return a
+
+    def ship_without(self, i):
+        """The size of the ship deck `i` belongs to and the sizes of the
+        pieces it breaks into once `i` is removed."""
+        root = self.find(i)
+        step = self.n if self._orientation[root] == self.VERTICAL else 1
+        head = (i - self._lo[root]) // step
+        tail = (self._hi[root] - i) // step
+        return self._size[root], [size for size in (head, tail) if size]
+
+    def remove(self, i):
+        """Split deck `i` off its ship, relinking the remaining pieces."""
+        ship = self.ship(i)
+        step = ship.step
+        self.decks[i] = 0
+        self._count -= 1
+        self.hit_count -= self.hits[i]
+        self.hits[i] = 0
+        self._parent[i], self._size[i] = i, 1
+        self._lo[i] = self._hi[i] = i
+        self._orientation[i] = self.NONE
+        self._hit[i] = 0
+        for piece in (range(ship.start, i, step),
+                      range(i + step, ship.stop, step)):
+            if not piece:
+                continue
+            root = piece[0]
+            for j in piece:
+                self._parent[j] = root
+            self._size[root] = len(piece)
+            self._hit[root] = sum(self.hits[j] for j in piece)
+            self._lo[root], self._hi[root] = piece[0], piece[-1]
+            self._orientation[root] = (
+                self.NONE if len(piece) == 1 else
+                self.VERTICAL if step == self.n else self.HORIZONTAL)
+
+
+class ShapeIndex:
+    """The decks of a board under any grid and ship rules.
+
+    Ships are found by flooding through the grid's neighbour tables and
+    checked against the rules' cached shapes.  They are no larger than the
+    largest ship of the spec, so that stays cheap without keeping more
+    than the decks and hits."""
+    def __init__(self, rules):
+        self.rules = rules
+        self.grid = rules.grid
+        self._count = 0
+        self.decks = bytearray(self.grid.size)
+        self.hits = bytearray(self.grid.size)
+        self.hit_count = 0
+
+    def __contains__(self, i):
+        return bool(self.decks[i])
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        return (i for i, deck in enumerate(self.decks) if deck)
+
+    def _component(self, i, without=-1):
+        """The decks connected to tile `i`, not through `without`."""
+        neighbours, decks = self.grid.neighbours, self.decks
+        ship, todo = {i}, [i]
+        while todo:
+            for j in neighbours[todo.pop()]:
+                if decks[j] and j != without and j not in ship:
+                    ship.add(j)
+                    todo.append(j)
+        return ship
+
+    def _pieces(self, i, without=-1):
+        """The ships next to tile `i`, each once."""
+        pieces, seen = [], set()
+        for j in self.grid.neighbours[i]:
+            if self.decks[j] and j != without and j not in seen:
+                piece = self._component(j, without)
+                seen |= piece
+                pieces.append(piece)
+        return pieces
+
+    def size(self, i):
+        return len(self._component(i))
 
+    def remaining(self, i):
+        """Number of decks not yet hit on the ship tile `i` belongs to."""
+        return sum(not self.hits[j] for j in self._component(i))
+
+    def is_sunk(self, i):
+        return self.remaining(i) == 0
+
+    def all_sunk(self):
+        return self.hit_count == self._count
+
+    def hit(self, i):
+        """Count a hit on deck `i`, returns whether it sank its ship."""
+        if self.hits[i]:
+            return False
+        self.hits[i] = 1
+        self.hit_count += 1
+        return self.is_sunk(i)
+
+    def unhit(self, i):
+        if self.hits[i]:
+            self.hits[i] = 0
+            self.hit_count -= 1
+
+    def ship(self, i):
+        """Tile indices of the ship tile `i` belongs to, in order."""
+        return tuple(sorted(self._component(i)))
+
+    def ship_with(self, i):
+        """The size of the ship that adding deck `i` would produce and the
+        sizes of the adjacent ships it joins, or None if the rules don't
+        allow it."""
+        pieces = self._pieces(i)
+        ship = set().union(*pieces) | {i}
+        if not self.rules.is_ship(ship):
+            return None
+        if not self.rules.touching and any(
+                self.decks[j] and j not in ship for j in self.grid.corners[i]):
+            return None
+        return len(ship), [len(piece) for piece in pieces]
+
+    def add(self, i):
+        self.decks[i] = 1
+        self._count += 1
+
+    def add_ship(self, tiles):
+        for i in tiles:
+            self.add(i)
+
+    def ship_without(self, i):
+        """The size of the ship deck `i` belongs to and the sizes of the
+        pieces it breaks into once `i` is removed, or None if the pieces
+        would touch where the rules don't allow it."""
+        pieces = self._pieces(i, without=i)
+        if not self.rules.touching and len(pieces) > 1:
+            piece_of = {j: k for k, piece in enumerate(pieces)
+                        for j in piece}
+            if any(piece_of.get(corner, k) != k
+                   for j, k in piece_of.items()
+                   for corner in self.grid.corners[j]):
+                return None
+        return (1 + sum(len(piece) for piece in pieces),
+                [len(piece) for piece in pieces])
+
+    def remove(self, i):
+        self.decks[i] = 0
+        self._count -= 1
+        self.hit_count -= self.hits[i]
+        self.hits[i] = 0
+
+
+class Board:
+    """Represents the game board.  Tile states are packed one byte per tile
+    into a flat bytearray, tile events are lookups in `TRANSITIONS`."""
+    events = {'add': ('empty', 'partial'),
+              'remove': ('partial', 'complete')}
+    # called with (event, tile, new state) for every tile state change
+    recorder = None
 
-class Board(fysom.Fysom):
-    """Represents the game board.  Tiles are stored in a 1d tuple. """
     def __init__(self, n=conf.BOARD_SIZE, ship_spec=conf.SHIP_SPEC,
-                 midi_pitch_set=None):
-        self.n = n
+                 pitch_pool=None, rules=None):
+        # an n x n square grid of straight ships unless the rules say else
+        self.rules = (geometry.ship_rules(geometry.grid(n)) if rules is None
+                      else rules)
+        self.grid = self.rules.grid
+        self.n = self.grid.cols
+        self.size = self.grid.size
         self.ship_tracker = ShipTracker(ship_spec)
-        self.tiles = tuple(Tile(midi_pitch_set) for _ in range(n**2))
-        self._decks = networkx.Graph()
-        super().__init__(
-            dict(initial='empty',
-                 events=(dict(name='add',    src='empty',    dst='partial'),
-                         dict(name='add',    src='partial',  dst='complete'),
-                         dict(name='remove', src='complete', dst='partial'),
-                         dict(name='remove', src='partial',  dst='empty'))))
-
-    def _adjacent_tiles(self, i):
-        n = self.n
-        return (i - 1 if i % n != 0 else None,        # left edge
-                i + n if i + n < n**2 else None,      # bottom edge
-                i - n if i - n >= 0 else None,        # top edge
-                i + 1 if (i + 1) % n != 0 else None)  # right edge
-
-    def _find_ship_and_adjacents(self, i):
-        """DFS work to find adjacent ships comprising the new larger ship."""
-        ship, adj_decks, adj_ships = [i], [], []
-        for adj_tile in self._adjacent_tiles(i):
-            if adj_tile in self._decks:
-                adj_decks.append(adj_tile)
-                adj_ship = list(networkx.dfs_preorder_nodes(self._decks,
-                                                            adj_tile))
-                adj_ships.append(adj_ship)
-                ship.extend(adj_ship)
-        return sorted(ship), adj_decks, adj_ships
-
-    def _is_valid_ship(self, tiles):
-        """Mods of the tile indecies must be either all equal (vertical ship)
-        or form a strict  n+0, n+1, .., n+k sequence (horizontal)."""
-        if len(tiles) < 2:
-            return True
-        mods = [tile % self.n for tile in tiles]
-        next_mod = iter(mods)
-        next(next_mod)
-        zip_mods = zip(iter(mods), next_mod)
-        i, j = next(zip_mods)
-        if i == j:
-            is_valid = all(i == j for i, j in zip_mods)
-        elif i + 1 == j:
-            is_valid = all(i + 1 == j for i, j in zip_mods)
+        # the midi pitches of the decks, see battleship.pitches
+        self.pitch_pool = pitch_pool
+        if pitch_pool is not None:
+            pitch_pool.join(self)
+        self._states = bytearray(self.size)
+        self._pitches = bytearray(self.size)
+        self.tiles = Tiles(self)
+        self._ships = self._new_index()
+        self.current = 'empty'
+        self._init_encodings()
+
+    @property
+    def states(self):
+        """Tile state codes (SEA, DECK, MISS, HIT), one byte per tile."""
+        return bytes(self._states)
+
+    # board state
+
+    def isstate(self, state):
+        return self.current == state
+
+    def can(self, event):
+        return self.current in self.events[event]
+
+    def cannot(self, event):
+        return not self.can(event)
+
+    def _check_event(self, event):
+        if not self.can(event):
+            raise fysom.FysomError('event {} inappropriate in current state '
+                                   '{}'.format(event, self.current))
+
+    def _update_state(self):
+        if not self._ships:
+            self.current = 'empty'
+        elif self.ship_tracker.is_complete():
+            self.current = 'complete'
         else:
-            is_valid = False
-        return is_valid
+            self.current = 'partial'
+
+    # tile state
+
+    def _state(self, i):
+        return self._states[i]
+
+    def _trigger(self, i, event):
+        src = self._states[i]
+        dst = TRANSITIONS[event][src]
+        if dst is None:
+            raise fysom.FysomError('event {} inappropriate in current state '
+                                   '{}'.format(event, STATES[src]))
+        if dst != src:
+            self._states[i] = dst
+            if src == HIT:
+                self._ships.unhit(i)
+            self._encode(i, dst)
+            self._on_enter[dst](self, i)
+            if self.recorder is not None:
+                self.recorder(event, i, dst)
+
+    def _onsea(self, i):
+        self._midi_stop(i)
+
+    def _ondeck(self, i):
+        pool = self.pitch_pool
+        if not self._pitches[i] and pool is not None:
+            size = len(self.ship(i)) if pool.policy == 'ship' else None
+            self._pitches[i] = pool.take(self, i, size) or 0
+        if self._pitches[i]:
+            midi.start(self._pitches[i])
+
+    def _onmiss(self, i):
+        pass
+
+    def _onhit(self, i):
+        self._midi_crush(i)
+        if i in self._ships and self._ships.hit(i):
+            self.onsunk(self._ships.ship(i))
+
+    def onsunk(self, ship):
+        """Called with the tiles of a ship once all its decks are hit."""
+        logger.info('%i-deck ship sunk', len(ship))
+        for i in ship:
+            if self._pitches[i]:
+                midi.sink(self._pitches[i])
+
+    _on_enter = (_onsea, _ondeck, _onmiss, _onhit)
+
+    def _midi_stop(self, i):
+        pitch = self._pitches[i]
+        if pitch:
+            midi.stop(pitch)
+            if self.pitch_pool is not None:
+                self.pitch_pool.free(pitch)
+            self._pitches[i] = 0
+
+    def pitch_stolen(self, i):
+        """The pool gave tile `i`'s pitch to another deck, its loop stops
+        (uncrushed) until that deck starts it again."""
+        if self._state(i) == HIT:
+            self._midi_crush(i)
+        midi.stop(self._pitches[i])
+        self._pitches[i] = 0
+
+    def _midi_crush(self, i):
+        if self._pitches[i]:
+            midi.crush(self._pitches[i])
 
-    def onbeforeadd(self, e):
-        i = e.args[0]
+    def _midi_reset(self, i):
+        if self._state(i) == HIT:
+            self._midi_crush(i)
+        self._midi_stop(i)
+
+    # ships
+
+    def add(self, i):
+        """Turn tile `i` into a deck if it makes for a legal configuration.
+        Returns whether the tile was added."""
+        self._check_event('add')
+        added = self._add(i)
+        if added:
+            self._update_state()
+        return added
+
+    def remove(self, i):
+        """Turn deck `i` back into sea.  Returns whether it was removed."""
+        self._check_event('remove')
+        removed = self._remove(i)
+        if removed:
+            self._update_state()
+        return removed
+
+    def _add(self, i):
         # check if already added
-        if i in self._decks:
+        if i in self._ships:
             logger.debug('tile already a deck [%i], skipping...', i)
             return False
-        # discover adjacent decks and ships
-        ship, adj_decks, adj_ships = self._find_ship_and_adjacents(i)
-        # check basic legality
-        if not self._is_valid_ship(ship):
-            logger.debug('invalid ship %s', ship)
+        # check basic legality, discover adjacent ships
+        ship = self._ships.ship_with(i)
+        if ship is None:
+            logger.debug('invalid ship at [%i]', i)
             return False
         # track ship, check configuration
+        size, adj_sizes = ship
         try:
-            self.ship_tracker.add(len(ship), list(map(len, adj_ships)))
+            self.ship_tracker.add(size, adj_sizes)
         except MisconfiguredShips:
             return False
-        # build graph
-        self._decks.add_node(i)
-        for adj_deck in adj_decks:
-            self._decks.add_edge(i, adj_deck)
+        self._ships.add(i)
         # turn the tile on
-        self.tiles[i].on()
-        # check completeness
-        if e.dst == 'complete' and not self.ship_tracker.is_complete():
-            return False
+        self._trigger(i, 'on')
+        self._regroup((i,))
+        return True
 
-    def onbeforeremove(self, e):
-        i = e.args[0]
+    def _remove(self, i):
         # check if added
-        if not i in self._decks:
+        if i not in self._ships:
             return False
-        # remove from graph, early so that adjacent ships can be discovered
-        self._decks.remove_node(i)
-        # discover adjacent decks and ships
-        ship, adj_decks, adj_ships = self._find_ship_and_adjacents(i)
         # track ship, check configuration
+        ship = self._ships.ship_without(i)
+        if ship is None:
+            logger.debug('ship pieces would touch at [%i]', i)
+            return False
+        size, piece_sizes = ship
         try:
-            self.ship_tracker.remove(len(ship), list(map(len, adj_ships)))
+            self.ship_tracker.remove(size, piece_sizes)
         except MisconfiguredShips:
-            # rebuild the graph
-            self._decks.add_node(i)
-            for adj_deck in adj_decks:
-                self._decks.add_edge(i, adj_deck)
             return False
+        self._ships.remove(i)
         # turn the tile off
-        self.tiles[i].off()
-        # check emptiness
-        if e.dst == 'empty' and self._decks:
-            return False
+        self._trigger(i, 'off')
+        self._regroup(j for j in self.grid.neighbours[i] if j in self._ships)
+        return True
+
+    def _regroup(self, tiles):
+        """Moves the decks of the ships at `tiles`, grown or split, to the
+        pitch group of their new size, under the 'ship' policy."""
+        pool = self.pitch_pool
+        if pool is None or pool.policy != 'ship':
+            return
+        for ship in {tuple(self.ship(i)) for i in tiles}:
+            for i in ship:
+                if pool.misplaced(self._pitches[i], self, len(ship)):
+                    self._midi_stop(i)
+                    self._ondeck(i)
+
+    def clear(self):
+        """Turn every tile back into sea."""
+        for i, state in enumerate(self._states):
+            if state != SEA:
+                self._trigger(i, 'off')
+        self.ship_tracker = ShipTracker(self.ship_tracker.spec)
+        self._ships = self._new_index()
+        self.current = 'empty'
+
+    def _new_index(self):
+        if self.rules.simple:
+            return ShipIndex(self.grid)
+        return ShapeIndex(self.rules)
+
+    def _has_layouts(self):
+        """Whether `fleet` covers the board: square, of straight ships."""
+        return self.rules.simple and self.grid.rows == self.grid.cols
+
+    def place_fleet(self, ships):
+        """Replace the board with a complete fleet, `ships` the tile indices
+        of every ship, in order along it.  Where `fleet` covers the board
+        the layout is checked as a whole and loaded in bulk instead of going
+        through `add` tile by tile."""
+        if not self._has_layouts():
+            return self._add_fleet(ships)
+        layouts = fleet.fleets(self.n, self.ship_tracker.spec)
+        try:
+            layout = layouts.layout(ships)
+        except ValueError as e:
+            raise MisconfiguredShips(str(e))
+        self._load(layouts.tiles(layout))
+
+    def place_random_fleet(self, rng=random):
+        """Replace the board with a random legal fleet."""
+        if not self._has_layouts():
+            return self._add_fleet(self._random_lines(rng))
+        layouts = fleet.fleets(self.n, self.ship_tracker.spec)
+        self._load(layouts.tiles(layouts.random(rng)))
+
+    def _add_fleet(self, ships):
+        self.clear()
+        for tiles in ships:
+            if not all(self._add(i) for i in tiles):
+                raise MisconfiguredShips(
+                    'illegal ship at {}'.format(list(tiles)))
+        self._update_state()
+        if not self.isstate('complete'):
+            raise MisconfiguredShips('incomplete fleet')
+
+    def _random_lines(self, rng):
+        """Straight ships at random, largest first, for the grids `fleet`
+        doesn't cover.  Starts over when one doesn't fit any more."""
+        grid, touching = self.grid, self.rules.touching
+        sizes = sorted((size for size, qty in self.ship_tracker.spec
+                        for _ in range(qty)), reverse=True)
+        for _ in range(conf.FLEET_PLACEMENT_ATTEMPTS):
+            blocked, ships = set(), []
+            for size in sizes:
+                lines = [line for line in grid.lines(size)
+                         if blocked.isdisjoint(line)]
+                if not lines:
+                    break
+                ship = rng.choice(lines)
+                ships.append(ship)
+                for i in ship:
+                    blocked.add(i)
+                    blocked.update(grid.neighbours[i])
+                    if not touching:
+                        blocked.update(grid.corners[i])
+            else:
+                return ships
+        raise MisconfiguredShips('found no room for the fleet')
+
+    def recover(self, states, pitches):
+        """Return to saved tile `states` and midi `pitches` (one byte per
+        tile each, see `states`), claiming the pitches from the pool and
+        starting their loops again, crushed where hit."""
+        self.clear()
+        self._states[:] = states
+        self._invalidate()
+        for i, state in enumerate(states):
+            if state in (DECK, HIT):
+                self._ships.add(i)
+        for i, state in enumerate(states):
+            if state == HIT:
+                self._ships.hit(i)
+        self._recover(pitches)
+
+    def _recover(self, pitches):
+        self._pitches[:] = pitches
+        if self.pitch_pool is not None:
+            for i, pitch in enumerate(pitches):
+                if pitch:
+                    self.pitch_pool.claim(pitch, self, i)
+        for i, state in enumerate(self.states):
+            if state in (DECK, HIT):
+                if i == self.ship(i)[0]:
+                    self.ship_tracker.place(len(self.ship(i)))
+                if self._pitches[i]:
+                    midi.start(self._pitches[i])
+            if state == HIT:
+                self._midi_crush(i)
+        self._update_state()
+
+    def _load(self, ships):
+        self.clear()
+        for tiles in ships:
+            self._ships.add_ship(tiles)
+            self.ship_tracker.place(len(tiles))
+            for i in tiles:
+                self._states[i] = DECK
+                self._encode(i, DECK)
+                self._ondeck(i)
+                if self.recorder is not None:
+                    self.recorder('on', i, DECK)
+        self._update_state()
+
+    def changed_tiles(self, switches):
+        """Indices where the switch vector differs from the current decks.
+
+        Both vectors are packed one byte per tile and xor-ed as big ints, so
+        only the differing tiles are visited in python.  A vector of the
+        wrong length is cut or padded with sea to the board's size, so that
+        it still lines up by index."""
+        switches = bytes(int(switch) == 1 for switch in
+                         itertools.islice(switches, self.size))
+        switches = switches.ljust(self.size, b'\0')
+        decks = self._ships.decks
+        if switches == decks:
+            return []
+        last = len(decks) - 1
+        diff = int.from_bytes(switches, 'big') ^ int.from_bytes(decks, 'big')
+        changed = []
+        while diff:
+            low = diff & -diff
+            changed.append(last - (low.bit_length() - 1) // 8)
+            diff ^= low
+        return changed[::-1]
 
     def place_tiles(self, switches):
-        for i, switch in enumerate(switches):
-            switch = int(switch)
-            if switch == 1 and self.can('add'):
-                self.add(i)
-            elif switch == 0 and self.can('remove'):
-                self.remove(i)
+        """Apply a full switch vector from the ui as one batch.
+
+        Only tiles whose switch differs from the board are touched, removals
+        before additions so that freed ships can be placed again, and the
+        board state is updated once at the end."""
+        changed = self.changed_tiles(switches)
+        if not changed:
+            return
+        removals = [i for i in changed if i in self._ships]
+        additions = [i for i in changed if i not in self._ships]
+        for i in removals:
+            self._remove(i)
+        for i in additions:
+            self._add(i)
+        self._update_state()
+
+    # cached encodings
+
+    def _init_encodings(self):
+        # bumped on every tile state change
+        self.version = 0
+        # ui values (translation table, bytearray) by topic and the text
+        # view, kept up to date tile by tile once they were asked for
+        self._ui = {}
+        self._text = None
+        # (version, immutable copy) by topic, None for the text view
+        self._frozen = {}
+
+    def _encode(self, i, state):
+        """Bring the cached encodings up to date with tile `i`'s state."""
+        self.version += 1
+        for table, values in self._ui.values():
+            values[i] = table[state]
+        if self._text is not None:
+            self._text[text_offset(self.n, i)] = SYMBOLS[state]
+
+    def _invalidate(self):
+        """Drop the cached encodings, after the states changed wholesale."""
+        self.version += 1
+        self._ui.clear()
+        self._text = None
+
+    def ui_vector(self, topic):
+        """Tile values for the `topic` ui board, one byte per tile.  The
+        same bytes object is returned until a tile changes."""
+        frozen = self._frozen.get(topic)
+        if frozen is not None and frozen[0] == self.version:
+            return frozen[1]
+        encoded = self._ui.get(topic)
+        if encoded is None:
+            table = ui_table(topic)
+            encoded = self._ui[topic] = (
+                table, bytearray(self.states.translate(table)))
+        values = bytes(encoded[1])
+        self._frozen[topic] = self.version, values
+        return values
+
+    def ship(self, i):
+        """Tile indices of the ship deck `i` belongs to."""
+        return self._ships.ship(i)
+
+    def is_sunk(self, i):
+        """Whether the ship deck `i` belongs to has been sunk."""
+        return self._ships.is_sunk(i)
 
     def all_ships_destroyed(self):
-        return all(self.tiles[i].isstate('hit') for i in self._decks)
+        return self._ships.all_sunk()
 
-    def __str__(self):
+    def _render(self):
         edge = '|{}|'.format('-' * (self.n*2 + 1))
+        symbols = [Tile.symbols[state] for state in STATES]
+        states = self.states
         rows = []
-        for i in range(0, self.n**2, self.n):
-            row = '| {} |'.format(' '.join(map(str, self.tiles[i:i+self.n])))
+        for i in range(0, self.size, self.n):
+            row = '| {} |'.format(' '.join(
+                symbols[state] for state in states[i:i+self.n]))
             rows.append(row)
         return '{edge}\n{rows}\n{edge}'.format(edge=edge, rows='\n'.join(rows))
+
+    def __str__(self):
+        frozen = self._frozen.get(None)
+        if frozen is not None and frozen[0] == self.version:
+            return frozen[1]
+        if self._text is None:
+            self._text = bytearray(self._render(), 'ascii')
+        text = self._text.decode('ascii')
+        self._frozen[None] = self.version, text
+        return text
@@ -2,35 +2,97 @@
 
 Board, Ships, MIDI, OSC, LEMUR_UI, Player
 """
-import logging
 
-# logging
-logging.basicConfig(
-    format='%(levelname)-6s%(process)-6d%(name)-18s%(funcName)-18s%(message)s',
-    level=logging.DEBUG)
+# logging (see battleship.logs): LOG_LEVEL for all loggers, LOG_LEVELS by
+# subsystem, e.g. {'battleship.osc': 'DEBUG', 'battleship.board': 'INFO'}
+LOG_LEVEL = 'INFO'
+LOG_LEVELS = {}
+LOG_FORMAT = \
+    '%(levelname)-6s%(process)-6d%(name)-18s%(funcName)-18s%(message)s'
+# also log to this file, and as JSON lines instead of LOG_FORMAT
+LOG_FILE = None
+LOG_STRUCTURED = False
+# high-rate debug events logged one in n times, by event name
+LOG_SAMPLING = {'osc_rx': 100, 'osc_tx': 100}
 
 # board will be n x n
 BOARD_SIZE = 5
 
+# board grid (see battleship.geometry): 'square', 'hex' or 'torus'
+BOARD_GRID = 'square'
+
+# ship rules: BENT_SHIPS allows L-shaped ships, SHIPS_TOUCHING lets ships
+# touch at a corner
+BENT_SHIPS = False
+SHIPS_TOUCHING = True
+
 # list of tuples of (size, qty)
 SHIP_SPEC = [(1, 2),
              (2, 1),
              (3, 1),
              (4, 1)]
 
-# midi
+# fleet layouts are drawn uniformly from all of them when there are at most
+# FLEET_MAX_LAYOUTS, otherwise mixed with FLEET_SWEEPS re-placement sweeps
+FLEET_MAX_LAYOUTS = 2**16
+FLEET_SWEEPS = 5
+# specs estimated (from FLEET_ESTIMATE_PROBES random placements) to have
+# over FLEET_ESTIMATE_MARGIN times FLEET_MAX_LAYOUTS skip the enumeration
+FLEET_ESTIMATE_PROBES = 64
+FLEET_ESTIMATE_MARGIN = 4
+# on grids and rules the layouts don't cover, ships are placed at random
+# one by one, starting over up to FLEET_PLACEMENT_ATTEMPTS times
+FLEET_PLACEMENT_ATTEMPTS = 100
+
+# midi, backend is one of 'rtmidi', 'null', 'recording'
+MIDI_BACKEND = 'rtmidi'
 MIDI_DRIVER_NAME = b'IAC Driver Battleship'
+# add a 'sink' channel to also trigger the decks of a ship once it sinks
 MIDI_CHANNELS = {'start': 0, 'stop': 2, 'crush': 4}
 MIDI_PITCH_RANGE = range(36, 58)
+# pitch allocation (see battleship.pitches): 'lru' reuses the pitch freed
+# longest ago, 'player' splits the range between the players and 'ship'
+# into loop groups by ship size, MIDI_PITCH_GROUPS ({size: pitches}) or
+# None to split in proportion to the decks of each size
+MIDI_PITCH_POLICY = 'lru'
+MIDI_PITCH_GROUPS = None
+# send from a dedicated thread in batches of up to MIDI_BATCH_SIZE note-ons,
+# with MIDI_PACING seconds between consecutive messages
+MIDI_SENDER_THREAD = True
+MIDI_BATCH_SIZE = 64
+MIDI_PACING = 0
+# at shutdown, wait up to MIDI_FLUSH_TIMEOUT seconds for the queued
+# note-ons (the stops of the last game) to be sent
+MIDI_FLUSH_TIMEOUT = 5
 
 # osc addresses
 OSC_TOPICS = {'us': ('/us/x', '/us/draw'),
               'them': ('/them/x', '/them/draw'),
               'ready': ('/ready/x', '/ready/x'),
+              'auto': ('/auto/x', '/auto/x'),
               'ready_light': ('/ready/light', '/ready/light'),
               'turn': ('/turn/value', '/turn/value'),
               'turn_light': ('/turn/light', '/turn/light')}
 
+# delta board publishing: after a full board, only changed cells are sent as
+# (index, value) pairs on the cells address, with a full resync every
+# OSC_RESYNC_INTERVAL seconds and after a player was silent for that long
+OSC_DELTA_BOARDS = False
+OSC_BOARD_CELLS = {'us': '/us/cells', 'them': '/them/cells'}
+OSC_RESYNC_INTERVAL = 5
+
+# input stage: boards on OSC_COALESCE_TOPICS from a player are held for up
+# to OSC_COALESCE_WINDOW seconds and only the latest is handled (0: off),
+# the counters are logged every OSC_INPUT_STATS_INTERVAL seconds
+OSC_COALESCE_WINDOW = 0.02
+OSC_COALESCE_TOPICS = ('us',)
+OSC_INPUT_STATS_INTERVAL = 60
+
+# the process engine shares the game state with the osc server processes,
+# which then drop fire out of turn or at tiles already fired at, and input
+# while a game that just ended ignores the ui (see battleship.sharedstate)
+OSC_PREFILTER = True
+
 # lemur ui
 LEMUR_UI_BOARDS = {'us':   {'sea': 0, 'deck': 1, 'miss': 2, 'hit': 3},
                    'them': {'sea': 0, 'deck': 0, 'miss': 2, 'hit': 3}}
@@ -40,6 +102,38 @@ PLAYERS = [{'client_address': ('alice.local', 8000),
             'server_address': ('0.0.0.0', 5005)},
            {'client_address': ('thrace.local', 8000),
             'server_address': ('0.0.0.0', 5006)}]
+# a single visitor plays against the computer (needs numpy) with e.g.
+# PLAYERS = [PLAYERS[0], {'computer': True}]
+
+# tables hosted by this server, each a dict with 'players' (as above) and
+# optionally 'id', 'prefix' (prepended to the osc addresses), 'board_size',
+# 'ship_spec', 'midi_pitch_range' and 'seed' (of the random fleets, logged
+# to the event log if not given).  Tables without a 'midi_pitch_range'
+# split MIDI_PITCH_RANGE, and no two ranges may overlap.  More than one
+# table runs on the asyncio engine, sharded over TABLE_WORKERS processes
+# by id.
+TABLES = [{'players': PLAYERS}]
+TABLE_WORKERS = 1
+
+# message loop: 'process' runs an osc server process per player feeding a
+# queue, 'asyncio' receives for all players on one event loop in-process
+ENGINE = 'process'
+
+# time the stages from OSC receive to MIDI/OSC send (see battleship.latency)
+# and log their percentiles every LATENCY_LOG_INTERVAL seconds
+LATENCY_STATS = False
+LATENCY_LOG_INTERVAL = 60
+
+# binary event log of the games (see battleship.eventlog), e.g.
+# 'battleship-{worker}.evlog' formatted with the table worker index, or None
+EVENT_LOG_PATH = None
+EVENT_LOG_FLUSH_INTERVAL = 2
+
+# snapshot of each table's game to resume it after a restart (see
+# battleship.snapshot), e.g. 'battleship-{game_id}.snap', or None
+SNAPSHOT_PATH = None
+# written from a background thread, at most every SNAPSHOT_INTERVAL seconds
+SNAPSHOT_INTERVAL = 1
 
 # game timeout (seconds)
 GAME_TIMEOUT = 60*10
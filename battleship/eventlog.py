@@ -0,0 +1,183 @@
+"""Append-only binary log of what happens in the games.
+
+Every record is a fixed header (kind, time, game id, player port, payload
+length) and a small payload:
+
+    MESSAGE     an OSC message handed to GameManager._handle_message
+    BOARD       a tile event of a player's board and the resulting state
+    GAME        a transition of the game: event and new state
+    PLAYER      a transition of a player: event and new state
+    TIMEOUT     the game timed out
+    SEED        the seed of a table's random fleets, on manager start
+
+Seeds, messages and timeouts are enough to replay a log through a
+GameManager, the rest is there to analyse it.  A message whose params
+don't fit the record (e.g. a stray packet) is dropped with a warning
+rather than stop the game.  Logs are read by streaming over an mmap, a
+truncated last record (e.g. after a crash) is ignored.
+"""
+import collections
+import logging
+import mmap
+import struct
+import time
+from battleship import conf
+
+logger = logging.getLogger(__name__)
+MAGIC = b'BSEVLOG1'
+MESSAGE, BOARD, GAME, PLAYER, TIMEOUT, SEED = range(1, 7)
+
+# kind, time, game id, player port (0: the computer), payload length
+HEADER = struct.Struct('<BdHHH')
+# tile event (index into TILE_EVENTS), tile, state after the event
+TILE = struct.Struct('<BHB')
+TILE_EVENTS = ('on', 'off', 'fire')
+SEED_VALUE = struct.Struct('<I')
+# osc params: uint8, int32 or float32 values
+PARAMS = ('B', 'i', 'f')
+
+Record = collections.namedtuple('Record', 'kind time game_id port data')
+
+
+def _pack_str(s):
+    s = s.encode()
+    return bytes((len(s),)) + s
+
+
+def _unpack_str(buf, offset):
+    end = offset + 1 + buf[offset]
+    return bytes(buf[offset + 1:end]).decode(), end
+
+
+def _pack_params(params):
+    if all(isinstance(p, int) for p in params):
+        code = 0 if all(0 <= p < 256 for p in params) else 1
+    else:
+        code = 2
+    return struct.pack('<BH{}{}'.format(len(params), PARAMS[code]),
+                       code, len(params), *params)
+
+
+def _unpack_params(buf, offset):
+    code, count = struct.unpack_from('<BH', buf, offset)
+    return struct.unpack_from('<{}{}'.format(count, PARAMS[code]), buf,
+                              offset + 3)
+
+
+class EventLog:
+    """Writes records to `path`, flushing at most every `flush_interval`
+    seconds, right away on a game transition, a timeout or a seed, and on
+    close."""
+    def __init__(self, path, flush_interval=conf.EVENT_LOG_FLUSH_INTERVAL,
+                 clock=time.time):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.clock = clock
+        self._file = open(path, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+        self._flushed = time.monotonic()
+
+    def _write(self, kind, game_id, port, payload=b''):
+        self._file.write(HEADER.pack(kind, self.clock(), game_id, port,
+                                     len(payload)) + payload)
+        now = time.monotonic()
+        if now - self._flushed >= self.flush_interval:
+            self.flush()
+
+    def message(self, game_id, port, topic, params):
+        try:
+            payload = _pack_str(topic) + _pack_params(params)
+        except (struct.error, ValueError) as e:
+            logger.warning('not logging message %r %r from port %s: %s',
+                           topic, params, port, e)
+            return
+        self._write(MESSAGE, game_id, port, payload)
+
+    def tile(self, game_id, port, event, i, state):
+        self._write(BOARD, game_id, port,
+                    TILE.pack(TILE_EVENTS.index(event), i, state))
+
+    def game(self, game_id, event, dst):
+        self._write(GAME, game_id, 0, _pack_str(event) + _pack_str(dst))
+        self.flush()
+
+    def player(self, game_id, port, event, dst):
+        self._write(PLAYER, game_id, port, _pack_str(event) + _pack_str(dst))
+
+    def timeout(self, game_id):
+        self._write(TIMEOUT, game_id, 0)
+        self.flush()
+
+    def seed(self, game_id, seed):
+        self._write(SEED, game_id, 0, SEED_VALUE.pack(seed))
+        self.flush()
+
+    def flush(self):
+        self._file.flush()
+        self._flushed = time.monotonic()
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+
+def _data(kind, buf, offset):
+    if kind == MESSAGE:
+        topic, offset = _unpack_str(buf, offset)
+        return topic, _unpack_params(buf, offset)
+    if kind == BOARD:
+        event, i, state = TILE.unpack_from(buf, offset)
+        return TILE_EVENTS[event], i, state
+    if kind in (GAME, PLAYER):
+        event, offset = _unpack_str(buf, offset)
+        return event, _unpack_str(buf, offset)[0]
+    if kind == SEED:
+        return SEED_VALUE.unpack_from(buf, offset)
+    return ()
+
+
+def read(path):
+    """The records of the log at `path`, in order."""
+    with open(path, 'rb') as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        if buf[:len(MAGIC)] != MAGIC:
+            raise ValueError('not an event log: {}'.format(path))
+        offset, end = len(MAGIC), len(buf)
+        while offset + HEADER.size <= end:
+            kind, t, game_id, port, size = HEADER.unpack_from(buf, offset)
+            offset += HEADER.size
+            if offset + size > end:
+                break
+            yield Record(kind, t, game_id, port, _data(kind, buf, offset))
+            offset += size
+
+
+def replay(path, manager, speed=None):
+    """Feeds the messages and timeouts of `manager`'s game in the log at
+    `path` through it, as fast as possible or `speed` times real time.
+    A logged seed reseeds the manager and starts a new game, as the
+    manager starting did.  The manager's clock follows the log.  Returns
+    the records replayed."""
+    replayed, started, first = 0, time.monotonic(), None
+    for record in read(path):
+        if record.game_id != manager.game_id or \
+                record.kind not in (MESSAGE, TIMEOUT, SEED):
+            continue
+        if speed:
+            first = record.time if first is None else first
+            delay = (record.time - first) / speed - \
+                (time.monotonic() - started)
+            if delay > 0:
+                time.sleep(delay)
+        manager.clock = lambda t=record.time: t
+        if record.kind == MESSAGE:
+            topic, params = record.data
+            manager._handle_message((('', record.port), topic, params))
+        elif record.kind == SEED:
+            manager.reseed(*record.data)
+            manager.game = manager.new_game()
+        else:
+            manager._timeout()
+        replayed += 1
+    return replayed
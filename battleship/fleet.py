@@ -0,0 +1,223 @@
+"""Random legal fleet layouts.
+
+A layout places every ship of a spec as a straight line, not on or
+orthogonally next to another ship (the two would merge into one).  Tiles
+are bits of an int, so where a ship still fits is a few shifts and ands
+over the free tiles.
+
+Specs with few enough layouts have them all enumerated once, and a layout
+is drawn uniformly from that list.  Larger ones place the ships one by one
+at random and then re-place each ship uniformly among the positions the
+others leave it for a few sweeps, which mixes towards uniform.  Specs with
+far too many layouts are told apart by estimating their number from a few
+random placements, without enumerating up to the limit first.
+"""
+import collections
+import functools
+import math
+import random
+from battleship import conf
+
+
+class Fleets:
+    """Layouts of the ship spec on an n x n board.  A layout is a list of
+    ships, each a (start tile, step) pair: step 1 runs right, n down."""
+    def __init__(self, n, ship_spec, max_layouts=conf.FLEET_MAX_LAYOUTS,
+                 sweeps=conf.FLEET_SWEEPS):
+        self.n = n
+        self.sizes = sorted((size for size, qty in ship_spec
+                             for _ in range(qty)), reverse=True)
+        self.sweeps = sweeps
+        self.all = (1 << n**2) - 1
+        left = sum(1 << i for i in range(0, n**2, n))
+        self._not_left, self._not_right = self.all & ~left, \
+            self.all & ~(left << (n - 1))
+        self._fits, self._units = {}, {}
+        for size in set(self.sizes):
+            self._fits[size] = (
+                sum(1 << i for i in range(n**2) if i % n + size <= n),
+                sum(1 << i for i in range(n**2) if i // n + size <= n))
+            self._units[size] = ((1 << size) - 1,
+                                 sum(1 << (k*n) for k in range(size)))
+        self.max_layouts = max_layouts
+
+    @functools.cached_property
+    def layouts(self):
+        """All layouts, or None if there are more than `max_layouts`."""
+        if self.estimate() > conf.FLEET_ESTIMATE_MARGIN * self.max_layouts:
+            return None
+        return self._enumerate(self.max_layouts)
+
+    def estimate(self, probes=conf.FLEET_ESTIMATE_PROBES):
+        """The number of layouts, estimated from the branching along
+        `probes` random placements (Knuth's estimator)."""
+        rng, total = random.Random(0), 0
+        for _ in range(probes):
+            blocked, count = 0, 1
+            for size in self.sizes:
+                free = self.all & ~blocked
+                right, down = self.starts(size, free)
+                count *= right.bit_count() + down.bit_count()
+                if not count:
+                    break
+                ship = self._choose(size, free, rng)
+                blocked |= self.halo(self.mask(size, *ship))
+            total += count
+        # identical ships are counted in every order
+        for qty in collections.Counter(self.sizes).values():
+            total /= math.factorial(qty)
+        return total / probes
+
+    def mask(self, size, start, step):
+        return self._units[size][step != 1] << start
+
+    def halo(self, mask):
+        """The ship's tiles and their orthogonal neighbours."""
+        return (mask | (mask << self.n) | (mask >> self.n) |
+                ((mask << 1) & self._not_left) |
+                ((mask >> 1) & self._not_right)) & self.all
+
+    def starts(self, size, free):
+        """Bitmasks of the starts where a `size` ship fits on the `free`
+        tiles, running right and running down."""
+        right, down = self._fits[size]
+        right &= free
+        for k in range(1, size):
+            right &= free >> k
+        if size == 1:
+            return right, 0
+        down &= free
+        for k in range(1, size):
+            down &= free >> (k * self.n)
+        return right, down
+
+    def _enumerate(self, max_layouts):
+        layouts, sizes = [], self.sizes
+
+        def place(k, blocked, previous, ships):
+            if len(layouts) > max_layouts:
+                return
+            if k == len(sizes):
+                layouts.append(tuple(ships))
+                return
+            size = sizes[k]
+            right, down = self.starts(size, self.all & ~blocked)
+            for step, starts in ((1, right), (self.n, down)):
+                for start in _bits(starts):
+                    # identical ships are only counted in one order
+                    if k and sizes[k - 1] == size and \
+                            (step, start) <= previous:
+                        continue
+                    ships.append((start, step))
+                    place(k + 1, blocked | self.halo(
+                        self.mask(size, start, step)), (step, start), ships)
+                    ships.pop()
+
+        place(0, 0, None, [])
+        return layouts if len(layouts) <= max_layouts else None
+
+    def random(self, rng=random):
+        """A random layout, with the sizes in `self.sizes` order."""
+        if self.layouts is not None:
+            if not self.layouts:
+                raise ValueError('no legal layout for this spec')
+            return list(rng.choice(self.layouts))
+        ships = self._sequential(rng)
+        halos = [self.halo(self.mask(size, *ship))
+                 for size, ship in zip(self.sizes, ships)]
+        for _ in range(self.sweeps):
+            for k in rng.sample(range(len(ships)), len(ships)):
+                blocked = 0
+                for j, halo in enumerate(halos):
+                    if j != k:
+                        blocked |= halo
+                # the ship's own position is always still free
+                size = self.sizes[k]
+                ships[k] = self._choose(size, self.all & ~blocked, rng)
+                halos[k] = self.halo(self.mask(size, *ships[k]))
+        return ships
+
+    def _choose(self, size, free, rng):
+        right, down = self.starts(size, free)
+        n_right, n_down = right.bit_count(), down.bit_count()
+        if not n_right + n_down:
+            return None
+        r = rng.randrange(n_right + n_down)
+        if r < n_right:
+            return _nth_bit(right, r), 1
+        return _nth_bit(down, r - n_right), self.n
+
+    def _sequential(self, rng):
+        while True:
+            blocked, ships = 0, []
+            for size in self.sizes:
+                ship = self._choose(size, self.all & ~blocked, rng)
+                if ship is None:
+                    break
+                ships.append(ship)
+                blocked |= self.halo(self.mask(size, *ship))
+            else:
+                return ships
+
+    def layout(self, ships):
+        """The layout of ships given as tile indices, raises ValueError if
+        they are not a legal layout of the spec."""
+        ships = sorted(map(sorted, ships), key=len, reverse=True)
+        if [len(tiles) for tiles in ships] != self.sizes:
+            raise ValueError('ships do not match the spec')
+        n, layout, blocked = self.n, [], 0
+        for tiles in ships:
+            size, start = len(tiles), tiles[0]
+            step = tiles[1] - start if size > 1 else 1
+            if step not in (1, n) or \
+                    tiles != list(range(start, start + step*size, step)) or \
+                    (step == 1 and start % n + size > n) or \
+                    tiles[-1] >= n**2:
+                raise ValueError('not a straight ship: {}'.format(tiles))
+            mask = self.mask(size, start, step)
+            if mask & blocked:
+                raise ValueError('ship touches another: {}'.format(tiles))
+            blocked |= self.halo(mask)
+            layout.append((start, step))
+        return layout
+
+    def tiles(self, layout):
+        """The tile indices of every ship of a layout."""
+        return [range(start, start + step * size, step)
+                for size, (start, step) in zip(self.sizes, layout)]
+
+
+def _bits(mask):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def _nth_bit(mask, r):
+    """Index of the r-th (from 0) set bit of mask, by bisection."""
+    lo, hi = 0, mask.bit_length()
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        below = (mask & ((1 << mid) - 1)).bit_count()
+        if below > r:
+            hi = mid
+        else:
+            lo = mid
+    return lo
+
+
+@functools.lru_cache(maxsize=None)
+def _fleets(n, ship_spec):
+    return Fleets(n, ship_spec)
+
+
+def fleets(n, ship_spec):
+    """The `Fleets` of a board size and ship spec, cached."""
+    return _fleets(n, tuple(map(tuple, ship_spec)))
+
+
+def random_fleet(n, ship_spec, rng=random):
+    """Tiles of the ships of a random legal layout."""
+    layouts = fleets(n, ship_spec)
+    return layouts.tiles(layouts.random(rng))
@@ -1,25 +1,44 @@
+import asyncio
+import collections
+import functools
 import itertools
 import logging
 import multiprocessing
 import queue
+import random
 import time
 import fysom
-from battleship import board, conf, osc
+from battleship import (board, conf, eventlog, fleet, geometry, latency, logs,
+                        midi, osc, pitches, sharedstate, snapshot)
 
 logger = logging.getLogger(__name__)
 
 
 class Player(fysom.Fysom):
-    def __init__(self, game_queue, server_address, client_address):
-        self.server = osc.Server(server_address, game_queue)
-        self.server.start()
-        time.sleep(.2)
-        self.client = osc.Client(*client_address)
-        super().__init__(
-            dict(initial='setup',
-                 events=(dict(name='prompt', src='setup', dst='confirmation'),
-                         dict(name='confirm', src='confirmation', dst='ready'),
-                         dict(name='deny', src='*', dst='setup'))))
+    def __init__(self, game_queue, server_address, client_address,
+                 topic_mapping=conf.OSC_TOPICS, shared_state=None):
+        self.server_address = server_address
+        # without a queue the messages are received by the asyncio engine
+        self.server = None
+        if game_queue is not None:
+            self.server = osc.Server(server_address, game_queue, topic_mapping,
+                                     shared_state, client_address)
+            self.server.start()
+            time.sleep(.2)
+        self.client = osc.Client(*client_address, topic_mapping)
+        self.last_message = None
+        super().__init__(self.fsm)
+
+    @property
+    def port(self):
+        """The server port that tells the player apart, 0 for the
+        computer."""
+        return self.server_address[1] if self.server_address else 0
+
+    fsm = dict(initial='setup',
+               events=(dict(name='prompt', src='setup', dst='confirmation'),
+                       dict(name='confirm', src='confirmation', dst='ready'),
+                       dict(name='deny', src='*', dst='setup')))
 
     def onready(self, e):
         logger.info('player ready')
@@ -45,11 +64,61 @@ class Player(fysom.Fysom):
         self.send_board()
         self.send_board_to_opponent()
 
+    def new_board(self, new_board):
+        self.board = new_board
+        self.deny()
+        self.publish_board()
+
+
+class ComputerPlayer(Player):
+    """The computer-controlled opponent of a single visitor.  Places a
+    random fleet and confirms it right away, then fires at the tiles the
+    `ai` heatmap picks."""
+    def __init__(self, seed=None):
+        # or seeded from the manager's seed, see GameManager.reseed
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.server_address, self.server = None, None
+        self.client = osc.NullClient()
+        self.last_message = None
+        fysom.Fysom.__init__(self, self.fsm)
+
+    @property
+    def ai(self):
+        from battleship import ai
+        return ai
+
+    def new_board(self, new_board):
+        super().new_board(new_board)
+        self.place_fleet(new_board)
+        self.prompt()
+        self.confirm()
+        self.publish_board()
+
+    def place_fleet(self, new_board):
+        new_board.place_random_fleet(self.rng)
+
+    def shoot(self):
+        target = self.opponent.board
+        return self.ai.target(target, target.ship_tracker.spec, self.rng)
+
 
 class Game(fysom.Fysom):
-    def __init__(self, players):
+    def __init__(self, players, board_size=conf.BOARD_SIZE,
+                 ship_spec=conf.SHIP_SPEC,
+                 midi_pitch_range=conf.MIDI_PITCH_RANGE, board_recorder=None,
+                 grid_kind=conf.BOARD_GRID, bent_ships=conf.BENT_SHIPS,
+                 ships_touching=conf.SHIPS_TOUCHING, board_class=board.Board):
         logger.info('starting new game')
         self.players = players
+        self.board_recorder = board_recorder
+        self.board_size = board_size
+        self.ship_spec = ship_spec
+        self.ship_rules = geometry.ship_rules(
+            geometry.grid(board_size, kind=grid_kind), bent_ships,
+            ships_touching)
+        self.midi_pitch_range = midi_pitch_range
+        self.board_class = board_class
         self.turn_player = None
         self._reset_players()
         super().__init__(
@@ -76,7 +145,7 @@ class Game(fysom.Fysom):
         self.turn_player.opponent.client.turn_led(on=False)
 
     def onover(self, e):
-        logger.info('game over')
+        logger.info('game over, pitches: %s', self.pitch_pool.stats())
         # stop all decks, uncrush all hits
         for plyr in self.players.values():
             for tile in plyr.board.tiles:
@@ -84,65 +153,283 @@ class Game(fysom.Fysom):
 
     def _reset_players(self):
         logger.debug('resetting the boards and ui')
-        midi_pitch_set = set(conf.MIDI_PITCH_RANGE)
+        self.pitch_pool = pitch_pool = pitches.PitchPool(
+            self.midi_pitch_range, ship_spec=self.ship_spec,
+            players=len(self.players))
         for plyr in self.players.values():
-            plyr.board = board.Board(midi_pitch_set=midi_pitch_set)
-            plyr.deny()
-            plyr.publish_board()
+            new_board = self.board_class(n=self.board_size,
+                                         ship_spec=self.ship_spec,
+                                         pitch_pool=pitch_pool,
+                                         rules=self.ship_rules)
+            if self.board_recorder is not None:
+                new_board.recorder = self.board_recorder(plyr)
+            plyr.new_board(new_board)
 
 
 class GameManager:
-    def __init__(self, players_conf=conf.PLAYERS):
-        self.mq = multiprocessing.Queue()
+    """Runs the games of one table: a pair of players, one game at a time."""
+    def __init__(self, players_conf=conf.PLAYERS, engine=conf.ENGINE,
+                 board_size=conf.BOARD_SIZE, ship_spec=conf.SHIP_SPEC,
+                 midi_pitch_range=conf.MIDI_PITCH_RANGE,
+                 topic_mapping=conf.OSC_TOPICS, game_id=0, event_log=None,
+                 snapshot_path=None, seed=None):
+        assert engine in ('process', 'asyncio'), 'Unknown engine'
+        self.engine = engine
+        self.game_id = game_id
+        self.event_log = event_log
+        self.snapshots = (snapshot.Snapshots(snapshot_path)
+                          if snapshot_path else None)
+        # replaced by the log's clock on replay, see eventlog.replay
+        self.clock = time.time
+        self.board_size = board_size
+        self.ship_spec = ship_spec
+        self.midi_pitch_range = midi_pitch_range
+        self.mq = multiprocessing.Queue() if engine == 'process' else None
         self.last_game_ended = None
+        self._timeout_handle = None
+        self._inputs_handle = None
+        handler = (self._handle_received if engine == 'asyncio'
+                   else self._handle_dequeued)
+        self.inputs = osc.InputStage(handler)
+        # messages taken off the queue by server port
+        self._dequeued = collections.Counter()
+        self.shared_state = None
+        if engine == 'process' and conf.OSC_PREFILTER:
+            self.shared_state = sharedstate.SharedState(
+                [0 if player_conf.get('computer')
+                 else player_conf['server_address'][1]
+                 for player_conf in players_conf[:2]], board_size)
         # init the players (by server port)
         self.players = {}
-        for player_conf in players_conf[:2]:
+        for i, player_conf in enumerate(players_conf[:2]):
+            if player_conf.get('computer'):
+                self.players['computer', i] = ComputerPlayer(
+                    seed=player_conf.get('seed'))
+                continue
             server_port = player_conf['server_address'][1]
-            plyr = Player(game_queue=self.mq, **player_conf)
+            plyr = Player(game_queue=self.mq, topic_mapping=topic_mapping,
+                          shared_state=self.shared_state, **player_conf)
             self.players[server_port] = plyr
         # link opponents
         for plyr, opponent in itertools.permutations(self.players.values()):
             plyr.opponent = opponent
+        if event_log is not None:
+            for plyr in self.players.values():
+                plyr.onchangestate = functools.partial(self._log_player, plyr)
+        self.reseed(seed)
+
+    def reseed(self, seed=None):
+        """Seeds the random fleets of the table, auto-placed and the
+        computer's, from `seed` (a random one if None) and logs it, so that
+        a replay places the same fleets."""
+        self.seed = random.randrange(2**32) if seed is None else seed
+        self.rng = random.Random(self.seed)
+        for plyr in self.players.values():
+            if isinstance(plyr, ComputerPlayer):
+                derived = self.rng.randrange(2**32)
+                plyr.rng.seed(derived if plyr.seed is None else plyr.seed)
+        if self.event_log is not None:
+            self.event_log.seed(self.game_id, self.seed)
+
+    def new_game(self):
+        if self.event_log is None:
+            return Game(self.players, board_size=self.board_size,
+                        ship_spec=self.ship_spec,
+                        midi_pitch_range=self.midi_pitch_range)
+        game = Game(self.players, board_size=self.board_size,
+                    ship_spec=self.ship_spec,
+                    midi_pitch_range=self.midi_pitch_range,
+                    board_recorder=self._tile_logger)
+        game.onchangestate = self._log_game
+        return game
+
+    # event log
+
+    def _tile_logger(self, player):
+        return functools.partial(self.event_log.tile, self.game_id,
+                                 player.port)
+
+    def _log_game(self, e):
+        self.event_log.game(self.game_id, e.event, e.dst)
+
+    def _log_player(self, player, e):
+        self.event_log.player(self.game_id, player.port, e.event, e.dst)
+
+    def resume(self):
+        """Picks up the game of the snapshot, if any, or starts a new one."""
+        if self.snapshots is None or not self.snapshots.restore(self):
+            self.game = self.new_game()
+        self._warm_fleets()
+        self._warm_computer()
+
+    def _warm_fleets(self):
+        """Enumerates the fleet layouts before the first random placement
+        would, before the message loop starts."""
+        if self.game.ship_rules.simple:
+            fleet.fleets(self.board_size, self.ship_spec).layouts
+
+    def _warm_computer(self):
+        """Builds the heatmap matrices of a computer player before its
+        first shot, ValueError if it can't play the game's ship rules."""
+        for plyr in self.players.values():
+            if isinstance(plyr, ComputerPlayer):
+                plyr.ai.warm(self.game.ship_rules, self.ship_spec)
 
     def start(self):
-        self.game = Game(self.players)
-        # start mq loop
-        while True:
+        self.resume()
+        if self.engine == 'asyncio':
             try:
-                message = self.mq.get(timeout=conf.GAME_TIMEOUT)
-                self._handle_message(message)
-            except queue.Empty:
-                logging.info('game timed out after {} sec, new game'.format(
-                    conf.GAME_TIMEOUT))
-                self.game.stop()
-                self.game = Game(self.players)
+                asyncio.run(self.serve())
             except KeyboardInterrupt:
-                self.game.stop()
-                self.game = Game(self.players)
-                print('Stokrotka!!!')
-                break
+                self._interrupt()
+            return
+        # start mq loop
+        try:
+            self._publish_state()
+            while True:
+                due = self.inputs.next_due()
+                try:
+                    message = self.mq.get(
+                        timeout=conf.GAME_TIMEOUT if due is None else due)
+                    self._dequeued[message[0][1]] += 1
+                    self.inputs.observe_queue(self._queue_depth())
+                    self.inputs.put(message)
+                except queue.Empty:
+                    if due is None:
+                        self._timeout()
+                except KeyboardInterrupt:
+                    self._interrupt()
+                    break
+                self.inputs.flush_due()
+                self._publish_state()
+        finally:
+            if self.shared_state is not None:
+                self.shared_state.close()
+
+    def _publish_state(self):
+        """Shares the game with the osc servers, counting the messages of
+        a player as handled once none of them is held back."""
+        if self.shared_state is not None:
+            self.shared_state.publish(self, {
+                port: count for port, count in self._dequeued.items()
+                if not self.inputs.is_holding(port)})
+
+    def _queue_depth(self):
+        try:
+            return self.mq.qsize()
+        except NotImplementedError:
+            # not on every platform
+            return 0
+
+    def _handle_dequeued(self, message):
+        # stamped by the osc server when latency stats are on
+        latency.begin(*message[3:])
+        latency.mark('dequeue')
+        self._handle_message(message[:3])
+
+    def _handle_received(self, message):
+        # stamped on receipt, held messages keep their own stamp
+        latency.begin(*message[3:])
+        self._handle_message(message[:3])
+
+    async def serve(self):
+        """Receives the messages of all players on the running event loop and
+        handles them as they arrive, the game timeout is a loop timer."""
+        servers = [await osc.AsyncServer.create(plyr.server_address,
+                                                self._handle_message_async)
+                   for plyr in self.players.values()
+                   if plyr.server_address is not None]
+        self._schedule_timeout()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            self._timeout_handle.cancel()
+            if self._inputs_handle is not None:
+                self._inputs_handle.cancel()
+            for server in servers:
+                server.close()
+
+    def _handle_message_async(self, message):
+        self._schedule_timeout()
+        self.inputs.put(message)
+        self._schedule_inputs()
+
+    def _schedule_inputs(self):
+        due = self.inputs.next_due()
+        if due is not None and self._inputs_handle is None:
+            self._inputs_handle = asyncio.get_running_loop().call_later(
+                due, self._flush_inputs)
+
+    def _flush_inputs(self):
+        self._inputs_handle = None
+        self.inputs.flush_due()
+        self._schedule_inputs()
+
+    def _schedule_timeout(self):
+        if self._timeout_handle is not None:
+            self._timeout_handle.cancel()
+        self._timeout_handle = asyncio.get_running_loop().call_later(
+            conf.GAME_TIMEOUT, self._timeout_async)
+
+    def _timeout_async(self):
+        self._timeout()
+        self._schedule_timeout()
+
+    def _timeout(self):
+        if self.event_log is not None:
+            self.event_log.timeout(self.game_id)
+        logger.info('game timed out after %s sec, new game',
+                    conf.GAME_TIMEOUT)
+        self.game.stop()
+        self.game = self.new_game()
+        if self.snapshots is not None:
+            self.snapshots.save(self)
+
+    def _interrupt(self):
+        self.game.stop()
+        self.game = self.new_game()
+        if self.event_log is not None:
+            self.event_log.close()
+        if self.snapshots is not None:
+            self.snapshots.flush()
+        midi.flush()
+        print('Stokrotka!!!')
 
     def _handle_message(self, message):
         server_address, topic, params = message
+        if self.event_log is not None:
+            self.event_log.message(self.game_id, server_address[1], topic,
+                                   params)
         # determine player by unique port
         player = self.players[server_address[1]]
+        # a player silent for a while may have reconnected, resend in full
+        now = self.clock()
+        if player.last_message is None or \
+                now - player.last_message > conf.OSC_RESYNC_INTERVAL:
+            player.client.resync()
+        player.last_message = now
         # determine and call topic handler
         topic_handler = getattr(self, '_handle_message_{}'.format(topic))
         if self.game.isstate('over'):
-            if time.time() - self.last_game_ended > conf.IGNORE_TIME_GAME_OVER:
-                self.game = Game(self.players)
+            if now - self.last_game_ended > conf.IGNORE_TIME_GAME_OVER:
+                self.game = self.new_game()
             else:
-                logging.info('game is over, ignoring ui messages')
+                logger.info('game is over, ignoring ui messages')
         else:
+            latency.mark('handler_enter')
             topic_handler(player, params)
+            latency.mark('handler_exit')
+        if self.snapshots is not None:
+            self.snapshots.save(self)
 
     def _handle_message_us(self, player, params):
         """Handles messages from player's own board. (just during setup)"""
-        print(self.game.current, player.current)
+        logger.debug('game %s, player %s', self.game.current,
+                     player.current)
         if self.game.isstate('setup') and \
                 player.current in set(['setup', 'confirmation']):
             player.board.place_tiles(params)
+            latency.mark('board')
         player.send_board()
         # confirmation
         if player.board.isstate('partial'):
@@ -150,23 +437,51 @@ class GameManager:
         if player.board.isstate('complete') and player.can('prompt'):
             player.prompt()
 
+    def _handle_message_auto(self, player, params):
+        """Handles messages from the auto-place button. (just during setup)"""
+        if self.game.isstate('setup') and all(params) and \
+                player.current in set(['setup', 'confirmation']):
+            player.board.place_random_fleet(self.rng)
+            latency.mark('board')
+        player.send_board()
+        if player.board.isstate('complete') and player.can('prompt'):
+            player.prompt()
+
     def _handle_message_them(self, player, params):
         """Handles messages from player's monitor board. (game play)"""
         if player is self.game.turn_player:
             board = player.opponent.board
             for i, param in enumerate(params):
-                tile = board.tiles[i]
-                if param == 1 and tile.can('fire'):
-                    tile.fire()
-                    if tile.isstate('miss'):
-                        self.game.turn()
+                if param == 1 and board.tiles[i].can('fire'):
+                    self._fire(player, i)
                     # important to make sure that we don't allow multifire
                     break
             # check if game is over
             if board.all_ships_destroyed():
-                self.game.stop()
-                self.last_game_ended = time.time()
+                self._game_over()
         player.opponent.publish_board()
+        self._play_computer()
+
+    def _fire(self, player, i):
+        tile = player.opponent.board.tiles[i]
+        tile.fire()
+        latency.mark('board')
+        if tile.isstate('miss'):
+            self.game.turn()
+
+    def _game_over(self):
+        self.game.stop()
+        self.last_game_ended = self.clock()
+
+    def _play_computer(self):
+        """Lets a computer player take its turn, until it misses."""
+        while self.game.current in ('p1', 'p2') and \
+                isinstance(self.game.turn_player, ComputerPlayer):
+            player = self.game.turn_player
+            self._fire(player, player.shoot())
+            if player.opponent.board.all_ships_destroyed():
+                self._game_over()
+            player.opponent.publish_board()
 
     def _handle_message_ready(self, player, params):
         """Handles messages from the confirmation button."""
@@ -183,10 +498,190 @@ class GameManager:
             player.deny()
         if player.board.isstate('complete') and player.can('prompt'):
             player.prompt()
-        # attempt to start the game
-        self.game.play()
+        # attempt to start the game, waits for the other player if canceled
+        try:
+            self.game.play()
+        except fysom.Canceled:
+            pass
+
+
+class GameRegistry:
+    """Hosts several tables, each its own `GameManager` with a player pair,
+    board size and ship spec, on one asyncio receive loop.
+
+    Messages are routed to a table by the port they arrive on and the OSC
+    address prefix of the table, so tables may share ports as long as
+    their prefixes differ."""
+    def __init__(self, tables_conf=conf.TABLES, event_log=None):
+        self.event_log = event_log
+        self.games = {}
+        # osc addresses by route, for every bound server address
+        self.routes = {}
+        # the tables share the midi port, so not a pitch
+        tables_conf = with_pitch_ranges(tables_conf)
+        for game_id, table_conf in enumerate(tables_conf):
+            settings = table_settings(table_conf, game_id)
+            game_id = settings['game_id']
+            assert game_id not in self.games, 'Duplicate game id'
+            topic_mapping = settings['topic_mapping']
+            manager = GameManager(
+                engine='asyncio', event_log=event_log,
+                snapshot_path=snapshot_path(game_id), **settings)
+            self.games[game_id] = manager
+            for plyr in manager.players.values():
+                if plyr.server_address is None:
+                    continue
+                routes = self.routes.setdefault(plyr.server_address, {})
+                rx_addresses = {osc_addresses[0]
+                                for osc_addresses in routes.values()}
+                for topic, osc_addresses in topic_mapping.items():
+                    assert osc_addresses[0] not in rx_addresses, \
+                        'Tables sharing a port need distinct prefixes'
+                    routes[game_id, topic] = osc_addresses
+
+    def start(self):
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            for manager in self.games.values():
+                manager.game.stop()
+                if manager.snapshots is not None:
+                    manager.snapshots.flush()
+            if self.event_log is not None:
+                self.event_log.close()
+            midi.flush()
+            print('Stokrotka!!!')
+
+    async def serve(self):
+        servers = [await osc.AsyncServer.create(server_address, self._route,
+                                                topic_mapping=routes)
+                   for server_address, routes in self.routes.items()]
+        for manager in self.games.values():
+            manager.resume()
+            manager._schedule_timeout()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            for manager in self.games.values():
+                manager._timeout_handle.cancel()
+                if manager._inputs_handle is not None:
+                    manager._inputs_handle.cancel()
+            for server in servers:
+                server.close()
+
+    def _route(self, message):
+        server_address, (game_id, topic), params, *stamp = message
+        self.games[game_id]._handle_message_async(
+            (server_address, topic, params, *stamp))
+
+
+def table_settings(table_conf, game_id=0):
+    """The `GameManager` arguments of a table of conf.TABLES."""
+    prefix = table_conf.get('prefix', '')
+    return dict(
+        players_conf=table_conf['players'],
+        board_size=table_conf.get('board_size', conf.BOARD_SIZE),
+        ship_spec=table_conf.get('ship_spec', conf.SHIP_SPEC),
+        midi_pitch_range=table_conf.get('midi_pitch_range',
+                                        conf.MIDI_PITCH_RANGE),
+        seed=table_conf.get('seed'),
+        topic_mapping={topic: tuple(prefix + osc_address
+                                    for osc_address in osc_addresses)
+                       for topic, osc_addresses in conf.OSC_TOPICS.items()},
+        game_id=table_conf.get('id', game_id))
+
+
+def with_pitch_ranges(tables_conf, pitch_range=conf.MIDI_PITCH_RANGE):
+    """The tables with a 'midi_pitch_range' each: the tables without one
+    split what `pitch_range` the others leave into equal runs.  Raises
+    ValueError if two tables' ranges overlap, they'd play each other's
+    loops on the shared midi port."""
+    taken = {pitch for table_conf in tables_conf
+             for pitch in table_conf.get('midi_pitch_range', ())}
+    unset = [i for i, table_conf in enumerate(tables_conf)
+             if 'midi_pitch_range' not in table_conf]
+    runs = pitches.split([pitch for pitch in pitch_range
+                          if pitch not in taken], dict.fromkeys(unset, 1))
+    tables_conf = [dict(table_conf, midi_pitch_range=runs[i])
+                   if i in runs else table_conf
+                   for i, table_conf in enumerate(tables_conf)]
+    owner = {}
+    for i, table_conf in enumerate(tables_conf):
+        for pitch in table_conf['midi_pitch_range']:
+            if owner.setdefault(pitch, i) != i:
+                raise ValueError('pitch {} is in the ranges of tables {} '
+                                 'and {}'.format(pitch, owner[pitch], i))
+    return tables_conf
+
+
+def shard_tables(tables_conf, workers):
+    """Splits the tables into `workers` shards by game id."""
+    shards = [[] for _ in range(workers)]
+    tables_conf = with_pitch_ranges(tables_conf)
+    for game_id, table_conf in enumerate(tables_conf):
+        table_conf = dict(table_conf, id=table_conf.get('id', game_id))
+        shards[table_conf['id'] % workers].append(table_conf)
+    # a port can only be bound by one worker
+    bound = {}
+    for shard, shard_conf in enumerate(shards):
+        for table_conf in shard_conf:
+            for player_conf in table_conf['players']:
+                # computer players bind no port
+                if 'server_address' not in player_conf:
+                    continue
+                port = player_conf['server_address'][1]
+                if bound.setdefault(port, shard) != shard:
+                    raise ValueError('port {} is shared by tables in '
+                                     'different shards'.format(port))
+    return [shard_conf for shard_conf in shards if shard_conf]
+
+
+def open_event_log(worker=0):
+    """The event log of a worker process, if conf.EVENT_LOG_PATH is set."""
+    if conf.EVENT_LOG_PATH is None:
+        return None
+    return eventlog.EventLog(conf.EVENT_LOG_PATH.format(worker=worker))
+
+
+def snapshot_path(game_id=0):
+    """Where the game of a table is snapshot, if conf.SNAPSHOT_PATH is set."""
+    if conf.SNAPSHOT_PATH is None:
+        return None
+    return conf.SNAPSHOT_PATH.format(game_id=game_id)
+
+
+def _serve_tables(tables_conf, worker=0, log_config=None):
+    logs.attach(log_config)
+    GameRegistry(tables_conf, event_log=open_event_log(worker)).start()
+
+
+def serve_tables(tables_conf=conf.TABLES, workers=conf.TABLE_WORKERS):
+    """Serves the tables from `workers` processes, each running a registry
+    for its shard of the tables."""
+    shards = shard_tables(tables_conf, workers)
+    if len(shards) == 1:
+        return _serve_tables(shards[0])
+    processes = [multiprocessing.Process(target=_serve_tables,
+                                         args=(shard, i, logs.child_config()),
+                                         name='battleship_tables_{}'.format(i))
+                 for i, shard in enumerate(shards)]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.join()
 
 
 def run():
-    game_manager = GameManager()
-    game_manager.start()
+    logs.configure()
+    if len(conf.TABLES) > 1:
+        serve_tables()
+    else:
+        settings = table_settings(conf.TABLES[0])
+        game_manager = GameManager(
+            event_log=open_event_log(),
+            snapshot_path=snapshot_path(settings['game_id']), **settings)
+        game_manager.start()
@@ -0,0 +1,155 @@
+"""Board geometries and ship rules.
+
+A grid numbers the tiles of a board row by row and tables, once, the
+neighbours of every tile along each of its axes and the tiles that only
+touch it at a corner.  Square grids have rows and columns as axes,
+toroidal ones wrap around at the edges.  Hex grids are a rhombus of hexes
+in axial coordinates, with a third axis running from the bottom left to
+the top right, and no two hexes share just a corner.
+
+Ship rules tell the shapes a ship may take, straight lines and with
+`bent` also L-shapes, and whether ships may touch at a corner.  Whether a
+set of tiles is a legal ship is cached per grid and rules, for the
+SHAPE_CACHE_SIZE shapes seen last.  Grids and rules are cached too, so
+every board of a size shares their tables.
+"""
+import functools
+
+# legal ship shapes remembered per rules, least recently used dropped
+SHAPE_CACHE_SIZE = 4096
+
+# edge axes and corner directions as (row, column) steps, by grid kind
+KINDS = {'square': (((0, 1), (1, 0)), ((1, 1), (1, -1))),
+         'torus': (((0, 1), (1, 0)), ((1, 1), (1, -1))),
+         'hex': (((0, 1), (1, 0), (-1, 1)), ())}
+
+
+class Grid:
+    """The tiles of a `rows` x `cols` board of a kind in `KINDS`.
+
+    `axes[i]` holds a (previous, next) pair of tiles per axis, -1 past an
+    edge, `neighbours[i]` the tiles sharing an edge with tile i and
+    `corners[i]` those sharing only a corner."""
+    def __init__(self, rows, cols=None, kind='square'):
+        if kind not in KINDS:
+            raise ValueError('unknown grid kind: {}'.format(kind))
+        self.rows, self.cols = rows, rows if cols is None else cols
+        self.kind = kind
+        self.wrap = kind == 'torus'
+        self.size = self.rows * self.cols
+        axes, corners = KINDS[kind]
+        self.axes = tuple(
+            tuple((self._at(i, -dr, -dc), self._at(i, dr, dc))
+                  for dr, dc in axes)
+            for i in range(self.size))
+        self.neighbours = tuple(
+            self._distinct(i, (j for pair in self.axes[i] for j in pair))
+            for i in range(self.size))
+        self.corners = tuple(
+            tuple(j for j in self._distinct(
+                i, (self._at(i, sign*dr, sign*dc)
+                    for dr, dc in corners for sign in (-1, 1)))
+                  if j not in self.neighbours[i])
+            for i in range(self.size))
+        self._lines = {}
+
+    def _at(self, i, dr, dc):
+        """The tile `dr` rows and `dc` columns from tile i, -1 if none."""
+        row, col = divmod(i, self.cols)
+        row, col = row + dr, col + dc
+        if self.wrap:
+            row, col = row % self.rows, col % self.cols
+        elif not (0 <= row < self.rows and 0 <= col < self.cols):
+            return -1
+        j = row * self.cols + col
+        # a single row or column wraps onto the tile itself
+        return -1 if j == i else j
+
+    @staticmethod
+    def _distinct(i, tiles):
+        return tuple(dict.fromkeys(j for j in tiles if j >= 0 and j != i))
+
+    def lines(self, size):
+        """Every straight run of `size` tiles, in order along its axis."""
+        lines = self._lines.get(size)
+        if lines is not None:
+            return lines
+        seen, lines = set(), []
+        for i in range(self.size):
+            for axis in range(len(self.axes[i])):
+                line = [i]
+                while len(line) < size:
+                    j = self.axes[line[-1]][axis][1]
+                    if j < 0 or j in line:
+                        break
+                    line.append(j)
+                # a run closing into a ring has no ends, it isn't a ship
+                ring = size > 1 and self.axes[line[-1]][axis][1] == i
+                key = frozenset(line)
+                if len(line) == size and not ring and key not in seen:
+                    seen.add(key)
+                    lines.append(tuple(line))
+        lines = self._lines[size] = tuple(lines)
+        return lines
+
+
+class ShipRules:
+    """The shapes ships may take on a grid and whether they may touch."""
+    def __init__(self, grid, bent=False, touching=True):
+        self.grid = grid
+        self.bent = bent
+        self.touching = touching
+        # straight ships touching at corners on a square grid, what
+        # board.ShipIndex and the fleet layouts handle
+        self.simple = grid.kind == 'square' and not bent and touching
+        self._legal = functools.lru_cache(maxsize=SHAPE_CACHE_SIZE)(
+            self._is_ship)
+
+    def is_ship(self, tiles):
+        """Whether the connected `tiles` make a legal ship."""
+        return self._legal(frozenset(tiles))
+
+    def _is_ship(self, tiles):
+        if len(tiles) == 1:
+            return True
+        axes = self.grid.axes
+        # the tiles linked to their next one along each axis
+        arms = []
+        for axis in range(len(axes[next(iter(tiles))])):
+            linked = [i for i in tiles if axes[i][axis][1] in tiles]
+            if linked:
+                arms.append((axis, linked))
+        # connected, so a tree (no ring) if there is one link less than tiles
+        if sum(len(linked) for _, linked in arms) != len(tiles) - 1:
+            return False
+        if len(arms) == 1:
+            return True
+        if not self.bent or len(arms) != 2:
+            return False
+        # two straight arms meeting at the end of both
+        arm_tiles = []
+        for axis, linked in arms:
+            arm = set(linked) | {axes[i][axis][1] for i in linked}
+            if len(arm) != len(linked) + 1:
+                return False
+            arm_tiles.append(arm)
+        corner = arm_tiles[0] & arm_tiles[1]
+        if len(corner) != 1:
+            return False
+        corner = corner.pop()
+        return all(sum(j in tiles for j in axes[corner][axis]) == 1
+                   for axis, _ in arms)
+
+
+def grid(rows, cols=None, kind='square'):
+    """The shared `Grid` of a board."""
+    return _grid(rows, rows if cols is None else cols, kind)
+
+
+def ship_rules(grid, bent=False, touching=True):
+    """The shared `ShipRules` of a grid."""
+    return _ship_rules(grid, bool(bent), bool(touching))
+
+
+_grid = functools.lru_cache(maxsize=None)(Grid)
+_ship_rules = functools.lru_cache(maxsize=None)(ShipRules)
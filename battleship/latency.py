@@ -0,0 +1,130 @@
+"""Latency of the hot path, from OSC receive to MIDI and OSC send.
+
+A received message is stamped when the OSC server enqueues it (the
+process engine) or receives it (asyncio).  While its handler runs, every
+stage it passes through records the time since that stamp into the
+stage's histogram:
+
+    dequeue        taken off the queue by GameManager.start
+    handler_enter  topic handler called
+    board          board placement or fire done
+    midi           midi.send_noteon called
+    osc_send       osc.Client.send called
+    handler_exit   topic handler returned
+
+Disabled, `stamp`, `begin` and `mark` are no-op functions, enable with
+conf.LATENCY_STATS or `enable()`.  Stats are logged every
+conf.LATENCY_LOG_INTERVAL seconds and returned by `stats()`.
+"""
+import bisect
+import logging
+import time
+from battleship import conf
+
+logger = logging.getLogger(__name__)
+
+STAGES = ('dequeue', 'handler_enter', 'board', 'midi', 'osc_send',
+          'handler_exit')
+
+# histogram bucket upper bounds in seconds, 1us to ~100s in steps of 2**.25
+BOUNDS = [1e-6 * 2**(k / 4) for k in range(108)]
+
+
+class Histogram:
+    """Counts of latencies in logarithmic buckets."""
+    def __init__(self):
+        self.counts = [0] * (len(BOUNDS) + 1)
+        self.count = 0
+        self.max = 0
+
+    def add(self, latency):
+        self.counts[bisect.bisect_left(BOUNDS, latency)] += 1
+        self.count += 1
+        if latency > self.max:
+            self.max = latency
+
+    def percentile(self, p):
+        """Upper bound of the bucket the p-th percentile falls in."""
+        rank, seen = self.count * p / 100, 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return BOUNDS[bucket] if bucket < len(BOUNDS) else self.max
+        return 0
+
+
+_histograms = {stage: Histogram() for stage in STAGES}
+_origin = None
+_last_log = time.monotonic()
+
+
+def _stamp():
+    return time.monotonic(),
+
+
+def _begin(origin=None):
+    global _origin
+    _origin = time.monotonic() if origin is None else origin
+
+
+def _mark(stage):
+    global _last_log, _origin
+    if _origin is None:
+        return
+    now = time.monotonic()
+    _histograms[stage].add(now - _origin)
+    if stage == 'handler_exit':
+        # sends after the handler (timeouts, timers) aren't of a message
+        _origin = None
+        if now - _last_log > conf.LATENCY_LOG_INTERVAL:
+            _last_log = now
+            log()
+
+
+def _noop(*args):
+    return ()
+
+
+stamp = begin = mark = _noop
+
+
+def enable():
+    """Starts timing the stages, from a clean slate."""
+    global stamp, begin, mark, _origin
+    reset()
+    _origin = None
+    stamp, begin, mark = _stamp, _begin, _mark
+
+
+def disable():
+    global stamp, begin, mark
+    stamp = begin = mark = _noop
+
+
+def is_enabled():
+    return mark is _mark
+
+
+def reset():
+    for stage in STAGES:
+        _histograms[stage] = Histogram()
+
+
+def stats():
+    """Count, p50, p99 and max latency in seconds, by stage."""
+    return {stage: dict(count=histogram.count,
+                        p50=histogram.percentile(50),
+                        p99=histogram.percentile(99),
+                        max=histogram.max)
+            for stage, histogram in _histograms.items() if histogram.count}
+
+
+def log():
+    logger.info('latency p50/p99 ms: %s', ', '.join(
+        '{} {:.2f}/{:.2f} (n={})'.format(stage, s['p50'] * 1e3,
+                                          s['p99'] * 1e3, s['count'])
+        for stage, s in stats().items()))
+
+
+if conf.LATENCY_STATS:
+    enable()
@@ -0,0 +1,145 @@
+"""Logging setup, off the hot path.
+
+`configure()` points the root logger at a queue and writes the records to
+the console (and conf.LOG_FILE) from a listener thread, so a handler only
+pays for enqueueing a record.  The queue is a multiprocessing one: the
+OSC server and table worker processes are handed `child_config()` and
+`attach()` to it, so they log through it however they were started
+(spawned processes don't inherit the handler).  Levels are set per
+subsystem from conf.LOG_LEVELS, e.g. {'battleship.osc': 'DEBUG'}, and
+conf.LOG_STRUCTURED writes JSON lines.
+
+High-rate events, like every OSC message received and sent, are logged
+through an `Event`, which logs one in conf.LOG_SAMPLING[name] of them at
+debug level along with their fields, and returns right away when debug
+is off for its logger.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import multiprocessing
+import os
+from battleship import conf
+
+_listener = None
+# the process that started the listener, children log through its queue
+_pid = None
+# (level, levels) set by configure, for the children
+_levels = None
+
+
+class Event:
+    """A high-rate debug event `name` on `logger`, sampled one in `every`
+    (by default conf.LOG_SAMPLING[name], or all of them)."""
+    def __init__(self, logger, name, every=None):
+        self.logger = logger
+        self.name = name
+        if every is None:
+            every = conf.LOG_SAMPLING.get(name, 1)
+        self.every = max(int(every), 1)
+        self.count = 0
+
+    def __call__(self, msg, *args, **fields):
+        if not self.logger.isEnabledFor(logging.DEBUG):
+            return
+        self.count += 1
+        if self.count % self.every:
+            return
+        self.logger.debug(msg, *args, stacklevel=2, extra=dict(
+            event=self.name, fields=fields, sampled=self.every))
+
+
+class JsonFormatter(logging.Formatter):
+    """A record as a JSON line, with the fields of an `Event`."""
+    def format(self, record):
+        entry = dict(time=record.created, level=record.levelname,
+                     process=record.process, logger=record.name,
+                     func=record.funcName, message=record.getMessage())
+        event = getattr(record, 'event', None)
+        if event is not None:
+            entry.update(event=event, sampled=record.sampled,
+                         **record.fields)
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=repr)
+
+
+def set_levels(level=conf.LOG_LEVEL, levels=conf.LOG_LEVELS):
+    """Sets the root logger to `level` and loggers by name to `levels`."""
+    logging.getLogger().setLevel(level)
+    for name, name_level in levels.items():
+        logging.getLogger(name).setLevel(name_level)
+
+
+def handlers(log_file=conf.LOG_FILE, structured=conf.LOG_STRUCTURED):
+    """The handlers the listener writes the records to."""
+    formatter = (JsonFormatter() if structured
+                 else logging.Formatter(conf.LOG_FORMAT))
+    targets = [logging.StreamHandler()]
+    if log_file is not None:
+        targets.append(logging.FileHandler(log_file))
+    for handler in targets:
+        handler.setFormatter(formatter)
+    return targets
+
+
+def configure(level=conf.LOG_LEVEL, levels=conf.LOG_LEVELS,
+              log_file=conf.LOG_FILE, structured=conf.LOG_STRUCTURED):
+    """Logs through a queue to the `handlers`, replacing the handlers of
+    the root logger and a listener started before."""
+    global _listener, _pid, _levels
+    stop()
+    log_queue = multiprocessing.Queue()
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    set_levels(level, levels)
+    _levels = level, levels
+    _listener = logging.handlers.QueueListener(
+        log_queue, *handlers(log_file, structured),
+        respect_handler_level=True)
+    _pid = os.getpid()
+    _listener.start()
+    # stopped before multiprocessing closes the queue at exit
+    atexit.unregister(stop)
+    atexit.register(stop)
+    return _listener
+
+
+def child_config():
+    """What a child process needs to log through this process' listener,
+    None if it isn't configured.  Picklable, to pass to the process."""
+    if _listener is None:
+        return None
+    return _listener.queue, _levels
+
+
+def attach(config):
+    """Logs through the queue of `config` (see `child_config`) in a
+    child process, in place of any handlers it has."""
+    if config is None:
+        return
+    log_queue, (level, levels) = config
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    set_levels(level, levels)
+
+
+def stop():
+    """Writes out the records queued and stops the listener."""
+    global _listener
+    if _listener is None or _pid != os.getpid():
+        return
+    listener, _listener = _listener, None
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        if isinstance(handler, logging.handlers.QueueHandler):
+            root.removeHandler(handler)
@@ -1,16 +1,199 @@
 """Simple MIDI controller.
 
-All triggers are NoteOn messages.
+All triggers are NoteOn messages.  They are sent from a dedicated thread,
+so board logic never waits on the MIDI driver: bursts are drained from a
+queue in batches, redundant starts and stops are coalesced and sending can
+be paced so that a game reset doesn't flood the receiving end.
+
+The output is a pluggable backend, opened on first use rather than on
+import: rtmidi for the installation, null and recording for tests, workers
+and benchmarks without MIDI hardware.
 """
-import rtmidi2
-from battleship import conf
+import atexit
+import collections
+import threading
+import time
+from battleship import conf, latency
+
+
+class Backend:
+    """Where the note-ons end up."""
+    def send_noteon(self, channel, pitch, velocity):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class RtMidiBackend(Backend):
+    """Sends to the first output port matching `driver_name`."""
+    def __init__(self, driver_name=conf.MIDI_DRIVER_NAME):
+        import rtmidi2
+        self.out = rtmidi2.MidiOut()
+        self.out.open_port(self.out.ports_matching(driver_name)[0])
+
+    def send_noteon(self, channel, pitch, velocity):
+        self.out.send_noteon(channel, pitch, velocity)
+
+    def close(self):
+        self.out.close_port()
+
+
+class NullBackend(Backend):
+    """Drops everything."""
+    def send_noteon(self, channel, pitch, velocity):
+        pass
+
+
+class RecordingBackend(Backend):
+    """Keeps (timestamp, channel, pitch, velocity) events in memory."""
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.events = []
+
+    def send_noteon(self, channel, pitch, velocity):
+        self.events.append((self.clock(), channel, pitch, velocity))
+
+
+BACKENDS = {'rtmidi': RtMidiBackend,
+            'null': NullBackend,
+            'recording': RecordingBackend}
+
+_backend = None
+
+# start and stop of a pitch toggle the same loop, only the last one matters
+_LOOP_CHANNELS = frozenset(conf.MIDI_CHANNELS[ch] for ch in ('start', 'stop'))
+
+
+def coalesce(batch):
+    """Drops the messages of a batch that a later one makes redundant.
 
-OUT = rtmidi2.MidiOut()
-OUT.open_port(OUT.ports_matching(conf.MIDI_DRIVER_NAME)[0])
+    Of a run of start/stop messages for a pitch, with no other message for
+    the pitch in between, only the last one is kept, in its place.
+    Messages on other channels, like crush which toggles, are all kept in
+    order, and so is the loop state they were sent in."""
+    kept, loop_next = [], set()
+    for message in reversed(batch):
+        channel, pitch = message[:2]
+        if channel not in _LOOP_CHANNELS:
+            loop_next.discard(pitch)
+        elif pitch not in loop_next:
+            loop_next.add(pitch)
+        else:
+            continue
+        kept.append(message)
+    kept.reverse()
+    return kept
+
+
+class Sender(threading.Thread):
+    """Sends note-ons on its own thread.
+
+    `put` only appends to a deque (atomic under the GIL, no lock taken) and
+    sets an event, the thread drains up to `batch_size` messages at a time,
+    coalesces them and sends them with `pacing` seconds in between.  The
+    messages taken off the deque and sent are counted under `_done`, so
+    `flush` knows what is still to send from them and the deque's length."""
+    name = 'battleship_midi_sender'
+    daemon = True
+
+    def __init__(self, out, batch_size=conf.MIDI_BATCH_SIZE,
+                 pacing=conf.MIDI_PACING):
+        super().__init__()
+        self.out = out
+        self.batch_size = batch_size
+        self.pacing = pacing
+        self._queue = collections.deque()
+        self._wakeup = threading.Event()
+        # messages taken off the queue and sent, both under _done
+        self._popped, self._taken = 0, 0
+        self._done = threading.Condition()
+
+    def put(self, channel, pitch, velocity):
+        self._queue.append((channel, pitch, velocity))
+        self._wakeup.set()
+
+    def flush(self, timeout=None):
+        """Waits until everything queued so far has been sent."""
+        with self._done:
+            queued = self._popped + len(self._queue)
+            return self._done.wait_for(lambda: self._taken >= queued,
+                                       timeout)
+
+    def run(self):
+        queue, popleft = self._queue, self._queue.popleft
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            while queue:
+                with self._done:
+                    batch = [popleft()
+                             for _ in range(min(len(queue), self.batch_size))]
+                    self._popped += len(batch)
+                for message in coalesce(batch):
+                    self.out.send_noteon(*message)
+                    if self.pacing:
+                        time.sleep(self.pacing)
+                with self._done:
+                    self._taken += len(batch)
+                    self._done.notify_all()
+
+
+_sender = None
+_lock = threading.Lock()
+
+
+def backend():
+    """The output backend, `conf.MIDI_BACKEND` opened on first use."""
+    global _backend
+    if _backend is None:
+        with _lock:
+            if _backend is None:
+                _backend = BACKENDS[conf.MIDI_BACKEND]()
+    return _backend
+
+
+def set_backend(new_backend):
+    """Replaces the output backend, by instance or by name."""
+    global _backend
+    if isinstance(new_backend, str):
+        new_backend = BACKENDS[new_backend]()
+    with _lock:
+        _backend = new_backend
+        if _sender is not None:
+            _sender.out = new_backend
+    return new_backend
+
+
+def sender():
+    """The running sender thread, started on first use."""
+    global _sender
+    if _sender is None:
+        out = backend()
+        with _lock:
+            if _sender is None:
+                thread = Sender(out)
+                thread.start()
+                _sender = thread
+                # the thread is a daemon, send what is left before exit
+                atexit.register(flush)
+    return _sender
+
+
+def flush(timeout=conf.MIDI_FLUSH_TIMEOUT):
+    """Waits until the note-ons queued so far have been sent, if there is
+    a sender thread."""
+    if _sender is None:
+        return True
+    return _sender.flush(timeout)
 
 
 def send_noteon(ch, pitch, velocity=127):
-    OUT.send_noteon(conf.MIDI_CHANNELS[ch], pitch, 127)
+    latency.mark('midi')
+    if conf.MIDI_SENDER_THREAD:
+        sender().put(conf.MIDI_CHANNELS[ch], pitch, velocity)
+    else:
+        backend().send_noteon(conf.MIDI_CHANNELS[ch], pitch, velocity)
 
 
 def start(pitch):
@@ -23,3 +206,9 @@ def stop(pitch):
 
 def crush(pitch):
     send_noteon('crush', pitch)
+
+
+def sink(pitch):
+    """Only sent if a 'sink' channel is configured."""
+    if 'sink' in conf.MIDI_CHANNELS:
+        send_noteon('sink', pitch)
@@ -1,26 +1,84 @@
+import asyncio
+import functools
 import logging
 import multiprocessing
 import socket
+import struct
 import sys
-from pythonosc import dispatcher, osc_server, udp_client, osc_message_builder
-from battleship import conf
+import time
+from pythonosc import (dispatcher, osc_server, udp_client, osc_message_builder,
+                       osc_packet)
+from battleship import conf, latency, logs
 
 logger = logging.getLogger(__name__)
+# every message received and sent, sampled (see conf.LOG_SAMPLING)
+_rx = logs.Event(logger, 'osc_rx')
+_tx = logs.Event(logger, 'osc_tx')
+
+
+def _osc_string(string):
+    """Null terminated and padded to a multiple of 4 bytes."""
+    encoded = string.encode()
+    return encoded + b'\0' * (4 - len(encoded) % 4)
+
+
+class MessageTemplate:
+    """An OSC message with a fixed address and a fixed number of int32
+    arguments.  The address and type tags are encoded once, `pack` only
+    writes the arguments into the reused datagram buffer."""
+    __slots__ = ('address', 'params', 'dgram', '_offset', '_struct')
+
+    def __init__(self, address, n_args):
+        head = _osc_string(address) + _osc_string(',' + 'i' * n_args)
+        self.address = address
+        self.params = ()
+        self._offset = len(head)
+        self._struct = struct.Struct('>{}i'.format(n_args))
+        self.dgram = bytearray(head) + bytes(self._struct.size)
+
+    def pack(self, *args):
+        self._struct.pack_into(self.dgram, self._offset, *args)
+        self.params = args
+        return self
 
 
 class Client(udp_client.UDPClient):
-    def __init__(self, host, port, topic_mapping=conf.OSC_TOPICS):
+    def __init__(self, host, port, topic_mapping=conf.OSC_TOPICS,
+                 delta=conf.OSC_DELTA_BOARDS,
+                 cells_mapping=conf.OSC_BOARD_CELLS,
+                 resync_interval=conf.OSC_RESYNC_INTERVAL):
         super().__init__(host, port)
         self.topic_mapping = topic_mapping
+        self.delta = delta
+        self.cells_mapping = cells_mapping
+        self.resync_interval = resync_interval
+        # last board values sent by topic, with the time of the full send
+        self._boards = {}
+        # message templates by (osc address, number of arguments)
+        self._templates = {}
+        self._lights = {topic: self.template(topic, 1)
+                        for topic in ('ready_light', 'ready', 'turn_light')
+                        if topic in topic_mapping}
 
     def message_builder(self, topic):
         osc_address = self.topic_mapping[topic][1]
         return osc_message_builder.OscMessageBuilder(osc_address)
 
+    def template(self, topic, n_args, osc_address=None):
+        """The cached template for `n_args` arguments on `topic`."""
+        if osc_address is None:
+            osc_address = self.topic_mapping[topic][1]
+        key = osc_address, n_args
+        template = self._templates.get(key)
+        if template is None:
+            template = self._templates[key] = MessageTemplate(*key)
+        return template
+
     def send(self, msg):
         """adds logging"""
-        logger.debug('OSC TX <%s> on <%s> %s',
-                     (self._address, self._port), msg.address, msg.params)
+        latency.mark('osc_send')
+        _tx('OSC TX <%s:%s> on <%s> %s', self._address, self._port,
+            msg.address, msg.params)
         try:
             return super().send(msg)
         except socket.gaierror as e:
@@ -28,53 +86,134 @@ class Client(udp_client.UDPClient):
             sys.exit(1)
 
     def confirmation_button(self, on=True):
-        mb = self.message_builder('ready_light')
-        mb.add_arg(0 if on else -2)
-        self.send(mb.build())
+        self.send(self._lights['ready_light'].pack(0 if on else -2))
 
     def confirmation_value(self, on=True):
-        mb = self.message_builder('ready')
-        mb.add_arg(1 if on else 0)
-        self.send(mb.build())
+        self.send(self._lights['ready'].pack(1 if on else 0))
 
     def turn_led(self, on=True):
-        mb = self.message_builder('turn_light')
-        mb.add_arg(0 if on else -2)
-        self.send(mb.build())
+        self.send(self._lights['turn_light'].pack(0 if on else -2))
 
     def send_board(self, board, topic):
-        mb = self.message_builder(topic)
-        for tile in board.tiles:
-            mb.add_arg(conf.LEMUR_UI_BOARDS[topic][tile.current])
-        msg = mb.build()
+        values = board.ui_vector(topic)
+        if self.delta:
+            return self._send_board_cells(values, topic)
+        return self._send_board_full(values, topic)
+
+    def resync(self):
+        """Forget the boards sent so far, the next ones are sent in full."""
+        self._boards.clear()
+
+    def _send_board_full(self, values, topic):
+        msg = self.template(topic, len(values)).pack(*values)
+        self.send(msg)
+        self._boards[topic] = values, time.monotonic()
+        return msg
+
+    def _send_board_cells(self, values, topic):
+        """Sends only the cells that changed since the last board on this
+        topic as (index, value) pairs, falls back to a full board when there
+        is nothing to diff against, too much changed or a resync is due."""
+        sent = self._boards.get(topic)
+        if sent is None or len(sent[0]) != len(values) or \
+                time.monotonic() - sent[1] > self.resync_interval:
+            return self._send_board_full(values, topic)
+        last_values, synced = sent
+        # boards hand out the same values until a tile changes
+        if values is last_values:
+            return None
+        changed = [i for i, (value, last_value)
+                   in enumerate(zip(values, last_values))
+                   if value != last_value]
+        if not changed:
+            return None
+        if len(changed) * 2 >= len(values):
+            return self._send_board_full(values, topic)
+        args = []
+        for i in changed:
+            args += i, values[i]
+        template = self.template(topic, len(args), self.cells_mapping[topic])
+        msg = template.pack(*args)
         self.send(msg)
+        self._boards[topic] = values, synced
         return msg
 
 
+class NullClient:
+    """Stands in for the ui of a player without one, e.g. the computer."""
+    def send(self, msg):
+        pass
+
+    def confirmation_button(self, on=True):
+        pass
+
+    def confirmation_value(self, on=True):
+        pass
+
+    def turn_led(self, on=True):
+        pass
+
+    def send_board(self, board, topic):
+        pass
+
+    def resync(self):
+        pass
+
+
 class Server(multiprocessing.Process):
     name = 'battleship_osc_server'
     daemon = True
 
-    def __init__(self, server_address, queue, topic_mapping=conf.OSC_TOPICS):
+    def __init__(self, server_address, queue, topic_mapping=conf.OSC_TOPICS,
+                 shared_state=None, client_address=None):
         super().__init__()
         self.server_address = server_address
+        self.topic_mapping = topic_mapping
+        # drops input the game would ignore, see battleship.sharedstate
+        self.shared_state = shared_state
+        # the player's ui, to revert dropped fire on
+        self.client_address = client_address
+        self._client = None
+        self.dropped = 0
         # map all the topics to osc_addresses
         self.dispatcher = dispatcher.Dispatcher()
         for topic, osc_addresses in topic_mapping.items():
             osc_address = osc_addresses[0]
-            self.dispatcher.map(osc_address, self._enqueue, osc_address, topic)
+            self.dispatcher.map(osc_address, functools.partial(
+                self._enqueue, osc_address, topic))
         self._queue = queue
         self._last_message = None
+        self.log_config = logs.child_config()
 
-    def _enqueue(self, args, *msg):
+    def _enqueue(self, osc_addr, topic, address, *msg):
         if msg != self._last_message:
             self._last_message = msg
-            osc_addr, topic = args
-            logger.debug('OSC RX <%s> on <%s> %s',
-                         self.server_address, osc_addr, msg)
-            self._queue.put((self.server_address, topic, msg))
+            _rx('OSC RX <%s> on <%s> %s', self.server_address, osc_addr,
+                msg, topic=topic)
+            if self.shared_state is not None and not self.shared_state.admit(
+                    self.server_address[1], topic, msg):
+                self._drop(topic)
+                return
+            self._queue.put((self.server_address, topic, msg) +
+                            latency.stamp())
+
+    def _drop(self, topic):
+        """The game would have published the board fired at, reverting the
+        switch pressed in the player's ui, so that is done here."""
+        self.dropped += 1
+        logger.debug('dropped %s message, %i so far', topic, self.dropped)
+        if topic != 'them' or self.client_address is None:
+            return
+        values = self.shared_state.them_vector(self.server_address[1])
+        if values is None:
+            return
+        if self._client is None:
+            self._client = Client(*self.client_address, self.topic_mapping)
+        self._client.send(
+            self._client.template('them', len(values)).pack(*values))
 
     def run(self):
+        logs.attach(self.log_config)
         logger.info('starting osc server')
         server = osc_server.BlockingOSCUDPServer(self.server_address,
                                                  self.dispatcher)
@@ -84,3 +223,135 @@ class Server(multiprocessing.Process):
             server.shutdown()
         finally:
             server.server_close()
+
+
+class InputStage:
+    """Coalesces bursts of messages before they are handled.
+
+    A message on one of the `topics` is held for up to `window` seconds per
+    player and topic, newer ones replacing it, so a drag across the board
+    is handled as its latest vector every `window` and once more at the
+    end.  Any other message first hands over the messages held, to keep
+    the order.  A window of 0 passes everything straight through."""
+    def __init__(self, handler, window=conf.OSC_COALESCE_WINDOW,
+                 topics=conf.OSC_COALESCE_TOPICS,
+                 stats_interval=conf.OSC_INPUT_STATS_INTERVAL,
+                 clock=time.monotonic):
+        self.handler = handler
+        self.window = window
+        self.topics = frozenset(topics)
+        self.stats_interval = stats_interval
+        self.clock = clock
+        # (deadline, message) by (server address, topic)
+        self._held = {}
+        self.received = self.handled = self.coalesced = 0
+        self.queue_depth = self.max_queue_depth = 0
+        self._logged = clock()
+
+    def put(self, message):
+        self.received += 1
+        key = message[:2]
+        if not self.window or key[1] not in self.topics:
+            self.flush()
+            self._handle(message)
+            return
+        held = self._held.get(key)
+        if held is None:
+            self._held[key] = self.clock() + self.window, message
+        else:
+            self.coalesced += 1
+            self._held[key] = held[0], message
+
+    def next_due(self):
+        """Seconds until a held message is due, None if none is held."""
+        if not self._held:
+            return None
+        deadline = min(deadline for deadline, _ in self._held.values())
+        return max(0, deadline - self.clock())
+
+    def flush_due(self):
+        now = self.clock()
+        for key, (deadline, message) in list(self._held.items()):
+            if deadline <= now:
+                del self._held[key]
+                self._handle(message)
+
+    def flush(self):
+        held, self._held = self._held, {}
+        for _, message in held.values():
+            self._handle(message)
+
+    def _handle(self, message):
+        self.handled += 1
+        self.handler(message)
+        if self.clock() - self._logged > self.stats_interval:
+            self._logged = self.clock()
+            logger.info('input stage: %s', self.stats())
+
+    def is_holding(self, port):
+        """Whether a message received on `port` is held."""
+        return any(address[1] == port for address, _ in self._held)
+
+    def observe_queue(self, depth):
+        """Notes the depth of the queue the messages are taken from."""
+        self.queue_depth = depth
+        self.max_queue_depth = max(self.max_queue_depth, depth)
+
+    def stats(self):
+        return dict(received=self.received, handled=self.handled,
+                    coalesced=self.coalesced, held=len(self._held),
+                    queue_depth=self.queue_depth,
+                    max_queue_depth=self.max_queue_depth)
+
+
+class AsyncServer(asyncio.DatagramProtocol):
+    """Receives a player's OSC messages on an asyncio event loop and hands
+    them to `handler` in-process, in the same form `Server` queues them."""
+
+    def __init__(self, server_address, handler, topic_mapping=conf.OSC_TOPICS):
+        self.server_address = server_address
+        self.handler = handler
+        self.topics = {osc_addresses[0]: topic
+                       for topic, osc_addresses in topic_mapping.items()}
+        self.transport = None
+        self._last_message = None
+
+    @classmethod
+    async def create(cls, server_address, handler, **kwargs):
+        """Binds a server to `server_address` on the running loop."""
+        loop = asyncio.get_running_loop()
+        _, server = await loop.create_datagram_endpoint(
+            lambda: cls(server_address, handler, **kwargs),
+            local_addr=server_address)
+        return server
+
+    def connection_made(self, transport):
+        logger.info('starting async osc server on %s', self.server_address)
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        stamp = latency.stamp()
+        try:
+            packet = osc_packet.OscPacket(data)
+        except osc_packet.ParseError as e:
+            logger.warning('OSC RX <%s> unparsable datagram from %s: %s',
+                           self.server_address, addr, e)
+            return
+        for timed_message in packet.messages:
+            message = timed_message.message
+            topic = self.topics.get(message.address)
+            if topic is not None:
+                self._enqueue(message.address, topic, tuple(message.params),
+                              stamp)
+
+    def _enqueue(self, osc_addr, topic, msg, stamp=()):
+        # topics of several tables may share the port, so dedupe with them
+        if (topic, msg) != self._last_message:
+            self._last_message = topic, msg
+            _rx('OSC RX <%s> on <%s> %s', self.server_address, osc_addr,
+                msg, topic=topic)
+            self.handler((self.server_address, topic, msg) + stamp)
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
@@ -0,0 +1,144 @@
+"""Allocation of the midi pitches that play the deck loops.
+
+Every deck on the boards of a game plays the loop of its own pitch.  A
+`PitchPool` hands them out from free lists kept in insertion order, so
+taking the pitch freed longest ago and freeing one are O(1) and the same
+game always sounds the same.  Policies pick the free list a deck takes
+from:
+
+    lru      one list over the whole range
+    player   the range split between the players, in board order
+    ship     the range split into loop groups by ship size
+
+A deck whose list is empty borrows from the next list with a free pitch,
+and when the whole range is playing it takes over the loop that has been
+playing longest (voice stealing) instead of staying silent.
+"""
+import collections
+import logging
+from battleship import conf
+
+logger = logging.getLogger(__name__)
+
+POLICIES = ('lru', 'player', 'ship')
+
+
+def split(pitches, weights):
+    """Consecutive runs of `pitches`, by key, sized in proportion to the
+    `weights` (a dict, in order)."""
+    pitches, total = list(pitches), sum(weights.values())
+    runs, start, acc = {}, 0, 0
+    for key, weight in weights.items():
+        acc += weight
+        end = round(len(pitches) * acc / total) if total else 0
+        runs[key] = pitches[start:end]
+        start = end
+    return runs
+
+
+class PitchPool:
+    """The pitches of `pitch_range` shared by the boards of a game."""
+    def __init__(self, pitch_range=conf.MIDI_PITCH_RANGE,
+                 policy=conf.MIDI_PITCH_POLICY, ship_spec=conf.SHIP_SPEC,
+                 groups=conf.MIDI_PITCH_GROUPS, players=2):
+        if policy not in POLICIES:
+            raise ValueError('unknown pitch policy: {}'.format(policy))
+        self.policy = policy
+        if policy == 'lru':
+            groups = {None: pitch_range}
+        elif policy == 'player':
+            groups = split(pitch_range, dict.fromkeys(range(players), 1))
+        elif groups is None:
+            # room for every deck of a size in its group
+            groups = split(pitch_range, {size: size * qty
+                                         for size, qty in sorted(ship_spec)})
+        # free pitches by group, the one freed longest ago first
+        self._free = {key: collections.OrderedDict.fromkeys(pitches)
+                      for key, pitches in groups.items()}
+        self._group = {pitch: key for key, pitches in groups.items()
+                       for pitch in pitches}
+        # (board, tile) by pitch playing, the one taken longest ago first
+        self._active = collections.OrderedDict()
+        self._boards = {}
+        self.total = len(self._group)
+        self.peak = self.borrowed = self.stolen = 0
+
+    def __len__(self):
+        """The number of free pitches."""
+        return self.total - len(self._active)
+
+    def join(self, board):
+        """Registers a board, players' ranges go by the order they join."""
+        self._boards.setdefault(board, len(self._boards))
+
+    def _key(self, board, size):
+        if self.policy == 'player':
+            return self._boards.get(board, 0) % len(self._free)
+        if self.policy == 'ship':
+            return size
+        return None
+
+    def take(self, board, tile, size=None):
+        """A pitch for `tile` of `board`, `size` the size of its ship.
+        None if there are no pitches at all."""
+        free = self._free.get(self._key(board, size))
+        if not free:
+            free = next((pitches for pitches in self._free.values()
+                         if pitches), None)
+            if free is not None:
+                self.borrowed += 1
+        if free is not None:
+            pitch, _ = free.popitem(last=False)
+        elif self._active:
+            pitch = self._steal()
+        else:
+            return None
+        self._active[pitch] = board, tile
+        self.peak = max(self.peak, len(self._active))
+        logger.debug('pitch %i to tile %i, %i free', pitch, tile, len(self))
+        return pitch
+
+    def _steal(self):
+        pitch, (board, tile) = self._active.popitem(last=False)
+        self.stolen += 1
+        logger.info('pitch range exhausted, taking over pitch %i of tile %i',
+                    pitch, tile)
+        board.pitch_stolen(tile)
+        return pitch
+
+    def misplaced(self, pitch, board, size=None):
+        """Whether a deck playing `pitch` should move to the group it
+        would take from now, because that one has a free pitch."""
+        key = self._key(board, size)
+        return self._group.get(pitch) != key and bool(self._free.get(key))
+
+    def claim(self, pitch, board, tile):
+        """Takes a particular free pitch, e.g. for a restored tile."""
+        free = self._free.get(self._group.get(pitch))
+        if free is None or pitch not in free:
+            raise ValueError('pitch {} is not free'.format(pitch))
+        del free[pitch]
+        self._active[pitch] = board, tile
+        self.peak = max(self.peak, len(self._active))
+
+    def free(self, pitch):
+        """Gives a pitch back, last in line to be taken again."""
+        if self._active.pop(pitch, None) is None:
+            return
+        self._free[self._group[pitch]][pitch] = None
+        logger.debug('pitch %i freed, %i free', pitch, len(self))
+
+    def free_pitches(self):
+        """The free pitches by group, in the order they will be taken."""
+        return {key: list(pitches) for key, pitches in self._free.items()}
+
+    def occupancy(self):
+        """The share of the range playing."""
+        return len(self._active) / self.total if self.total else 1.0
+
+    def stats(self):
+        """Occupancy, and how often a deck had to borrow from another
+        group or steal a playing pitch."""
+        return dict(total=self.total, playing=len(self._active),
+                    occupancy=self.occupancy(), peak=self.peak,
+                    borrowed=self.borrowed, stolen=self.stolen)
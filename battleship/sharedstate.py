@@ -0,0 +1,198 @@
+"""Game state shared with the OSC server processes.
+
+The game process publishes the game and turn, the players' states and
+their tile states into a `multiprocessing.shared_memory` block after every
+message it handles.  The server processes read it in place to drop input
+that can't change anything before it is queued: fire from a player whose
+turn it isn't or at tiles already fired at, and anything while a game
+that just ended is ignoring the ui.
+
+There is one writer, the game process, guarded by a sequence lock: the
+sequence number is odd while a write is in progress, readers retry when
+it is odd or changed while they were reading, and give up (admitting the
+message) rather than wait for it.  The block lags behind the queue, so
+every server also counts the messages it queued per player, and input is
+only dropped once the game has caught up with every message that could
+make it valid.
+"""
+import logging
+import struct
+import time
+from multiprocessing import shared_memory
+from battleship import board, conf
+from battleship.snapshot import GAME_STATES, PLAYER_STATES
+
+logger = logging.getLogger(__name__)
+
+# sequence number, game state, turn player port (0: none or the computer),
+# time until which a game that is over ignores the ui
+HEADER = struct.Struct('<IBxHd')
+# per player, written by the game: port, state, messages handled
+PLAYER = struct.Struct('<HBxI')
+# per player, written by its server: messages queued, and of these the
+# number up to the last one that wasn't fire
+QUEUED = struct.Struct('<II')
+# attempts at a consistent read before giving up
+READ_ATTEMPTS = 100
+
+
+class SharedState:
+    """The shared block of a game between players on `ports` (0: the
+    computer) on an n x n board.  Created by the game, attached to by
+    `name` in the servers."""
+    def __init__(self, ports, n, name=None):
+        self.ports = tuple(ports)
+        self.n = n
+        # player slots are 8 byte aligned
+        self.slot_size = (PLAYER.size + QUEUED.size + n**2 + 7) // 8 * 8
+        size = HEADER.size + len(self.ports) * self.slot_size
+        self.owner = name is None
+        if self.owner:
+            self._shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+        self.name = self._shm.name
+        self.buf = self._shm.buf
+        self._slots = {port: HEADER.size + k * self.slot_size
+                       for k, port in enumerate(self.ports)}
+        self._seq = 0
+        if self.owner:
+            for port, offset in self._slots.items():
+                PLAYER.pack_into(self.buf, offset, port, 0, 0)
+        # queued and barrier counts of the server's own player
+        self._queued = self._barrier = 0
+
+    def __reduce__(self):
+        return type(self), (self.ports, self.n, self.name)
+
+    def close(self):
+        self.buf = None
+        self._shm.close()
+        if self.owner:
+            self._shm.unlink()
+
+    # game side
+
+    def publish(self, manager, handled):
+        """Writes `manager`'s game, `handled` the number of messages whose
+        effects it includes by port (ports left out keep their count)."""
+        game = manager.game
+        turn = game.turn_player
+        ignore_until = (manager.last_game_ended + conf.IGNORE_TIME_GAME_OVER
+                        if manager.last_game_ended is not None else 0)
+        buf = self.buf
+        # odd while writing
+        self._seq += 1
+        struct.pack_into('<I', buf, 0, self._seq)
+        HEADER.pack_into(buf, 0, self._seq, GAME_STATES.index(game.current),
+                         turn.port if turn is not None else 0,
+                         ignore_until)
+        for player in manager.players.values():
+            port = player.port
+            offset = self._slots[port]
+            count = handled.get(port)
+            if count is None:
+                count = PLAYER.unpack_from(buf, offset)[2]
+            PLAYER.pack_into(buf, offset, port,
+                             PLAYER_STATES.index(player.current), count)
+            start = offset + PLAYER.size + QUEUED.size
+            buf[start:start + self.n**2] = player.board.states
+        self._seq += 1
+        struct.pack_into('<I', buf, 0, self._seq)
+
+    # server side
+
+    def tiles(self, port):
+        """The tile states of `port`'s board, in place: a read is only
+        consistent while the sequence number stays the same."""
+        start = self._slots[port] + PLAYER.size + QUEUED.size
+        return self.buf[start:start + self.n**2]
+
+    def read(self):
+        """A consistent copy of the game state, (game state, turn port,
+        {port: (player state, tile states)}), or None if there was a write
+        in progress every time."""
+        for _ in range(READ_ATTEMPTS):
+            seq = struct.unpack_from('<I', self.buf, 0)[0]
+            if seq & 1:
+                continue
+            data = bytes(self.buf)
+            if struct.unpack_from('<I', self.buf, 0)[0] != seq:
+                continue
+            _, state, turn, _ = HEADER.unpack_from(data, 0)
+            players = {}
+            for port, offset in self._slots.items():
+                start = offset + PLAYER.size + QUEUED.size
+                players[port] = (
+                    PLAYER_STATES[PLAYER.unpack_from(data, offset)[1]],
+                    data[start:start + self.n**2])
+            return GAME_STATES[state], turn, players
+        return None
+
+    def admit(self, port, topic, params):
+        """Whether the message from `port` may change anything and has to
+        be queued.  Counts the ones that are, call from `port`'s server."""
+        if self._drops(port, topic, params):
+            return False
+        self._queued += 1
+        if topic != 'them':
+            self._barrier = self._queued
+        QUEUED.pack_into(self.buf, self._slots[port] + PLAYER.size,
+                         self._queued, self._barrier)
+        return True
+
+    def _drops(self, port, topic, params):
+        buf = self.buf
+        for _ in range(READ_ATTEMPTS):
+            seq, state, turn, ignore_until = HEADER.unpack_from(buf, 0)
+            if seq & 1:
+                continue
+            drop = self._invalid(port, topic, params, GAME_STATES[state],
+                                 turn, ignore_until)
+            if struct.unpack_from('<I', buf, 0)[0] == seq:
+                return drop
+        return False
+
+    def _caught_up(self, port, barrier):
+        """Whether the game handled every message of `port` up to
+        `barrier`, and every message queued by the other players."""
+        for other, offset in self._slots.items():
+            handled = PLAYER.unpack_from(self.buf, offset)[2]
+            if other == port:
+                if handled < barrier:
+                    return False
+            elif handled != QUEUED.unpack_from(
+                    self.buf, offset + PLAYER.size)[0]:
+                return False
+        return True
+
+    def _invalid(self, port, topic, params, state, turn, ignore_until):
+        if state == 'over':
+            # any message may start the next game once it's due
+            return (time.time() < ignore_until and
+                    self._caught_up(port, self._queued))
+        if topic != 'them':
+            return False
+        # the player's own fire can only make more fire invalid
+        if not self._caught_up(port, self._barrier):
+            return False
+        if turn != port:
+            return True
+        opponent = next(other for other in self.ports if other != port)
+        tiles = self.tiles(opponent)
+        return not any(param == 1 and tiles[i] in (board.SEA, board.DECK)
+                       for i, param in enumerate(params[:self.n**2]))
+
+    def them_vector(self, port):
+        """The ui values of the board `port` fires at, None if they could
+        not be read consistently."""
+        for _ in range(READ_ATTEMPTS):
+            seq = struct.unpack_from('<I', self.buf, 0)[0]
+            if seq & 1:
+                continue
+            opponent = next(other for other in self.ports if other != port)
+            values = bytes(self.tiles(opponent)).translate(
+                board.ui_table('them'))
+            if struct.unpack_from('<I', self.buf, 0)[0] == seq:
+                return values
+        return None
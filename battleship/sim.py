@@ -0,0 +1,267 @@
+"""Headless simulation.
+
+Plays complete games in-process between bots, computer players of a
+`game.Game` without a ui, and spreads bulk runs over a process pool.  The
+game's own state machine runs the turns, MIDI goes to the null backend.
+A bot is a placement strategy and a shooter strategy, both pluggable:
+
+    battleship-sim --games 100000 --workers 8 --shooter density
+"""
+import argparse
+import collections
+import itertools
+import json
+import logging
+import math
+import multiprocessing
+import random
+import time
+from battleship import bitboard, board, conf, fleet, game, geometry, midi
+
+logger = logging.getLogger(__name__)
+
+
+def fleet_sizes(ship_spec):
+    """Ship sizes of the spec, largest first."""
+    return sorted((size for size, qty in ship_spec for _ in range(qty)),
+                  reverse=True)
+
+
+class RandomPlacement:
+    """Places a uniformly random legal fleet, see `battleship.fleet`."""
+    def __init__(self, n, ship_spec, rng):
+        self.n, self.ship_spec, self.rng = n, ship_spec, rng
+
+    def layout(self):
+        return fleet.random_fleet(self.n, self.ship_spec, self.rng)
+
+    def place(self, board):
+        board.place_random_fleet(self.rng)
+
+
+class Shooter:
+    """Picks the tiles to fire at on the opponent's board.  Only sees the
+    outcome of its own shots, like a player on the 'them' view."""
+    def __init__(self, n, ship_spec, rng):
+        self.n, self.ship_spec, self.rng = n, ship_spec, rng
+        self.grid = geometry.grid(n)
+        self.unfired = set(range(n**2))
+        # unfired tiles that can still be decks, ships never touch
+        self.open = set(self.unfired)
+        self.misses, self.hits, self.sunk = set(), set(), set()
+        self.remaining = collections.Counter(fleet_sizes(ship_spec))
+
+    def shoot(self):
+        raise NotImplementedError
+
+    def observe(self, i, outcome, ship=None):
+        """`outcome` is 'miss', 'hit' or 'sunk', with the sunk ship's tiles."""
+        self.unfired.discard(i)
+        self.open.discard(i)
+        if outcome == 'miss':
+            self.misses.add(i)
+        else:
+            self.hits.add(i)
+        if outcome == 'sunk':
+            self.hits.difference_update(ship)
+            self.sunk.update(ship)
+            self.remaining[len(ship)] -= 1
+            adjacent = self.grid.neighbours
+            self.open.difference_update(j for i in ship for j in adjacent[i])
+
+
+class RandomShooter(Shooter):
+    def shoot(self):
+        return self.rng.choice(tuple(self.unfired))
+
+
+class HuntTargetShooter(Shooter):
+    """Hunts on a checkerboard parity until something is hit, then targets
+    the tiles next to the hits, in line with them once there are two."""
+    def shoot(self):
+        targets = self._targets()
+        if targets:
+            return self.rng.choice(targets)
+        n = self.n
+        parity = [i for i in self.open if (i // n + i % n) % 2 == 0]
+        return self.rng.choice(parity or tuple(self.open or self.unfired))
+
+    def _targets(self):
+        adjacent = self.grid.neighbours
+        candidates = [j for i in self.hits for j in adjacent[i]
+                      if j in self.open]
+        if len(self.hits) > 1:
+            rows = {i // self.n for i in self.hits}
+            cols = {i % self.n for i in self.hits}
+            in_line = [j for j in candidates
+                       if (len(rows) == 1 and j // self.n in rows) or
+                       (len(cols) == 1 and j % self.n in cols)]
+            candidates = in_line or candidates
+        return candidates
+
+
+class DensityShooter(Shooter):
+    """Fires at the tile covered by the most placements of the remaining
+    ships that agree with what is known, hits weigh in heavily."""
+    hit_weight = 20
+
+    def shoot(self):
+        adjacent = self.grid.neighbours
+        excluded = self.misses | self.sunk
+        excluded.update(j for i in self.sunk for j in adjacent[i])
+        density = collections.Counter()
+        for size, qty in self.remaining.items():
+            if qty <= 0:
+                continue
+            for ship in self.grid.lines(size):
+                if not excluded.isdisjoint(ship):
+                    continue
+                hits = len(self.hits.intersection(ship))
+                for i in ship:
+                    density[i] += qty * (1 + self.hit_weight * hits)
+        tiles = self.open or self.unfired
+        best = max(density[i] for i in tiles)
+        return self.rng.choice([i for i in tiles if density[i] == best])
+
+
+def _ai_shooter(n, ship_spec, rng):
+    from battleship import ai
+    return ai.Shooter(n, ship_spec, rng)
+
+
+BOARDS = {'board': board.Board,
+          'bits': bitboard.BitBoard}
+PLACEMENTS = {'random': RandomPlacement}
+SHOOTERS = {'random': RandomShooter,
+            'hunt': HuntTargetShooter,
+            'density': DensityShooter,
+            'ai': _ai_shooter}
+
+
+class Bot(game.ComputerPlayer):
+    """A computer player that places its fleet and shoots with the
+    strategies given.  The outcome of a shot is handed to the shooter
+    before the next one, nobody else fires at the opponent's board."""
+    def __init__(self, placement, shooter, rng):
+        super().__init__()
+        self.rng = rng
+        self.placement, self.shooter = placement, shooter
+        self.shots, self._fired = 0, None
+
+    def place_fleet(self, new_board):
+        self.placement.place(new_board)
+
+    def shoot(self):
+        if self._fired is not None:
+            self._observe(self._fired)
+        self._fired = self.shooter.shoot()
+        self.shots += 1
+        return self._fired
+
+    def _observe(self, i):
+        target = self.opponent.board
+        if target.tiles[i].isstate('miss'):
+            self.shooter.observe(i, 'miss')
+        elif target.is_sunk(i):
+            self.shooter.observe(i, 'sunk', target.ship(i))
+        else:
+            self.shooter.observe(i, 'hit')
+
+
+def play(n=conf.BOARD_SIZE, ship_spec=conf.SHIP_SPEC, placement='random',
+         shooter='hunt', board_core='board', rng=random):
+    """Plays one game between two identical bots.  Like the installation,
+    a miss passes the turn and a hit shoots again.  Returns the index of
+    the winner and the number of shots each bot fired."""
+    bots = [Bot(PLACEMENTS[placement](n, ship_spec, rng),
+                SHOOTERS[shooter](n, ship_spec, rng), rng) for _ in range(2)]
+    for bot, opponent in itertools.permutations(bots):
+        bot.opponent = opponent
+    match = game.Game(dict(enumerate(bots)), board_size=n,
+                      ship_spec=ship_spec, board_class=BOARDS[board_core])
+    match.turn_player = bots[0]
+    match.play()
+    while not match.isstate('over'):
+        bot = match.turn_player
+        target = bot.opponent.board
+        tile = target.tiles[bot.shoot()]
+        tile.fire()
+        if tile.isstate('miss'):
+            match.turn()
+        elif target.all_ships_destroyed():
+            match.stop()
+    return bots.index(match.turn_player), [bot.shots for bot in bots]
+
+
+def _play_many(args):
+    n_games, seed, kwargs = args
+    midi.set_backend('null')
+    rng = random.Random(seed)
+    lengths, first_wins = collections.Counter(), 0
+    for _ in range(n_games):
+        winner, shots = play(rng=rng, **kwargs)
+        lengths[sum(shots)] += 1
+        first_wins += winner == 0
+    return lengths, first_wins
+
+
+def simulate(n_games, workers=1, seed=None, chunk_size=1000, **kwargs):
+    """Plays `n_games` over a pool of `workers` processes and reports the
+    throughput and the game length (total shots) statistics."""
+    seed = random.randrange(2**32) if seed is None else seed
+    chunks = [(min(chunk_size, n_games - start), seed + start, kwargs)
+              for start in range(0, n_games, chunk_size)]
+    started = time.perf_counter()
+    if workers > 1:
+        with multiprocessing.Pool(workers) as pool:
+            results = pool.map(_play_many, chunks)
+    else:
+        results = list(map(_play_many, chunks))
+    elapsed = time.perf_counter() - started
+    lengths, first_wins = collections.Counter(), 0
+    for chunk_lengths, chunk_first_wins in results:
+        lengths.update(chunk_lengths)
+        first_wins += chunk_first_wins
+    return dict(kwargs, games=n_games, workers=workers, seed=seed,
+                seconds=elapsed, games_per_second=n_games / elapsed,
+                first_player_wins=first_wins / n_games,
+                **length_stats(lengths))
+
+
+def length_stats(lengths):
+    """Summary of a histogram of game lengths."""
+    total = sum(lengths.values())
+    mean = sum(length * qty for length, qty in lengths.items()) / total
+    variance = sum(qty * (length - mean)**2
+                   for length, qty in lengths.items()) / total
+    percentiles, seen = {}, 0
+    for length in sorted(lengths):
+        seen += lengths[length]
+        for p in (50, 95, 99):
+            if p not in percentiles and seen >= total * p / 100:
+                percentiles[p] = length
+    return dict(shots_mean=mean, shots_stdev=math.sqrt(variance),
+                shots_min=min(lengths), shots_max=max(lengths),
+                **{'shots_p{}'.format(p): length
+                   for p, length in percentiles.items()})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--games', type=int, default=1000)
+    parser.add_argument('--workers', type=int,
+                        default=multiprocessing.cpu_count())
+    parser.add_argument('--size', type=int, default=conf.BOARD_SIZE)
+    parser.add_argument('--ships', type=json.loads, default=conf.SHIP_SPEC,
+                        help='ship spec as json, e.g. [[4, 1], [3, 2]]')
+    parser.add_argument('--placement', choices=PLACEMENTS, default='random')
+    parser.add_argument('--shooter', choices=SHOOTERS, default='hunt')
+    parser.add_argument('--board', choices=BOARDS, default='board')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args(argv)
+    logging.getLogger('battleship').setLevel(logging.WARNING)
+    stats = simulate(args.games, workers=args.workers, seed=args.seed,
+                     n=args.size, ship_spec=[tuple(s) for s in args.ships],
+                     placement=args.placement, shooter=args.shooter,
+                     board_core=args.board)
+    print(json.dumps(stats, indent=2))
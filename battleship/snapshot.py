@@ -0,0 +1,170 @@
+"""Snapshots of a table's game, to pick it up again after a restart.
+
+A snapshot is a small binary file: the game state and whose turn it is,
+then per player its port (0: the computer), state, tile states and midi
+pitches.  The ship tracker, ship index and the free midi pitches follow
+from the tiles.  It is rewritten, atomically, whenever it changes: saving
+only packs the game, a writer thread writes the latest snapshot at most
+every conf.SNAPSHOT_INTERVAL seconds.
+"""
+import logging
+import os
+import struct
+import threading
+from battleship import board, conf
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'BSSNAP1'
+GAME_STATES = ('setup', 'p1', 'p2', 'over')
+PLAYER_STATES = ('setup', 'confirmation', 'ready')
+# game state, turn player (index, 255: none), board size, players
+GAME = struct.Struct('<BBHB')
+# player port, player state
+PLAYER = struct.Struct('<HB')
+# pending instead of a snapshot, for a game that is over
+_REMOVE = b''
+
+
+def dumps(manager):
+    """The snapshot of `manager`'s game as bytes."""
+    game = manager.game
+    players = list(manager.players.values())
+    turn = (players.index(game.turn_player)
+            if game.turn_player in players else 255)
+    parts = [MAGIC, GAME.pack(GAME_STATES.index(game.current), turn,
+                              manager.board_size, len(players))]
+    for player in players:
+        parts += [PLAYER.pack(player.port,
+                              PLAYER_STATES.index(player.current)),
+                  player.board.states, bytes(player.board._pitches)]
+    return b''.join(parts)
+
+
+def loads(manager, data):
+    """Bring `manager` to the game of snapshot `data`: a new game with the
+    saved states, boards re-published and midi loops started again."""
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError('not a snapshot')
+    offset = len(MAGIC)
+    game_state, turn, n, n_players = GAME.unpack_from(data, offset)
+    offset += GAME.size
+    if n != manager.board_size:
+        raise ValueError('snapshot of a {0}x{0} board'.format(n))
+    by_port = {player.port: player for player in manager.players.values()}
+    saved = []
+    for _ in range(n_players):
+        port, state = PLAYER.unpack_from(data, offset)
+        offset += PLAYER.size
+        states, pitches = (data[offset:offset + n**2],
+                           data[offset + n**2:offset + 2 * n**2])
+        offset += 2 * n**2
+        saved.append((by_port[port], PLAYER_STATES[state], states, pitches))
+    game = manager.game = manager.new_game()
+    for player, state, states, pitches in saved:
+        player.board.recover(states, pitches)
+        player.current = state
+    game.current = GAME_STATES[game_state]
+    game.turn_player = saved[turn][0] if turn != 255 else None
+    for player, state, _, _ in saved:
+        player.client.resync()
+        player.publish_board()
+        player.client.confirmation_button(
+            on=game.isstate('setup') and state != 'setup')
+        player.client.confirmation_value(on=state == 'ready')
+        player.client.turn_led(on=player is game.turn_player)
+    return game
+
+
+class Snapshots:
+    """Keeps the snapshot of a manager's game at `path` up to date."""
+    def __init__(self, path, interval=conf.SNAPSHOT_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self._last = None
+        # the snapshot to write next, and whether one is being written
+        self._pending, self._writing = None, False
+        self._changed = threading.Condition()
+        self._hurry = threading.Event()
+        self._writer = None
+
+    def save(self, manager):
+        """Queues the snapshot for writing if it changed, returns whether
+        it did.  A game that is over is not worth restoring, its snapshot
+        is removed."""
+        if manager.game.isstate('over'):
+            if self._last is not None:
+                self._put(_REMOVE)
+            self._last = None
+            return False
+        data = dumps(manager)
+        if data == self._last:
+            return False
+        self._put(data)
+        self._last = data
+        return True
+
+    def _put(self, data):
+        with self._changed:
+            self._pending = data
+            self._changed.notify_all()
+        if self._writer is None:
+            self._writer = threading.Thread(
+                target=self._write_loop, name='battleship_snapshots',
+                daemon=True)
+            self._writer.start()
+
+    def _write_loop(self):
+        while True:
+            with self._changed:
+                self._changed.wait_for(lambda: self._pending is not None)
+                data, self._pending = self._pending, None
+                self._writing = True
+            try:
+                self._write(data)
+            except OSError as e:
+                logger.error('could not write snapshot %s: %s', self.path, e)
+            with self._changed:
+                self._writing = False
+                self._changed.notify_all()
+            self._hurry.wait(self.interval)
+
+    def _write(self, data):
+        if data == _REMOVE:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            return
+        tmp = self.path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, self.path)
+
+    def flush(self, timeout=None):
+        """Waits until the last snapshot saved has been written."""
+        self._hurry.set()
+        try:
+            with self._changed:
+                return self._changed.wait_for(
+                    lambda: self._pending is None and not self._writing,
+                    timeout)
+        finally:
+            self._hurry.clear()
+
+    def restore(self, manager):
+        """Restores the saved game, if there is one worth picking up.
+        Returns whether it did."""
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return False
+        try:
+            game = loads(manager, data)
+        except (ValueError, KeyError, IndexError, struct.error,
+                board.MisconfiguredShips) as e:
+            logger.warning('ignoring snapshot %s: %s', self.path, e)
+            return False
+        self._last = data
+        logger.info('restored game in state %s from %s', game.current,
+                    self.path)
+        return True
@@ -1,4 +1,17 @@
 import unittest
+from battleship import midi
+
+# no midi hardware needed to run the tests
+midi.set_backend('null')
+
+# a complete fleet of conf.SHIP_SPEC on a 5x5 board
+FLEET = (0, 5, 10, 15, 21, 22, 23, 14, 19, 8, 2)
+
+
+def players_conf(*ports):
+    """Players on local `ports`, their uis on the discard port."""
+    return [{'client_address': ('127.0.0.1', 9),
+             'server_address': ('127.0.0.1', port)} for port in ports]
 
 
 class BattleTest(unittest.TestCase):
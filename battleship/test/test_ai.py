@@ -0,0 +1,68 @@
+import random
+import time
+import unittest
+import numpy
+from battleship import ai, board, geometry
+
+
+class TestHeatmap(unittest.TestCase):
+    spec = ((4, 1), (3, 1), (2, 1), (1, 2))
+    rules = geometry.ship_rules(geometry.grid(5))
+
+    def test_targets_next_to_hit(self):
+        target_board = board.Board(n=5, ship_spec=self.spec)
+        for i in [5, 6, 7]:
+            target_board.add(i)
+        target_board.tiles[6].fire()
+        heat = ai.heatmap(self.rules, self.spec,
+                          *ai.knowledge(target_board, self.spec))
+        self.assertEqual(heat[6], -1)
+        self.assertIn(ai.best_tile(heat, random.Random(0)), (1, 5, 7, 11))
+
+    def test_sunk_ship_and_neighbours_blocked(self):
+        target_board = board.Board(n=5, ship_spec=self.spec)
+        target_board.add(0)
+        target_board.tiles[0].fire()
+        misses, hits, sunk, remaining = ai.knowledge(target_board, self.spec)
+        self.assertTrue(sunk[0])
+        self.assertFalse(hits.any())
+        self.assertEqual(remaining[1], 1)
+        heat = ai.heatmap(self.rules, self.spec, misses, hits, sunk, remaining)
+        self.assertEqual(list(heat[[0, 1, 5]]), [-1, -1, -1])
+
+    def test_placements_are_cached(self):
+        grid = self.rules.grid
+        self.assertIs(ai.placement_matrices(grid, self.spec),
+                      ai.placement_matrices(grid, [list(ship)
+                                                   for ship in self.spec]))
+
+    def test_hex_grid(self):
+        rules = geometry.ship_rules(geometry.grid(5, kind='hex'))
+        target_board = board.Board(n=5, ship_spec=self.spec, rules=rules)
+        for i in [6, 7]:
+            target_board.add(i)
+        target_board.tiles[6].fire()
+        heat = ai.heatmap(rules, self.spec,
+                          *ai.knowledge(target_board, self.spec))
+        self.assertIn(ai.best_tile(heat, random.Random(0)),
+                      rules.grid.neighbours[6])
+
+    def test_refuses_bent_ships(self):
+        rules = geometry.ship_rules(geometry.grid(5), bent=True)
+        with self.assertRaises(ValueError):
+            ai.warm(rules, self.spec)
+
+    def test_large_board_speed(self):
+        spec = ((5, 2), (4, 3), (3, 4), (2, 5), (1, 5))
+        rng = numpy.random.default_rng(0)
+        misses = rng.random(400) < .2
+        hits = (rng.random(400) < .05) & ~misses
+        sunk = numpy.zeros(400, dtype=bool)
+        remaining = dict(spec)
+        rules = geometry.ship_rules(geometry.grid(20))
+        ai.heatmap(rules, spec, misses, hits, sunk, remaining)
+        started = time.perf_counter()
+        for _ in range(20):
+            ai.best_tile(ai.heatmap(rules, spec, misses, hits, sunk,
+                                    remaining), rng)
+        self.assertLess((time.perf_counter() - started) / 20, .01)
@@ -0,0 +1,29 @@
+import unittest
+from battleship import bench
+
+
+class TestBench(unittest.TestCase):
+    def test_run_and_compare(self):
+        names = ['tracker_add_remove', 'osc_send_board',
+                 'handle_message_game']
+        results = bench.run(names, sizes=[5], min_time=0.001)
+        self.assertEqual(sorted(results['results']), sorted(names))
+        result = results['results']['handle_message_game']['5']
+        self.assertGreater(result['ops_per_sec'], 0)
+        self.assertGreater(result['alloc_peak_bytes'], 0)
+        baseline = {'results': {'osc_send_board': results['results'][
+            'osc_send_board']}}
+        lines = bench.compare(results, baseline)
+        self.assertEqual(len(lines), 3)
+        self.assertIn('1.00x', lines[1])
+        self.assertIn('new', lines[0])
+
+    def test_measure_allocations(self):
+        kept = []
+        result = bench.measure(lambda: kept.append([0] * 1000),
+                               min_time=0.001)
+        self.assertGreater(result['alloc_count'], 0)
+        self.assertGreater(result['alloc_bytes'], 8000)
+        self.assertGreater(result['alloc_peak_bytes'], 8000)
+        idle = bench.measure(lambda: None, min_time=0.001)
+        self.assertEqual(idle['alloc_count'], 0)
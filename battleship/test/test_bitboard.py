@@ -0,0 +1,108 @@
+import random
+import unittest
+from battleship import bitboard, board, geometry
+
+
+SPEC = [(4, 1), (3, 1), (2, 1), (1, 2)]
+
+
+class TestBitBoard(unittest.TestCase):
+    def assert_same(self, bits, ref):
+        self.assertEqual(bits.states, ref.states)
+        self.assertEqual(bits.current, ref.current)
+        self.assertEqual(bits.ship_tracker.tally(), ref.ship_tracker.tally())
+        self.assertEqual(bits.all_ships_destroyed(),
+                         ref.all_ships_destroyed())
+        self.assertEqual(str(bits), str(ref))
+
+    def test_switch_vectors_of_the_wrong_length(self):
+        bits = bitboard.BitBoard(n=5, ship_spec=SPEC)
+        ref = board.Board(n=5, ship_spec=SPEC)
+        for switches in ([1] + [0] * 23, [0] * 24 + [1, 1, 1]):
+            self.assertEqual(bits.changed_tiles(switches),
+                             ref.changed_tiles(switches))
+        self.assertEqual(ref.changed_tiles([1] + [0] * 23), [0])
+        self.assertEqual(ref.changed_tiles([0] * 24 + [1, 1, 1]), [24])
+
+    def test_square_straight_rules_only(self):
+        bitboard.BitBoard(n=5, ship_spec=SPEC,
+                          rules=geometry.ship_rules(geometry.grid(5)))
+        with self.assertRaises(ValueError):
+            bitboard.BitBoard(n=5, ship_spec=SPEC, rules=geometry.ship_rules(
+                geometry.grid(5, kind='hex')))
+
+    def test_same_as_board(self):
+        rng = random.Random(0)
+        for _ in range(50):
+            bits = bitboard.BitBoard(n=5, ship_spec=SPEC)
+            ref = board.Board(n=5, ship_spec=SPEC)
+            for _ in range(60):
+                i = rng.randrange(25)
+                if rng.random() < 0.7:
+                    self.assertEqual(bits.add(i), ref.add(i))
+                elif bits.can('remove'):
+                    self.assertEqual(bits.remove(i), ref.remove(i))
+                self.assert_same(bits, ref)
+                if ref.isstate('complete'):
+                    break
+            for i in rng.sample(range(25), 25):
+                bits.tiles[i].fire()
+                ref.tiles[i].fire()
+                self.assertEqual(bits.is_sunk(i), ref.is_sunk(i))
+                if ref.is_sunk(i):
+                    self.assertEqual(bits.ship(i), ref.ship(i))
+                self.assert_same(bits, ref)
+
+    def test_place_tiles(self):
+        bits = bitboard.BitBoard(n=5, ship_spec=SPEC)
+        ref = board.Board(n=5, ship_spec=SPEC)
+        for decks in ((),
+                      (0, 5, 10, 15, 2, 3, 4),
+                      (0, 5, 10, 15, 2, 3, 4, 21, 22, 23, 13),
+                      (2, 3, 4, 12, 17)):
+            switches = [int(i in decks) for i in range(25)]
+            bits.place_tiles(switches)
+            ref.place_tiles(switches)
+            self.assert_same(bits, ref)
+            self.assertEqual(bits.ui_vector('us'), ref.ui_vector('us'))
+
+    def test_snapshot_restore(self):
+        bits = bitboard.BitBoard(n=5, ship_spec=SPEC)
+        bits.place_random_fleet(random.Random(0))
+        snapshot = bits.snapshot()
+        states = bits.states
+        for i in range(25):
+            bits.tiles[i].fire()
+        self.assertTrue(bits.all_ships_destroyed())
+        self.assertEqual(bits.shots_fired(), 25)
+        self.assertEqual(bits.decks_afloat(), 0)
+        self.assertNotEqual(bits.snapshot(), snapshot)
+        self.assertNotIn(0, bits.ui_vector('us'))
+        bits.restore(snapshot)
+        self.assertEqual(bits.states, states)
+        self.assertEqual(bits.ui_vector('us'),
+                         states.translate(board.ui_table('us')))
+        self.assertEqual(hash(bits.snapshot()), hash(snapshot))
+        self.assertTrue(bits.isstate('complete'))
+        self.assertTrue(bits.ship_tracker.is_complete())
+        self.assertEqual(bits.decks_afloat(), 11)
+
+    def test_large_board(self):
+        bits = bitboard.BitBoard(n=12, ship_spec=[(5, 1), (1, 1)])
+        for i in (120, 121, 122, 123, 124):
+            self.assertTrue(bits.add(i))
+        # would bend the ship
+        self.assertFalse(bits.add(132))
+        self.assertTrue(bits.add(143))
+        self.assertTrue(bits.isstate('complete'))
+        self.assertEqual(bits.ship(122), range(120, 125))
+        self.assertEqual(bits.tiles[132].current, 'sea')
+
+    def test_recover(self):
+        ref = board.Board(n=5, ship_spec=SPEC)
+        ref.place_random_fleet(random.Random(1))
+        for i in range(0, 25, 3):
+            ref.tiles[i].fire()
+        bits = bitboard.BitBoard(n=5, ship_spec=SPEC)
+        bits.recover(ref.states, bytes(25))
+        self.assert_same(bits, ref)
@@ -1,5 +1,6 @@
+import random
 from itertools import chain
-from battleship import board
+from battleship import board, pitches
 from battleship import test
 
 
@@ -38,11 +39,45 @@ class TestTile(test.BattleTest):
         self.assert_tile_state('miss')
 
 
+class TestShipTracker(test.BattleTest):
+    def setUp(self):
+        self.tracker = board.ShipTracker([(4, 1), (3, 1), (2, 1), (1, 2)])
+
+    def test_grow_ship(self):
+        for size in range(1, 5):
+            self.tracker.add(size, [size - 1] if size > 1 else [])
+        self.assertEqual(self.tracker.tally(), {1: 2, 2: 1, 3: 1, 4: 0})
+        # no ships larger than 4 to grow into
+        with self.assertRaises(board.MisconfiguredShips):
+            self.tracker.add(5, [4])
+
+    def test_complete(self):
+        for size, qty in [(4, 1), (3, 1), (2, 1), (1, 2)]:
+            for _ in range(qty):
+                self.assertFalse(self.tracker.is_complete())
+                self.tracker.add(size, [])
+        self.assertTrue(self.tracker.is_complete())
+        with self.assertRaises(board.MisconfiguredShips):
+            self.tracker.add(1, [])
+
+    def test_failed_remove_is_undone(self):
+        for size, group_sizes in [(3, []), (2, []), (3, [2]), (4, []),
+                                  (2, [])]:
+            self.tracker.add(size, group_sizes)
+        tally = self.tracker.tally()
+        self.assertEqual(tally, {1: 2, 2: 0, 3: -1, 4: 0})
+        # the 2-deck piece can't be composed again, nothing larger is left
+        with self.assertRaises(board.MisconfiguredShips):
+            self.tracker.remove(3, [2])
+        self.assertEqual(self.tracker.tally(), tally)
+
+
 class TestBoard(test.BattleTest):
     def setUp(self):
         self.board = board.Board(n=5, ship_spec=[(4, 1), (3, 1),
                                                  (2, 1), (1, 2)],
-                                 midi_pitch_set=set(range(36, 57)))
+                                 pitch_pool=pitches.PitchPool(
+                                     range(36, 57)))
 
     def assert_tile_state(self, idx, state):
         super().assert_tile_state(self.board.tiles[idx], state)
@@ -113,3 +148,121 @@ class TestBoard(test.BattleTest):
         self.board.add(i)
         self.assert_tile_state(i, 'deck')
         self.assertTrue(self.board.isstate('complete'))
+
+    def test_tiles_are_views(self):
+        self.board.add(7)
+        self.assert_tile_state(7, 'deck')
+        self.assertEqual(self.board.tiles[7].current, 'deck')
+        self.assertEqual(self.board._states[7], board.DECK)
+        self.board.tiles[7].fire()
+        self.assert_tile_state(7, 'hit')
+        self.assertTrue(self.board.tiles[7].cannot('fire'))
+
+    def test_str(self):
+        self.board.add(0)
+        self.board.tiles[1].fire()
+        self.assertEqual(str(self.board).splitlines()[1], '| # o ~ ~ ~ |')
+
+    def test_cached_encodings(self):
+        us, text = self.board.ui_vector('us'), str(self.board)
+        # nothing changed, the same encodings
+        self.assertIs(self.board.ui_vector('us'), us)
+        self.assertIs(str(self.board), text)
+        # updated in place, tile by tile
+        self.board.add(6)
+        self.board.tiles[12].fire()
+        self.assertEqual(self.board.ui_vector('us'),
+                         self.board.states.translate(board.ui_table('us')))
+        self.assertEqual(self.board.ui_vector('them')[6], 0)
+        self.assertEqual(str(self.board), self.board._render())
+        self.assertEqual(us, bytes(25))
+        # states set wholesale
+        states = bytearray(25)
+        states[3] = board.HIT
+        self.board.recover(states, bytes(25))
+        self.assertEqual(self.board.ui_vector('us')[3], 3)
+        self.assertEqual(str(self.board), self.board._render())
+
+    def test_remove_splits_ship(self):
+        for i in [5, 6, 7, 8]:
+            self.board.add(i)
+        self.board.remove(6)
+        self.assert_tile_state(6, 'sea')
+        self.assertEqual(list(self.board._ships.ship(5)), [5])
+        self.assertEqual(list(self.board._ships.ship(8)), [7, 8])
+        # the pieces are a valid vertical ship and a horizontal one again
+        self.assertTrue(self.board.add(0))
+        self.assertFalse(self.board.add(3))
+
+    def test_place_tiles(self):
+        switches = [0] * 25
+        for i in chain([0, 5, 10, 15], [21, 22, 23], [14, 19], [8], [2]):
+            switches[i] = 1
+        self.board.place_tiles(switches)
+        self.assertTrue(self.board.isstate('complete'))
+        # only the changed tile is touched
+        self.assertEqual(self.board.changed_tiles(switches), [])
+        switches[2] = 0
+        self.assertEqual(self.board.changed_tiles(switches), [2])
+        # a vector of the wrong length still lines up by index
+        self.assertEqual(self.board.changed_tiles(switches[:24]), [2])
+        self.assertEqual(self.board.changed_tiles(switches + [1, 1]), [2])
+        self.board.place_tiles(switches)
+        self.assert_tile_state(2, 'sea')
+        self.assertTrue(self.board.isstate('partial'))
+        # moving a ship on a complete board removes before adding
+        switches[2] = 1
+        self.board.place_tiles(switches)
+        switches[4], switches[8] = 1, 0
+        self.board.place_tiles(switches)
+        self.assert_tile_state(4, 'deck')
+        self.assert_tile_state(8, 'sea')
+        self.assertTrue(self.board.isstate('complete'))
+
+    def test_sinking_and_game_over(self):
+        for i in chain([0, 5, 10, 15], [21, 22, 23], [14, 19], [8], [2]):
+            self.board.add(i)
+        sunk = []
+        self.board.onsunk = sunk.append
+        self.board.tiles[14].fire()
+        self.assertFalse(self.board.is_sunk(14))
+        self.assertEqual(self.board._ships.remaining(19), 1)
+        self.board.tiles[19].fire()
+        self.assertTrue(self.board.is_sunk(14))
+        self.assertEqual([list(ship) for ship in sunk], [[14, 19]])
+        self.assertFalse(self.board.all_ships_destroyed())
+        for i in chain([0, 5, 10, 15], [21, 22, 23], [8], [2]):
+            self.board.tiles[i].fire()
+        self.assertTrue(self.board.all_ships_destroyed())
+        self.assertEqual(len(sunk), 5)
+
+    def test_place_fleet(self):
+        self.board.add(12)
+        ships = [[0, 5, 10, 15], [21, 22, 23], [14, 19], [8], [2]]
+        self.board.place_fleet(ships)
+        self.assertTrue(self.board.isstate('complete'))
+        self.assert_tile_state(12, 'sea')
+        self.assertEqual(list(self.board.ship(10)), [0, 5, 10, 15])
+        self.assertEqual(list(self.board.ship(22)), [21, 22, 23])
+        self.assertEqual(len(self.board.pitch_pool), 21 - 11)
+        # the bulk loaded board plays like one placed tile by tile
+        self.board.remove(8)
+        self.assertTrue(self.board.isstate('partial'))
+        self.board.add(8)
+        for i in chain(*ships):
+            self.board.tiles[i].fire()
+        self.assertTrue(self.board.all_ships_destroyed())
+
+    def test_place_illegal_fleet(self):
+        with self.assertRaises(board.MisconfiguredShips):
+            self.board.place_fleet([[0, 1, 2, 3], [5, 6, 7], [14, 19],
+                                    [21], [23]])
+        self.assertTrue(self.board.isstate('empty'))
+
+    def test_place_random_fleet(self):
+        rng = random.Random(0)
+        for _ in range(10):
+            self.board.place_random_fleet(rng)
+            self.assertTrue(self.board.isstate('complete'))
+            self.assertEqual(self.board.states.count(board.DECK), 11)
+            self.assertEqual(len(self.board.pitch_pool), 21 - 11)
@@ -0,0 +1,113 @@
+import os
+import tempfile
+import unittest
+from battleship import board, eventlog, game
+from battleship.test import FLEET, players_conf
+
+TABLE = players_conf(6031) + [{'computer': True, 'seed': 2}]
+
+
+class TestEventLog(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.evlog')
+        os.close(fd)
+        os.unlink(self.path)
+
+    def tearDown(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def test_records_roundtrip(self):
+        log = eventlog.EventLog(self.path)
+        log.message(1, 5005, 'us', (0, 1, 1))
+        log.message(1, 5005, 'ready', (1.0,))
+        log.message(1, 5005, 'them', (300, -1))
+        log.tile(1, 5005, 'fire', 24, board.HIT)
+        log.game(1, 'play', 'p1')
+        log.player(1, 0, 'confirm', 'ready')
+        log.timeout(1)
+        log.close()
+        records = list(eventlog.read(self.path))
+        self.assertEqual([(r.kind, r.game_id, r.port, r.data)
+                          for r in records], [
+            (eventlog.MESSAGE, 1, 5005, ('us', (0, 1, 1))),
+            (eventlog.MESSAGE, 1, 5005, ('ready', (1.0,))),
+            (eventlog.MESSAGE, 1, 5005, ('them', (300, -1))),
+            (eventlog.BOARD, 1, 5005, ('fire', 24, board.HIT)),
+            (eventlog.GAME, 1, 0, ('play', 'p1')),
+            (eventlog.PLAYER, 1, 0, ('confirm', 'ready')),
+            (eventlog.TIMEOUT, 1, 0, ())])
+        # a truncated last record is skipped
+        with open(self.path, 'r+b') as f:
+            f.truncate(os.path.getsize(self.path) - 1)
+        self.assertEqual(len(list(eventlog.read(self.path))), 6)
+
+    def test_unpackable_message_dropped(self):
+        log = eventlog.EventLog(self.path, flush_interval=60)
+        with self.assertLogs('battleship.eventlog', 'WARNING'):
+            log.message(1, 5005, 'us', (2**40,))
+            log.message(1, 5005, 'us', ('on',))
+        log.message(1, 5005, 'ready', (1,))
+        # flushed on the transition, before close
+        log.game(1, 'play', 'p1')
+        self.assertEqual([r.kind for r in eventlog.read(self.path)],
+                         [eventlog.MESSAGE, eventlog.GAME])
+        log.close()
+
+    def test_not_a_log(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'something else')
+        with self.assertRaises(ValueError):
+            list(eventlog.read(self.path))
+
+    def play(self, manager):
+        manager.game = manager.new_game()
+
+        def send(topic, params):
+            manager._handle_message((('127.0.0.1', 6031), topic, params))
+        send('us', [int(i in FLEET) for i in range(25)])
+        send('ready', (1,))
+        for i in range(25):
+            if manager.game.isstate('over'):
+                break
+            if manager.game.turn_player is manager.players[6031]:
+                send('them', [int(j == i) for j in range(25)])
+        return manager
+
+    def test_record_and_replay(self):
+        log = eventlog.EventLog(self.path)
+        recorded = self.play(game.GameManager(
+            TABLE, engine='asyncio', event_log=log))
+        log.close()
+        kinds = {record.kind for record in eventlog.read(self.path)}
+        self.assertEqual(kinds, {eventlog.MESSAGE, eventlog.BOARD,
+                                 eventlog.GAME, eventlog.PLAYER,
+                                 eventlog.SEED})
+        fires = [r for r in eventlog.read(self.path)
+                 if r.kind == eventlog.BOARD and r.data[0] == 'fire']
+        self.assertTrue(fires)
+
+        replayed = game.GameManager(TABLE, engine='asyncio')
+        replayed.game = replayed.new_game()
+        self.assertGreater(eventlog.replay(self.path, replayed), 0)
+        for key in recorded.players:
+            self.assertEqual(replayed.players[key].board.states,
+                             recorded.players[key].board.states)
+        self.assertEqual(replayed.game.current, recorded.game.current)
+
+    def test_replay_random_fleets(self):
+        # auto-placed and unseeded computer fleets follow the logged seed
+        tables_conf = players_conf(6031) + [{'computer': True}]
+        log = eventlog.EventLog(self.path)
+        recorded = game.GameManager(tables_conf, engine='asyncio',
+                                    event_log=log)
+        recorded.game = recorded.new_game()
+        recorded._handle_message((('127.0.0.1', 6031), 'auto', (1,)))
+        log.close()
+        self.assertTrue(recorded.players[6031].board.isstate('complete'))
+
+        replayed = game.GameManager(tables_conf, engine='asyncio')
+        eventlog.replay(self.path, replayed)
+        for key in recorded.players:
+            self.assertEqual(replayed.players[key].board.states,
+                             recorded.players[key].board.states)
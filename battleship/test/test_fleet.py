@@ -0,0 +1,98 @@
+import collections
+import random
+import unittest
+from battleship import board, fleet
+
+
+SPEC = [(4, 1), (3, 1), (2, 1), (1, 2)]
+
+
+def old_style_layouts(n, spec):
+    """All layouts, found by placing decks on a board one by one."""
+    found = set()
+    rng = random.Random(0)
+    for _ in range(3000):
+        plyr_board = board.Board(n=n, ship_spec=spec)
+        for i in rng.sample(range(n**2), n**2):
+            plyr_board.add(i)
+            if plyr_board.isstate('complete'):
+                break
+        if plyr_board.isstate('complete'):
+            found.add(plyr_board.states)
+    return found
+
+
+class TestFleets(unittest.TestCase):
+    def test_enumerated_layouts_are_legal(self):
+        layouts = fleet.fleets(5, SPEC)
+        self.assertEqual(len(layouts.layouts), 3904)
+        for layout in layouts.layouts[::97]:
+            plyr_board = board.Board(n=5, ship_spec=SPEC)
+            plyr_board.place_fleet(layouts.tiles(layout))
+            self.assertTrue(plyr_board.isstate('complete'))
+
+    def test_small_spec_is_uniform(self):
+        layouts = fleet.Fleets(3, [(2, 1), (1, 1)])
+        self.assertEqual(len(layouts.layouts), 40)
+        rng = random.Random(0)
+        counts = collections.Counter(
+            tuple(layouts.random(rng)) for _ in range(20000))
+        self.assertEqual(len(counts), 40)
+        self.assertLess(max(counts.values()) - min(counts.values()), 200)
+
+    def test_mixed_layouts_are_close_to_uniform(self):
+        spec = [(3, 1), (2, 1), (1, 1)]
+        layouts = fleet.Fleets(4, spec, max_layouts=0)
+        self.assertIsNone(layouts.layouts)
+        rng = random.Random(0)
+        counts = collections.Counter(
+            tuple(layouts.random(rng)) for _ in range(10200))
+        self.assertEqual(len(counts), len(fleet.fleets(4, spec).layouts))
+        self.assertGreater(min(counts.values()), 8)
+        self.assertLess(max(counts.values()), 50)
+
+    def test_sampled_layouts_are_legal(self):
+        spec = [(5, 1), (4, 2), (3, 2), (2, 3), (1, 4)]
+        layouts = fleet.Fleets(10, spec, max_layouts=100)
+        self.assertIsNone(layouts.layouts)
+        rng = random.Random(0)
+        for _ in range(50):
+            ships = layouts.tiles(layouts.random(rng))
+            self.assertEqual(layouts.tiles(layouts.layout(ships)), ships)
+
+    def test_estimate(self):
+        self.assertAlmostEqual(fleet.fleets(5, SPEC).estimate(), 3904,
+                               delta=500)
+        # far over the limit, so not enumerated up to it first
+        layouts = fleet.Fleets(20, [(5, 1), (4, 1), (3, 2), (2, 1)])
+        self.assertGreater(layouts.estimate(), 1e12)
+        layouts._enumerate = None
+        self.assertIsNone(layouts.layouts)
+
+    def test_illegal_layouts(self):
+        layouts = fleet.fleets(5, [(2, 1), (1, 1)])
+        for ships in ([[0, 1], [6]],
+                      [[0, 1], [2]],
+                      [[0, 5], [6]],
+                      [[4, 5], [20]],
+                      [[0, 2], [20]],
+                      [[0, 1]],
+                      [[0, 1], [3], [20]]):
+            with self.assertRaises(ValueError, msg=ships):
+                layouts.layout(ships)
+        self.assertEqual(layouts.layout([[10], [4, 9]]), [(4, 5), (10, 1)])
+
+    def test_nth_bit(self):
+        mask = 0b1011010010
+        bits = [i for i in range(10) if mask >> i & 1]
+        self.assertEqual([fleet._nth_bit(mask, r) for r in range(5)], bits)
+
+    def test_same_layouts_as_adding_tiles(self):
+        spec = [(2, 1), (1, 2)]
+        layouts = fleet.fleets(3, spec)
+        states = set()
+        for layout in layouts.layouts:
+            plyr_board = board.Board(n=3, ship_spec=spec)
+            plyr_board.place_fleet(layouts.tiles(layout))
+            states.add(plyr_board.states)
+        self.assertEqual(states, old_style_layouts(3, spec))
@@ -0,0 +1,154 @@
+import asyncio
+import unittest
+from battleship import board, conf, game
+from battleship.test import players_conf
+
+
+class TestGameRegistry(unittest.TestCase):
+    def test_routes_by_port_and_prefix(self):
+        registry = game.GameRegistry([
+            {'players': players_conf(6001, 6002), 'prefix': '/a'},
+            {'players': players_conf(6001, 6002), 'prefix': '/b',
+             'board_size': 7},
+            {'players': players_conf(6003, 6004)}])
+        self.assertEqual(sorted(registry.games), [0, 1, 2])
+        self.assertEqual(registry.games[1].board_size, 7)
+        routes = registry.routes[('127.0.0.1', 6001)]
+        self.assertEqual(routes[0, 'us'], ('/a/us/x', '/a/us/draw'))
+        self.assertEqual(routes[1, 'us'], ('/b/us/x', '/b/us/draw'))
+        self.assertNotIn((2, 'us'), routes)
+
+    def test_shared_port_needs_prefix(self):
+        with self.assertRaises(AssertionError):
+            game.GameRegistry([{'players': players_conf(6001, 6002)},
+                               {'players': players_conf(6001, 6002)}])
+
+
+class TestPitchRanges(unittest.TestCase):
+    def test_tables_split_the_range(self):
+        registry = game.GameRegistry([
+            {'players': players_conf(6001, 6002)},
+            {'players': players_conf(6003, 6004)}])
+        ranges = [set(manager.midi_pitch_range)
+                  for manager in registry.games.values()]
+        self.assertFalse(ranges[0] & ranges[1])
+        self.assertEqual(ranges[0] | ranges[1], set(conf.MIDI_PITCH_RANGE))
+
+    def test_explicit_ranges(self):
+        tables = game.with_pitch_ranges(
+            [{'players': [], 'midi_pitch_range': range(36, 40)},
+             {'players': []}], range(36, 46))
+        self.assertEqual(list(tables[1]['midi_pitch_range']),
+                         list(range(40, 46)))
+        with self.assertRaises(ValueError):
+            game.with_pitch_ranges(
+                [{'players': [], 'midi_pitch_range': range(36, 40)},
+                 {'players': [], 'midi_pitch_range': range(39, 42)}])
+        # sharding keeps the ranges of all the tables apart
+        shards = game.shard_tables(
+            [{'players': players_conf(6001 + i)} for i in range(3)], 3)
+        pitches = [pitch for shard in shards for table in shard
+                   for pitch in table['midi_pitch_range']]
+        self.assertEqual(len(pitches), len(set(pitches)))
+
+
+class TestTableSettings(unittest.TestCase):
+    def test_single_table(self):
+        settings = game.table_settings(
+            {'players': players_conf(6001, 6002), 'prefix': '/a', 'id': 3,
+             'board_size': 6, 'ship_spec': [(2, 1)]})
+        manager = game.GameManager(engine='asyncio', **settings)
+        self.assertEqual((manager.game_id, manager.board_size), (3, 6))
+        self.assertEqual(manager.ship_spec, [(2, 1)])
+        self.assertEqual(manager.players[6001].client.topic_mapping['us'],
+                         ('/a/us/x', '/a/us/draw'))
+
+
+class TestShardTables(unittest.TestCase):
+    def test_shard_by_game_id(self):
+        tables = [{'players': players_conf(6001 + 2*i, 6002 + 2*i)}
+                  for i in range(5)]
+        shards = game.shard_tables(tables, 2)
+        self.assertEqual([[table['id'] for table in shard]
+                          for shard in shards], [[0, 2, 4], [1, 3]])
+
+    def test_shared_port_across_shards(self):
+        tables = [{'players': players_conf(6001, 6002), 'prefix': '/a'},
+                  {'players': players_conf(6001, 6002), 'prefix': '/b'}]
+        with self.assertRaises(ValueError):
+            game.shard_tables(tables, 2)
+        self.assertEqual(len(game.shard_tables(tables, 1)), 1)
+
+    def test_computer_players(self):
+        tables = [{'players': players_conf(6001) + [{'computer': True}]},
+                  {'players': players_conf(6002) + [{'computer': True}]}]
+        self.assertEqual(len(game.shard_tables(tables, 2)), 2)
+
+
+class TestSingleVisitor(unittest.TestCase):
+    def setUp(self):
+        self.manager = game.GameManager(
+            players_conf(6011) + [{'computer': True, 'seed': 1}],
+            engine='asyncio', ship_spec=[(2, 1), (1, 1)])
+        self.manager.game = self.manager.new_game()
+        self.visitor = self.manager.players[6011]
+        self.computer = self.manager.players['computer', 1]
+
+    def send(self, topic, params):
+        self.manager._handle_message((('127.0.0.1', 6011), topic, params))
+
+    def test_computer_is_ready_and_plays_back(self):
+        self.assertTrue(self.computer.isstate('ready'))
+        self.assertTrue(self.computer.board.isstate('complete'))
+        switches = [0] * 25
+        switches[0] = switches[1] = switches[3] = 1
+        self.send('us', switches)
+        self.send('ready', (1,))
+        self.assertTrue(self.manager.game.isstate('p1'))
+        # miss on the computer's board until it has taken its turn
+        def fired():
+            return sum(state in (board.MISS, board.HIT)
+                       for state in self.visitor.board.states)
+        for i in range(25):
+            if fired():
+                break
+            if self.computer.board.tiles[i].isstate('sea'):
+                self.send('them', [int(j == i) for j in range(25)])
+        self.assertGreater(fired(), 0)
+        if not self.manager.game.isstate('over'):
+            self.assertIs(self.manager.game.turn_player, self.visitor)
+
+    def test_auto_place(self):
+        self.send('auto', (1,))
+        self.assertTrue(self.visitor.board.isstate('complete'))
+        self.assertTrue(self.visitor.isstate('confirmation'))
+        self.send('ready', (1,))
+        self.assertTrue(self.manager.game.isstate('p1'))
+
+
+class TestInputCoalescing(unittest.TestCase):
+    def test_drag_handles_final_board(self):
+        manager = game.GameManager(
+            players_conf(6051) + [{'computer': True, 'seed': 1}],
+            engine='asyncio', ship_spec=[(2, 1), (1, 1)])
+        manager.game = manager.new_game()
+        visitor = manager.players[6051]
+        placed = []
+        place_tiles = visitor.board.place_tiles
+
+        def count_place_tiles(switches):
+            placed.append(switches)
+            place_tiles(switches)
+        visitor.board.place_tiles = count_place_tiles
+
+        async def drag():
+            for i in range(1, 10):
+                manager._handle_message_async(
+                    (('127.0.0.1', 6051), 'us',
+                     [int(j < 2 or j == 4) if i == 9 else int(j < i % 3)
+                      for j in range(25)]))
+            await asyncio.sleep(manager.inputs.window * 2)
+        asyncio.run(drag())
+        self.assertEqual(len(placed), 1)
+        self.assertTrue(visitor.board.isstate('complete'))
+        self.assertEqual(manager.inputs.stats()['coalesced'], 8)
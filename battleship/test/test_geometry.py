@@ -0,0 +1,137 @@
+import random
+import unittest
+from battleship import board, geometry
+from battleship import test
+
+
+class TestGrid(unittest.TestCase):
+    def test_square(self):
+        grid = geometry.grid(5)
+        self.assertIs(grid, geometry.grid(5, 5, 'square'))
+        self.assertEqual(grid.axes[0], ((-1, 1), (-1, 5)))
+        self.assertEqual(sorted(grid.neighbours[6]), [1, 5, 7, 11])
+        self.assertEqual(sorted(grid.corners[6]), [0, 2, 10, 12])
+        self.assertEqual(len(grid.lines(2)), 40)
+
+    def test_rectangle(self):
+        grid = geometry.grid(2, 4)
+        self.assertEqual(grid.size, 8)
+        self.assertEqual(sorted(grid.neighbours[3]), [2, 7])
+        self.assertEqual(len(grid.lines(3)), 4)
+
+    def test_torus(self):
+        grid = geometry.grid(5, kind='torus')
+        self.assertEqual(sorted(grid.neighbours[0]), [1, 4, 5, 20])
+        self.assertEqual(sorted(grid.corners[0]), [6, 9, 21, 24])
+        self.assertEqual(len(grid.lines(2)), 50)
+        # a ship around the whole torus would have no ends
+        self.assertEqual(grid.lines(5), ())
+
+    def test_hex(self):
+        grid = geometry.grid(5, kind='hex')
+        self.assertEqual(sorted(grid.neighbours[6]), [1, 2, 5, 7, 10, 11])
+        self.assertEqual(grid.corners[6], ())
+        self.assertIn((10, 6, 2), grid.lines(3))
+
+    def test_unknown_kind(self):
+        with self.assertRaises(ValueError):
+            geometry.grid(5, kind='cube')
+
+
+class TestShipRules(unittest.TestCase):
+    def test_lines(self):
+        rules = geometry.ship_rules(geometry.grid(5))
+        self.assertIs(rules, geometry.ship_rules(geometry.grid(5), 0, 1))
+        self.assertTrue(rules.simple)
+        self.assertTrue(rules.is_ship([7]))
+        self.assertTrue(rules.is_ship([5, 6, 7]))
+        self.assertTrue(rules.is_ship([2, 7, 12]))
+        self.assertFalse(rules.is_ship([5, 6, 11]))
+
+    def test_bent(self):
+        rules = geometry.ship_rules(geometry.grid(5), bent=True)
+        self.assertFalse(rules.simple)
+        self.assertTrue(rules.is_ship([5, 6, 11]))
+        self.assertTrue(rules.is_ship([0, 1, 2, 7, 12]))
+        # T, S and square shapes
+        self.assertFalse(rules.is_ship([0, 1, 2, 6]))
+        self.assertFalse(rules.is_ship([0, 1, 6, 7]))
+        self.assertFalse(rules.is_ship([0, 1, 5, 6]))
+
+    def test_ring(self):
+        rules = geometry.ship_rules(geometry.grid(3, kind='torus'))
+        self.assertTrue(rules.is_ship([0, 1]))
+        self.assertTrue(rules.is_ship([2, 0]))
+        self.assertFalse(rules.is_ship([0, 1, 2]))
+
+    def test_shape_cache_bounded(self):
+        rules = geometry.ShipRules(geometry.grid(20), bent=True)
+        for i in range(400):
+            for j in range(i + 1, 400):
+                rules.is_ship([i, j])
+        self.assertEqual(rules._legal.cache_info().currsize,
+                         geometry.SHAPE_CACHE_SIZE)
+        self.assertTrue(rules.is_ship([0, 1]))
+
+
+class TestBoardRules(test.BattleTest):
+    def board(self, spec, n=5, kind='square', **rules):
+        return board.Board(ship_spec=spec, rules=geometry.ship_rules(
+            geometry.grid(n, kind=kind), **rules))
+
+    def test_hex_axis(self):
+        hex_board = self.board([(3, 1)], kind='hex')
+        for i in (10, 6, 2):
+            self.assertTrue(hex_board.add(i))
+        self.assertTrue(hex_board.isstate('complete'))
+        self.assertEqual(hex_board.ship(6), (2, 6, 10))
+
+    def test_torus_wraps(self):
+        torus = self.board([(2, 1)], kind='torus')
+        self.assertTrue(torus.add(4))
+        self.assertTrue(torus.add(0))
+        self.assertTrue(torus.isstate('complete'))
+
+    def test_no_touching(self):
+        no_touching = self.board([(1, 2)], touching=False)
+        self.assertTrue(no_touching.add(0))
+        self.assertFalse(no_touching.add(6))
+        self.assertTrue(no_touching.add(2))
+
+    def test_bent_ships(self):
+        bent = self.board([(3, 1), (1, 1)], bent=True, touching=False)
+        for i in (5, 6, 11):
+            self.assertTrue(bent.add(i))
+        self.assertFalse(bent.add(12))
+        self.assertTrue(bent.add(3))
+        self.assertTrue(bent.isstate('complete'))
+        # the arms left would touch at a corner
+        self.assertFalse(bent.remove(6))
+        self.assertTrue(bent.remove(11))
+        self.assertEqual(bent.ship(5), (5, 6))
+
+    def test_sinking(self):
+        bent = self.board([(3, 1)], bent=True)
+        for i in (5, 6, 11):
+            bent.add(i)
+        for i in (5, 11):
+            bent.tiles[i].fire()
+        self.assertFalse(bent.is_sunk(6))
+        bent.tiles[6].fire()
+        self.assertTrue(bent.all_ships_destroyed())
+
+    def test_random_fleet(self):
+        for kind, rules in (('hex', {}), ('torus', {}),
+                            ('square', dict(touching=False))):
+            other = self.board([(3, 1), (2, 1), (1, 2)], n=6, kind=kind,
+                               **rules)
+            other.place_random_fleet(random.Random(0))
+            self.assertTrue(other.isstate('complete'), kind)
+
+    def test_rectangle(self):
+        wide = board.Board(ship_spec=[(2, 1)], rules=geometry.ship_rules(
+            geometry.grid(2, 4)))
+        self.assertEqual(len(wide.tiles), 8)
+        wide.place_fleet([(6, 7)])
+        self.assertEqual(str(wide).splitlines()[2], '| ~ ~ # # |')
+        self.assertEqual(len(wide.ui_vector('us')), 8)
@@ -0,0 +1,86 @@
+import queue
+import unittest
+from battleship import game, latency, osc
+from battleship.test import players_conf
+
+
+class TestHistogram(unittest.TestCase):
+    def test_percentiles(self):
+        histogram = latency.Histogram()
+        for i in range(1, 101):
+            histogram.add(i * 1e-4)
+        self.assertEqual(histogram.count, 100)
+        # within a bucket (2**.25) of the exact percentile
+        self.assertLessEqual(5e-3, histogram.percentile(50))
+        self.assertLess(histogram.percentile(50), 5e-3 * 2**.25)
+        self.assertLessEqual(9.9e-3, histogram.percentile(99))
+        self.assertEqual(histogram.max, 1e-2)
+        self.assertEqual(latency.Histogram().percentile(50), 0)
+
+
+class TestLatency(unittest.TestCase):
+    def tearDown(self):
+        latency.disable()
+        latency.reset()
+
+    def manager(self):
+        manager = game.GameManager(
+            players_conf(6021) + [{'computer': True, 'seed': 1}],
+            engine='asyncio', ship_spec=[(2, 1), (1, 1)])
+        manager.game = manager.new_game()
+        return manager
+
+    def test_disabled(self):
+        self.assertFalse(latency.is_enabled())
+        self.assertEqual(latency.stamp(), ())
+        latency.begin()
+        latency.mark('board')
+        self.assertEqual(latency.stats(), {})
+
+    def test_stages(self):
+        latency.enable()
+        manager = self.manager()
+        latency.begin()
+        manager._handle_message((('127.0.0.1', 6021), 'auto', (1,)))
+        stats = latency.stats()
+        for stage in ('handler_enter', 'board', 'handler_exit'):
+            self.assertEqual(stats[stage]['count'], 1)
+        # a board and lights sent, a loop started per deck
+        self.assertGreater(stats['osc_send']['count'], 1)
+        self.assertEqual(stats['midi']['count'], 3)
+        self.assertLessEqual(stats['midi']['p50'], stats['midi']['p99'])
+        self.assertLessEqual(stats['handler_enter']['max'],
+                             stats['handler_exit']['max'])
+
+    def test_server_stamps_messages(self):
+        latency.enable()
+        messages = queue.Queue()
+        server = osc.Server(('127.0.0.1', 6022), messages)
+        server._enqueue('/us/x', 'us', '/us/x', 1, 0)
+        server_address, topic, params, stamp = messages.get_nowait()
+        self.assertEqual((topic, params), ('us', (1, 0)))
+        self.assertIsInstance(stamp, float)
+
+    def test_timed_from_the_message_handled(self):
+        latency.enable()
+        manager = self.manager()
+        origins = []
+        manager._handle_message = lambda message: origins.append(
+            latency._origin)
+        # held and coalesced, each player's message with its own stamp
+        manager.inputs.put((('a', 1), 'us', (0,), 10.0))
+        manager.inputs.put((('b', 2), 'us', (0,), 11.0))
+        manager.inputs.put((('a', 1), 'us', (1,), 12.0))
+        manager.inputs.flush()
+        self.assertEqual(origins, [12.0, 11.0])
+
+    def test_nothing_timed_after_the_handler(self):
+        latency.enable()
+        manager = self.manager()
+        latency.begin()
+        manager._handle_message((('127.0.0.1', 6021), 'auto', (1,)))
+        counts = {stage: s['count'] for stage, s in latency.stats().items()}
+        # a timeout publishes the boards of a new game, not for a message
+        manager._timeout()
+        self.assertEqual({stage: s['count']
+                          for stage, s in latency.stats().items()}, counts)
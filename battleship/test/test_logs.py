@@ -0,0 +1,95 @@
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from battleship import logs
+
+
+def log_from_child(log_config):
+    logs.attach(log_config)
+    logging.getLogger('battleship.test_logs').info('from the child')
+
+
+class TestEvent(unittest.TestCase):
+    def setUp(self):
+        self.logger = logging.getLogger('battleship.test_log')
+        self.addCleanup(self.logger.setLevel, logging.NOTSET)
+
+    def test_sampled(self):
+        self.logger.setLevel(logging.DEBUG)
+        event = logs.Event(self.logger, 'test_rx', every=3)
+        with self.assertLogs(self.logger, logging.DEBUG) as logged:
+            for i in range(7):
+                event('message %i', i, port=i)
+        self.assertEqual([record.getMessage() for record in logged.records],
+                         ['message 2', 'message 5'])
+        record = logged.records[0]
+        self.assertEqual((record.event, record.fields, record.sampled),
+                         ('test_rx', {'port': 2}, 3))
+        self.assertEqual(record.funcName, 'test_sampled')
+
+    def test_debug_off(self):
+        self.logger.setLevel(logging.INFO)
+        event = logs.Event(self.logger, 'test_rx')
+        for i in range(5):
+            event('message %i', i)
+        self.assertEqual(event.count, 0)
+
+
+class TestConfigure(unittest.TestCase):
+    def setUp(self):
+        root = logging.getLogger()
+        self.addCleanup(root.setLevel, root.level)
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+            self.addCleanup(root.addHandler, handler)
+        self.addCleanup(logs.stop)
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, self.path)
+
+    def test_levels(self):
+        levels = {'battleship.test_log': 'WARNING'}
+        self.addCleanup(logging.getLogger('battleship.test_log').setLevel,
+                        logging.NOTSET)
+        logs.configure('DEBUG', levels, log_file=self.path)
+        logging.getLogger('battleship.test_log').info('dropped')
+        logging.getLogger('battleship.test_log').warning('kept')
+        logging.getLogger('battleship.other').debug('kept too')
+        logs.stop()
+        with open(self.path) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[0].endswith('kept'))
+
+    def test_structured(self):
+        logs.configure('DEBUG', {}, log_file=self.path, structured=True)
+        event = logs.Event(logging.getLogger('battleship.test_log'), 'tx')
+        event('sent %s', 'it', port=6051)
+        logs.stop()
+        with open(self.path) as f:
+            entry = json.loads(f.readline())
+        self.assertEqual(entry['message'], 'sent it')
+        self.assertEqual(entry['port'], 6051)
+        self.assertEqual(entry['func'], 'test_structured')
+
+    def test_spawned_children(self):
+        # as on macOS: nothing inherited, the child attaches to the queue
+        code = (
+            'import multiprocessing, sys\n'
+            'from battleship import logs\n'
+            'from battleship.test.test_logs import log_from_child\n'
+            'if __name__ == "__main__":\n'
+            '    multiprocessing.set_start_method("spawn")\n'
+            '    logs.configure("INFO", {}, log_file=sys.argv[1])\n'
+            '    process = multiprocessing.Process(\n'
+            '        target=log_from_child, args=(logs.child_config(),))\n'
+            '    process.start()\n'
+            '    process.join()\n')
+        subprocess.check_call([sys.executable, '-c', code, self.path],
+                              stderr=subprocess.DEVNULL)
+        with open(self.path) as f:
+            self.assertIn('from the child', f.read())
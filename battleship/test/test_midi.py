@@ -0,0 +1,95 @@
+import subprocess
+import sys
+import threading
+import unittest
+from battleship import midi
+
+
+class RecordingOut:
+    def __init__(self):
+        self.sent = []
+
+    def send_noteon(self, channel, pitch, velocity):
+        self.sent.append((channel, pitch, velocity))
+
+
+class TestCoalesce(unittest.TestCase):
+    def test_last_start_or_stop_wins(self):
+        batch = [(0, 40, 127), (2, 40, 127), (0, 41, 127), (0, 40, 127)]
+        self.assertEqual(midi.coalesce(batch), [(0, 41, 127), (0, 40, 127)])
+
+    def test_crush_kept_besides_stop(self):
+        batch = [(4, 40, 127), (2, 40, 127), (4, 40, 127)]
+        self.assertEqual(midi.coalesce(batch), batch)
+
+    def test_start_kept_before_crush(self):
+        # the crush toggles the playing loop, not a stopped one
+        batch = [(0, 40, 127), (4, 40, 127), (4, 40, 127), (2, 40, 127)]
+        self.assertEqual(midi.coalesce(batch), batch)
+
+    def test_consecutive_for_the_pitch(self):
+        batch = [(0, 40, 127), (0, 41, 127), (2, 40, 127), (4, 41, 127),
+                 (2, 41, 127), (0, 41, 127)]
+        self.assertEqual(midi.coalesce(batch),
+                         [(0, 41, 127), (2, 40, 127), (4, 41, 127),
+                          (0, 41, 127)])
+
+
+class TestSender(unittest.TestCase):
+    def test_send_and_flush(self):
+        out = RecordingOut()
+        sender = midi.Sender(out)
+        # queued before the thread runs, so it all lands in one batch
+        for pitch in range(36, 58):
+            sender.put(0, pitch, 127)
+            sender.put(2, pitch, 127)
+        sender.start()
+        self.assertTrue(sender.flush(timeout=1))
+        self.assertEqual(sorted(out.sent),
+                         [(2, pitch, 127) for pitch in range(36, 58)])
+
+    def test_flush_after_puts_from_threads(self):
+        out = RecordingOut()
+        sender = midi.Sender(out, batch_size=7)
+        sender.start()
+
+        def put(channel):
+            for pitch in range(36, 58):
+                sender.put(channel, pitch, 127)
+        threads = [threading.Thread(target=put, args=(channel,))
+                   for channel in (4, 5, 6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertTrue(sender.flush(timeout=1))
+        self.assertEqual(len(out.sent), 3 * 22)
+
+
+class TestBackends(unittest.TestCase):
+    def tearDown(self):
+        midi.set_backend('null')
+
+    def test_recording_backend(self):
+        recording = midi.set_backend('recording')
+        midi.start(40)
+        midi.crush(40)
+        midi.sender().flush(timeout=1)
+        self.assertEqual([event[1:] for event in recording.events],
+                         [(0, 40, 127), (4, 40, 127)])
+        self.assertLessEqual(recording.events[0][0], recording.events[1][0])
+
+    def test_import_opens_nothing(self):
+        code = ('import sys, battleship.board; '
+                'sys.exit("rtmidi2" in sys.modules)')
+        self.assertEqual(subprocess.call([sys.executable, '-c', code]), 0)
+
+    def test_flush_at_exit(self):
+        # a daemon sender would be killed with the stops still queued
+        code = ('import atexit, battleship.midi as midi; '
+                'out = midi.set_backend("recording"); '
+                'atexit.register(lambda: print(len(out.events))); '
+                'midi.sender().pacing = 0.01; '
+                '[midi.stop(pitch) for pitch in range(36, 58)]')
+        output = subprocess.check_output([sys.executable, '-c', code])
+        self.assertEqual(output.strip(), b'22')
@@ -1,6 +1,8 @@
+import asyncio
 import unittest
 import multiprocessing
 import time
+from pythonosc import osc_message
 from battleship import board, osc
 
 
@@ -39,3 +41,123 @@ class TestServerClient(unittest.TestCase):
     @classmethod
     def tearDownClass(cls):
         cls.server.terminate()
+
+
+class RecordingClient(osc.Client):
+    """Keeps the sent datagrams instead of putting them on the wire."""
+    def send(self, msg):
+        self.sent.append(osc_message.OscMessage(bytes(msg.dgram)))
+
+
+class TestDeltaBoards(unittest.TestCase):
+    def setUp(self):
+        self.client = RecordingClient('localhost', 5005, delta=True)
+        self.client.sent = []
+        self.board = board.Board(n=5, ship_spec=[(1, 2)])
+
+    def test_full_then_cells(self):
+        self.client.send_board(self.board, 'us')
+        self.assertEqual(self.client.sent[-1].address, '/us/draw')
+        self.assertEqual(len(self.client.sent[-1].params), 25)
+        # nothing changed, nothing sent
+        self.assertIsNone(self.client.send_board(self.board, 'us'))
+        self.board.add(7)
+        self.client.send_board(self.board, 'us')
+        self.assertEqual(self.client.sent[-1].address, '/us/cells')
+        self.assertEqual(self.client.sent[-1].params, [7, 1])
+
+    def test_resync(self):
+        self.client.send_board(self.board, 'them')
+        self.client.resync()
+        self.client.send_board(self.board, 'them')
+        self.assertEqual(len(self.client.sent), 2)
+        self.assertEqual(len(self.client.sent[-1].params), 25)
+
+
+class TestMessageTemplate(unittest.TestCase):
+    def test_matches_message_builder(self):
+        client = RecordingClient('localhost', 5005)
+        client.sent = []
+        client.turn_led(on=False)
+        mb = client.message_builder('turn_light')
+        mb.add_arg(-2)
+        self.assertEqual(client.sent[-1].dgram, mb.build().dgram)
+
+    def test_reuses_buffer(self):
+        template = osc.MessageTemplate('/us/draw', 3)
+        dgram = template.pack(1, 2, 3).dgram
+        self.assertIs(template.pack(3, 2, 1).dgram, dgram)
+        self.assertEqual(osc_message.OscMessage(bytes(dgram)).params,
+                         [3, 2, 1])
+
+
+class TestAsyncServer(unittest.TestCase):
+    server_address = ('127.0.0.1', 5007)
+
+    def test_send_receive_through_handler(self):
+        topic_mapping = dict(us=('/test/address/', '/test/address/'))
+        client = osc.Client(*self.server_address, topic_mapping)
+
+        async def receive():
+            received = asyncio.Queue()
+            server = await osc.AsyncServer.create(
+                self.server_address, received.put_nowait,
+                topic_mapping=topic_mapping)
+            try:
+                sent_msg = client.template('us', 2).pack(46, 2)
+                client.send(sent_msg)
+                message = await asyncio.wait_for(received.get(), 1)
+            finally:
+                server.close()
+            return message, tuple(sent_msg.params)
+
+        message, params = asyncio.run(receive())
+        self.assertEqual(message, (self.server_address, 'us', params))
+
+
+class TestInputStage(unittest.TestCase):
+    def setUp(self):
+        self.now = 0
+        self.handled = []
+        self.stage = osc.InputStage(self.handled.append, window=0.02,
+                                    topics=('us',),
+                                    clock=lambda: self.now)
+
+    def test_coalesces_bursts(self):
+        for i in range(5):
+            self.stage.put((('a', 1), 'us', (i,)))
+        self.stage.put((('b', 2), 'us', (9,)))
+        self.assertEqual(self.handled, [])
+        self.assertEqual(self.stage.next_due(), 0.02)
+        self.now = 0.01
+        self.stage.put((('a', 1), 'us', (5,)))
+        self.stage.flush_due()
+        self.assertEqual(self.handled, [])
+        self.now = 0.02
+        self.stage.flush_due()
+        self.assertEqual(self.handled, [(('a', 1), 'us', (5,)),
+                                        (('b', 2), 'us', (9,))])
+        self.assertIsNone(self.stage.next_due())
+        stats = self.stage.stats()
+        self.assertEqual((stats['received'], stats['handled'],
+                          stats['coalesced']), (7, 2, 5))
+
+    def test_other_topics_keep_order(self):
+        self.stage.put((('a', 1), 'us', (1,)))
+        self.stage.put((('a', 1), 'us', (2,)))
+        self.stage.put((('a', 1), 'ready', (1,)))
+        self.assertEqual(self.handled, [(('a', 1), 'us', (2,)),
+                                        (('a', 1), 'ready', (1,))])
+
+    def test_no_window(self):
+        self.stage.window = 0
+        for i in range(3):
+            self.stage.put((('a', 1), 'us', (i,)))
+        self.assertEqual(len(self.handled), 3)
+        self.assertIsNone(self.stage.next_due())
+
+    def test_queue_depth(self):
+        for depth in (3, 7, 1):
+            self.stage.observe_queue(depth)
+        self.assertEqual(self.stage.stats()['queue_depth'], 1)
+        self.assertEqual(self.stage.stats()['max_queue_depth'], 7)
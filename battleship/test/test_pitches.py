@@ -0,0 +1,94 @@
+import unittest
+from battleship import bitboard, board, pitches
+
+
+class TestPitchPool(unittest.TestCase):
+    def test_split(self):
+        self.assertEqual(pitches.split(range(10), {1: 1, 2: 2, 3: 2}),
+                         {1: [0, 1], 2: [2, 3, 4, 5], 3: [6, 7, 8, 9]})
+
+    def test_lru(self):
+        pool = pitches.PitchPool(range(36, 40), policy='lru')
+        self.assertEqual([pool.take(None, i) for i in range(3)],
+                         [36, 37, 38])
+        pool.free(36)
+        # the pitch freed last is taken last
+        self.assertEqual(pool.take(None, 3), 39)
+        self.assertEqual(pool.take(None, 4), 36)
+        self.assertEqual(len(pool), 0)
+        self.assertEqual(pool.occupancy(), 1.0)
+
+    def test_players(self):
+        pool = pitches.PitchPool(range(36, 42), policy='player')
+        first, second = object(), object()
+        pool.join(first)
+        pool.join(second)
+        self.assertEqual(pool.take(second, 0), 39)
+        self.assertEqual([pool.take(first, i) for i in range(4)],
+                         [36, 37, 38, 40])
+        self.assertEqual(pool.stats()['borrowed'], 1)
+        # back to the range it belongs to
+        pool.free(40)
+        self.assertEqual(pool.free_pitches(), {0: [], 1: [41, 40]})
+
+    def test_ship_groups(self):
+        pool = pitches.PitchPool(range(36, 46), policy='ship',
+                                 ship_spec=[(3, 2), (2, 1), (1, 2)])
+        self.assertEqual(pool.free_pitches(),
+                         {1: [36, 37], 2: [38, 39], 3: [40, 41, 42, 43, 44,
+                                                        45]})
+        self.assertEqual(pool.take(None, 0, size=3), 40)
+        self.assertEqual(pool.take(None, 1, size=1), 36)
+
+    def test_claim(self):
+        pool = pitches.PitchPool(range(36, 40))
+        pool.claim(38, None, 0)
+        with self.assertRaises(ValueError):
+            pool.claim(38, None, 1)
+        with self.assertRaises(ValueError):
+            pool.claim(60, None, 1)
+        self.assertEqual(pool.free_pitches(), {None: [36, 37, 39]})
+
+
+class TestVoiceStealing(unittest.TestCase):
+    def test_longest_playing_loop_is_taken_over(self):
+        pool = pitches.PitchPool(range(36, 38))
+        plyr_board = board.Board(n=5, ship_spec=[(1, 3)], pitch_pool=pool)
+        for i in (0, 2):
+            plyr_board.add(i)
+        plyr_board.tiles[0].fire()
+        plyr_board.add(4)
+        self.assertEqual(plyr_board.tiles[4].midi_pitch, 36)
+        self.assertIsNone(plyr_board.tiles[0].midi_pitch)
+        self.assertEqual(pool.stats()['stolen'], 1)
+        # freed pitches are given out before playing ones are taken over
+        plyr_board.remove(2)
+        plyr_board.add(2)
+        self.assertEqual(plyr_board.tiles[2].midi_pitch, 37)
+        self.assertEqual(pool.stats()['peak'], 2)
+
+
+class TestShipGroups(unittest.TestCase):
+    spec = [(1, 2), (2, 1), (3, 1), (4, 1)]
+
+    def groups(self, board_core):
+        pool = pitches.PitchPool(range(36, 56), policy='ship',
+                                 ship_spec=self.spec)
+        plyr_board = board_core(n=5, ship_spec=self.spec, pitch_pool=pool)
+        groups = {pitch: size for size, free in pool.free_pitches().items()
+                  for pitch in free}
+        return plyr_board, groups
+
+    def test_tile_by_tile(self):
+        for board_core in (board.Board, bitboard.BitBoard):
+            plyr_board, groups = self.groups(board_core)
+            for i in range(4):
+                plyr_board.add(i)
+            self.assertEqual(
+                [groups[plyr_board.tiles[i].midi_pitch] for i in range(4)],
+                [4, 4, 4, 4], board_core)
+            # split into a 1 and a 2-deck ship
+            plyr_board.remove(1)
+            self.assertEqual(
+                [groups[plyr_board.tiles[i].midi_pitch] for i in (0, 2, 3)],
+                [1, 2, 2], board_core)
@@ -0,0 +1,96 @@
+import pickle
+import struct
+import time
+import unittest
+from battleship import board, game, sharedstate
+from battleship.test import players_conf
+
+
+class TestSharedState(unittest.TestCase):
+    def setUp(self):
+        self.manager = game.GameManager(players_conf(6051, 6052),
+                                       engine='asyncio')
+        self.manager.game = self.manager.new_game()
+        self.shared = sharedstate.SharedState((6051, 6052), 5)
+        # the servers attach to the block by name
+        self.servers = {port: pickle.loads(pickle.dumps(self.shared))
+                        for port in (6051, 6052)}
+        self.handled = {6051: 0, 6052: 0}
+
+    def tearDown(self):
+        for server in self.servers.values():
+            server.close()
+        self.shared.close()
+
+    def publish(self):
+        self.shared.publish(self.manager, self.handled)
+
+    def admit(self, port, topic, params):
+        admitted = self.servers[port].admit(port, topic, params)
+        if admitted:
+            self.handled[port] += 1
+        return admitted
+
+    def fire(self, i):
+        return [int(j == i) for j in range(25)]
+
+    def play(self, turn_port):
+        self.manager.game.current = 'p1'
+        self.manager.game.turn_player = self.manager.players[turn_port]
+
+    def test_read(self):
+        self.manager.players[6052].board.add(7)
+        self.publish()
+        state, turn, players = self.servers[6051].read()
+        self.assertEqual((state, turn), ('setup', 0))
+        self.assertEqual(players[6051], ('setup', bytes(25)))
+        self.assertEqual(players[6052][1][7], board.DECK)
+
+    def test_fire_out_of_turn(self):
+        self.play(6051)
+        self.publish()
+        self.assertFalse(self.admit(6052, 'them', self.fire(3)))
+        self.assertTrue(self.admit(6051, 'them', self.fire(3)))
+        # other topics are left to the game
+        self.assertTrue(self.admit(6052, 'ready', (1,)))
+
+    def test_fire_at_fired_tiles(self):
+        self.play(6051)
+        self.manager.players[6052].board.tiles[3].fire()
+        self.publish()
+        self.assertFalse(self.admit(6051, 'them', self.fire(3)))
+        self.assertTrue(self.admit(6051, 'them', self.fire(4)))
+        self.assertEqual(self.servers[6051].them_vector(6051)[3], 2)
+
+    def test_waits_for_the_game(self):
+        self.play(6051)
+        self.publish()
+        # queued, but not handled yet: may give 6052 the turn
+        self.servers[6051].admit(6051, 'them', self.fire(3))
+        self.assertTrue(self.admit(6052, 'them', self.fire(3)))
+        self.handled[6051] += 1
+        self.publish()
+        # a message of the player's own that isn't fire
+        self.admit(6052, 'ready', (0,))
+        self.handled[6052] -= 1
+        self.publish()
+        self.assertTrue(self.admit(6052, 'them', self.fire(3)))
+        self.handled[6052] += 1
+        self.publish()
+        self.assertFalse(self.admit(6052, 'them', self.fire(3)))
+
+    def test_game_over(self):
+        self.manager.game.stop()
+        self.manager.last_game_ended = time.time()
+        self.publish()
+        self.assertFalse(self.admit(6051, 'us', [0] * 25))
+        self.manager.last_game_ended -= 100
+        self.publish()
+        self.assertTrue(self.admit(6051, 'us', [0] * 25))
+
+    def test_write_in_progress(self):
+        self.play(6051)
+        self.publish()
+        struct.pack_into('<I', self.shared.buf, 0, 1)
+        self.assertIsNone(self.servers[6052].read())
+        self.assertTrue(self.admit(6052, 'them', self.fire(3)))
@@ -0,0 +1,47 @@
+import random
+import unittest
+from battleship import board, sim
+
+
+class TestPlacement(unittest.TestCase):
+    def test_random_placement_completes_board(self):
+        rng = random.Random(0)
+        spec = [(4, 1), (3, 1), (2, 1), (1, 2)]
+        for _ in range(20):
+            plyr_board = board.Board(n=5, ship_spec=spec)
+            sim.RandomPlacement(5, spec, rng).place(plyr_board)
+            self.assertTrue(plyr_board.isstate('complete'))
+
+    def test_random_layout(self):
+        spec = [(4, 1), (3, 1), (2, 1), (1, 2)]
+        layout = sim.RandomPlacement(5, spec, random.Random(0)).layout()
+        self.assertEqual(sorted(len(ship) for ship in layout),
+                         sim.fleet_sizes(spec)[::-1])
+        plyr_board = board.Board(n=5, ship_spec=spec)
+        plyr_board.place_fleet(layout)
+        self.assertTrue(plyr_board.isstate('complete'))
+
+
+class TestPlay(unittest.TestCase):
+    def test_shooters_finish_games(self):
+        rng = random.Random(0)
+        for shooter in sim.SHOOTERS:
+            winner, shots = sim.play(shooter=shooter, rng=rng)
+            self.assertIn(winner, (0, 1))
+            # the winner needs at least one shot per deck
+            self.assertGreaterEqual(shots[winner], 11)
+            self.assertLessEqual(max(shots), 25)
+
+    def test_simulate_stats(self):
+        stats = sim.simulate(20, seed=1, chunk_size=7, shooter='hunt')
+        self.assertEqual(stats['games'], 20)
+        self.assertLessEqual(stats['shots_min'], stats['shots_p50'])
+        self.assertLessEqual(stats['shots_p50'], stats['shots_max'])
+        # seeded runs are reproducible
+        again = sim.simulate(20, seed=1, chunk_size=7, shooter='hunt')
+        self.assertEqual(stats['shots_mean'], again['shots_mean'])
+
+    def test_board_cores_play_alike(self):
+        games = [sim.play(board_core=board_core, rng=random.Random(3))
+                 for board_core in sim.BOARDS]
+        self.assertEqual(games[0], games[1])
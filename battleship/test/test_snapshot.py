@@ -0,0 +1,141 @@
+import os
+import tempfile
+import time
+import unittest
+from battleship import board, game, midi, pitches, snapshot
+from battleship.test import FLEET, players_conf
+
+TABLE = players_conf(6041) + [{'computer': True, 'seed': 3}]
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), 'table.snap')
+        self.managers = []
+
+    def tearDown(self):
+        # snapshots are written in the background
+        for manager in self.managers:
+            manager.snapshots.flush(1)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        os.rmdir(os.path.dirname(self.path))
+        midi.set_backend('null')
+
+    def manager(self):
+        manager = game.GameManager(TABLE, engine='asyncio',
+                                   snapshot_path=self.path)
+        self.managers.append(manager)
+        return manager
+
+    def send(self, manager, topic, params):
+        manager._handle_message((('127.0.0.1', 6041), topic, params))
+
+    def test_restore_mid_game(self):
+        manager = self.manager()
+        manager.resume()
+        self.send(manager, 'us', [int(i in FLEET) for i in range(25)])
+        self.send(manager, 'ready', (1,))
+        for i in range(6):
+            if manager.game.turn_player is manager.players[6041]:
+                self.send(manager, 'them', [int(j == i) for j in range(25)])
+        self.assertIn(manager.game.current, ('p1', 'p2'))
+        self.assertTrue(manager.snapshots.flush(1))
+        self.assertLess(os.path.getsize(self.path), 150)
+
+        recording = midi.set_backend('recording')
+        restored = self.manager()
+        restored.resume()
+        self.assertEqual(restored.game.current, manager.game.current)
+        self.assertIs(restored.game.turn_player,
+                      restored.players[6041] if manager.game.turn_player
+                      is manager.players[6041] else
+                      restored.players['computer', 1])
+        for key, player in manager.players.items():
+            again = restored.players[key]
+            self.assertEqual(again.current, player.current)
+            self.assertEqual(again.board.states, player.board.states)
+            self.assertEqual(again.board.current, player.board.current)
+            self.assertEqual(again.board.all_ships_destroyed(),
+                             player.board.all_ships_destroyed())
+            self.assertEqual(again.board.ship_tracker.tally(),
+                             player.board.ship_tracker.tally())
+        # loops of all the decks run again, with no pitch given out twice
+        pitches = [p for player in restored.players.values()
+                   for p in player.board._pitches if p]
+        self.assertEqual(len(pitches), 22)
+        self.assertEqual(len(set(pitches)), 22)
+        midi.sender().flush(1)
+        started = {pitch for _, channel, pitch, _ in recording.events
+                   if channel == midi.conf.MIDI_CHANNELS['start']}
+        self.assertTrue(set(pitches) <= started)
+        # and the restored game plays on
+        board_before = restored.players['computer', 1].board.states
+        for i in range(25):
+            if restored.game.turn_player is restored.players[6041] and \
+                    restored.players['computer', 1].board.tiles[i].can(
+                        'fire'):
+                self.send(restored, 'them',
+                          [int(j == i) for j in range(25)])
+                break
+        self.assertNotEqual(
+            restored.players['computer', 1].board.states, board_before)
+
+    def test_only_changes_are_written(self):
+        manager = self.manager()
+        manager.resume()
+        snapshots = manager.snapshots
+        self.assertTrue(snapshots.save(manager))
+        self.assertFalse(snapshots.save(manager))
+        snapshots.flush(1)
+        self.assertTrue(os.path.exists(self.path))
+        manager.game.stop()
+        snapshots.save(manager)
+        snapshots.flush(1)
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_written_in_the_background(self):
+        manager = self.manager()
+        manager.resume()
+        snapshots = manager.snapshots
+        snapshots.interval = 60
+        self.send(manager, 'us', [int(i in FLEET[:4]) for i in range(25)])
+        first = snapshot.dumps(manager)
+        # the first change is written right away
+        for _ in range(100):
+            if os.path.exists(self.path):
+                break
+            time.sleep(.01)
+        # later ones wait for the interval, or a flush
+        for i in FLEET[4:7]:
+            manager.players[6041].board.add(i)
+            snapshots.save(manager)
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(), first)
+        self.assertTrue(snapshots.flush(1))
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(), snapshot.dumps(manager))
+
+    def test_bad_snapshot_starts_new_game(self):
+        with open(self.path, 'wb') as f:
+            f.write(snapshot.MAGIC + b'\0')
+        manager = self.manager()
+        manager.resume()
+        self.assertTrue(manager.game.isstate('setup'))
+        self.assertTrue(manager.players[6041].board.isstate('empty'))
+
+    def test_board_recover(self):
+        plyr_board = board.Board(n=5,
+                                 pitch_pool=pitches.PitchPool(range(36, 58)))
+        for i in FLEET:
+            plyr_board.add(i)
+        plyr_board.tiles[14].fire()
+        plyr_board.tiles[19].fire()
+        plyr_board.tiles[4].fire()
+        again = board.Board(n=5, pitch_pool=pitches.PitchPool(range(36, 58)))
+        again.recover(plyr_board.states, bytes(plyr_board._pitches))
+        self.assertEqual(again.states, plyr_board.states)
+        self.assertTrue(again.is_sunk(14))
+        self.assertEqual(sorted(again.pitch_pool.free_pitches()[None]),
+                         sorted(plyr_board.pitch_pool.free_pitches()[None]))
+        self.assertTrue(again.isstate('complete'))
@@ -9,11 +9,13 @@ setup(name='battleship',
       include_package_data=True,
       install_requires=[
           'fysom',
-          'bintrees',
           'rtmidi2',
       ],
+      extras_require={'ai': ['numpy']},
       test_suite='battleship.test',
       zip_safe=False,
       entry_points={'console_scripts': [
-          'battleship = battleship.game:run'
+          'battleship = battleship.game:run',
+          'battleship-sim = battleship.sim:main',
+          'battleship-bench = battleship.bench:main',
       ]})